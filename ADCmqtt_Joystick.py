@@ -97,8 +97,7 @@ if __name__ == "__main__":  # Did not follow main() structure because ISR was mi
         pass 
 
     def on_disconnect(client, userdata,rc=0):
-        logging.debug("DisConnected result code "+str(rc))
-        mqtt_client.loop_stop()
+        logging.debug("DisConnected result code "+str(rc))   # loop_start thread keeps running and reconnects
 
     def get_login_info(file):
         ''' Import mqtt and wifi info. Remove if hard coding in python file '''
@@ -121,6 +120,7 @@ if __name__ == "__main__":  # Did not follow main() structure because ISR was mi
     GPIO.setup(jsbutton, GPIO.IN, pull_up_down=GPIO.PUD_UP) 
     GPIO.add_event_detect(jsbutton, GPIO.BOTH, callback=button_callback)
     #adc = adc.ads1115(1, 5, 0.003, 1, 0x48) # numOfChannels, vref, noiseThreshold (V), maxInterval, address
+    clock = adc.ticker(0.02) # read the joystick at 50Hz, sleeping between reads
     adc = adc.mcp3008(2, 5, 400, 5, 8) # numOfChannels, vref, noiseThreshold (raw ADC), maxInterval, and ChipSelect GPIO pin (7 or 8)
 
     #=======   MQTT SETUP ==============#
@@ -159,7 +159,7 @@ if __name__ == "__main__":  # Did not follow main() structure because ISR was mi
     # MQTT setup is successful. Initialize dictionaries and start the main loop.
     outgoingD, incomingD = {}, {}
     newmsg = True
-    while True:
+    for tick in clock:
         voltage = adc.getdata() # returns a dict with the voltage for each pin that was passed in ads1115
         if buttonpressed or voltage is not None:
             if voltage is not None:
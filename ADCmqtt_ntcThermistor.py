@@ -53,7 +53,7 @@ Check Hardware and MQTT setup sections for pin assignments and topics
 
 '''
 
-import sys, json, logging, re, math
+import sys, json, logging, re
 from time import sleep
 import paho.mqtt.client as mqtt
 from os import path
@@ -122,6 +122,8 @@ if __name__ == "__main__":
                 mqtt_dummy1 = incomingD
             elif incomingID[2] == 'group2B':
                 mqtt_dummy2 = incomingD
+            elif incomingID[2] == 'burst':   # nred2pi/adcZCMD/burst {"samples": 10000, "device": "ads1115"}
+                bursts.request(msg.payload, list(adcSet))
         # Debugging. Will print the JSON incoming payload and unpack it
         logging.debug("Topic grp0:{0} grp1:{1} grp2:{2}".format(msgmatch.group(0), msgmatch.group(1), msgmatch.group(2)))
         #incomingD = json.loads(str(msg.payload.decode("utf-8", "ignore")))
@@ -146,14 +148,14 @@ if __name__ == "__main__":
         pass 
 
     def on_disconnect(client, userdata,rc=0):
-        logging.debug("DisConnected result code "+str(rc))
-        mqtt_client.loop_stop()
+        logging.debug("DisConnected result code "+str(rc))   # loop_start thread keeps running and reconnects
 
     #==== HARDWARE SETUP ===============# 
     # 
     adcSet = {}  # Can comment out any ADC type not being used
     adcSet['ads1115'] = adc.ads1115(1, 0.003, 1, 1, 0x48) # numOfChannels, noiseThreshold (V), max interval, gain=1 (+/-4.1V readings), address
     #adcSet['mcp3008'] = adc.mcp3008(2, 3.3, 400, 1, 8) # numOfChannels, vref, noiseThreshold (raw ADC), maxInterval = 1sec, and ChipSelect GPIO pin (7 or 8)
+    bursts = adc.burstCapture(path.join(path.dirname(path.abspath(__file__)), 'bursts')) # Raw waveform capture requested on nred2pi/adcZCMD/burst (needs numpy, rejected without it)
     
     #=======   MQTT SETUP ==============#    
     home = str(Path.home())                       # Import mqtt and wifi info. Remove if hard coding in python script
@@ -199,32 +201,26 @@ if __name__ == "__main__":
     #==== MAIN LOOP ====================#
     # MQTT setup is successful. Initialize dictionaries and start the main loop.
 
-    def ntc(voltage, R1=10000, Vcc=3.3, Bc=3950, Tnom=23, Rntc=10000):
-        R1 = 10040
-        Vcc = 3.34
-        Bc = 3950
-        Tnom = 23
-        Rntc = 9500
-
-        R2=voltage*R1/(Vcc-voltage)
-        steinhart = R2 / Rntc
-        steinhart = math.log(steinhart)
-        steinhart /= Bc
-        steinhart += 1 / (Tnom + 273.15)
-        steinhart = 1 / steinhart
-        steinhart -= 273.15
-        return "{:.1f}".format(steinhart)
-        
+    # Thermistor table is built once, each reading is then a table lookup (see adc/Mthermistor.py)
+    ntc = adc.thermistor(R0=9500, T0=23, beta=3950, R1=10040, Vcc=3.34)   # Rntc at Tnom, beta, divider resistor and supply
+    ntcTable = {model: adc.thermistorTable([ntc] * device.numOfChannels, device.rawScale, 32767 if device.rawType == 'int16' else 65535) for model, device in adcSet.items()}
+
     outgoingD = {}
     try:
         while True:
-            for model, adc in adcSet.items():
-                voltage = adc.getValue() # returns a list with the voltage for each pin that was passed in ads1115
+            for model, device in adcSet.items():
+                voltage = device.getdata() # returns a dictionary with the voltage for each channel
                 if voltage is not None:
-                    #steinhart = ntc(float(voltage["a0f"]), 10040, 3.34, 3950, 23, 9500)    # Could also send Voltage and do steinhart calc in node-red
+                    keys = list(voltage)
+                    temps = ntcTable[model].fromVolts([voltage[key] for key in keys])   # Could also send Voltage only and do the steinhart calc in node-red
+                    outgoingD = dict(voltage)
+                    for key, temp in zip(keys, temps):
+                        outgoingD['t' + key[1:]] = None if temp != temp else round(float(temp), 2)   # a0f -> t0f in C, None if open/shorted
                     MQTT_PUB_TOPIC1 = model.join(MQTT_PUB_TOPIC)
-                    mqtt_client.publish(MQTT_PUB_TOPIC1, json.dumps(voltage))  # publish voltage values
+                    mqtt_client.publish(MQTT_PUB_TOPIC1, json.dumps(outgoingD))  # publish voltage and temperature values
                     sleep(0.05)
+            for model, info in bursts.run(adcSet):   # Burst captures requested over mqtt, saved to bursts/*.npy
+                mqtt_client.publish('pi2nred/' + model + '/burst', json.dumps(info))
     except KeyboardInterrupt:
         logging.info("Pressed ctrl-C")
     finally:
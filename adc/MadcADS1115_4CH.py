@@ -26,18 +26,51 @@ Change the address by connecting the ADDR pin to one of the following
 0x4A (1001010) ADR -> SDA
 0x4B (1001011) ADR -> SCL
 Then update the address when creating the ads object in the HARDWARE section
+Every ads1115 on the same bus shares one I2C bus object. To read several boards as one 16 channel device
+use ads1115Group (MbusManager.py) which overlaps the conversions across the chips.
 
+rate - Optional continuous acquisition. A sampler thread reads one frame (all channels) at rate Hz into a ring
+       buffer of bufferSize frames. getdata() then averages the latest frames from the buffer instead of
+       waiting on the bus, and snapshot()/window(n) return the timestamped frames. stop() ends the thread.
+       Note each single-shot conversion takes ~1/data rate, so rate is limited by channels x conversion time.
+changeSet - Optional per channel mode. noiseThreshold and maxInterval can be a list (one per channel).
+            getdata() returns only the channels that changed by more than their threshold or whose
+            maxInterval is due, instead of every channel when any one changes
+numOfSamples - Samples read per channel on each getdata() (default 10)
+autoThreshold - Optional noiseFloor (see MnoiseFloor.py). Estimates each channel's noise and sets its threshold
+                (with hysteresis) automatically, noiseThreshold is only used until it has calibrated
+filters - Optional {channel: filterChain} (see Mfilters.py). Each sample of that channel is fed through
+          the chain and its output is used instead of the numOfSamples average (ie fast EMA on a joystick,
+          heavy decimation on a thermistor). In continuous mode the chain sees the latest numOfSamples frames
+          on every call, so set numOfSamples to the number of frames expected between calls
+backend - 'adafruit' (default) or 'sim' for a simulated bus, no hardware needed.
+          Pass sim=simADS1115(waveforms, gain, datarate) (see Msimulate.py)
+continuous - Optional continuous-conversion mode. The chip converts back to back at datarate (8-860 SPS,
+             default 860) and a sampler thread streams each conversion into the ring buffer (rate/bufferSize above)
+             paced by the ALERT/RDY pin (rdyPin=GPIO number) or by polling if rdyPin is not set. See MadsContinuous.py
+datarate - Optional data rate (SPS) for single-shot or continuous mode
+useNumpy - Optional. Keeps raw samples in a preallocated (channels x samples) numpy array and does the
+           averaging, raw to volt conversion and threshold check as vectorized operations
+calibration - Optional calibration (see Mcalibration.py). Per channel offset/gain/linearity corrections from
+              a file, applied to the volts returned by getdata()
 '''
 
-import busio, board, logging
+import logging, sys
 from time import time, sleep
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
+from .MringBuffer import ringBuffer, sampler
+from .MadsContinuous import adsContinuous, DR_BITS
+from .MbusManager import sharedI2C
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PGA_RANGE = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}  # gain: full scale +/- V
 
 class ads1115:
     ''' ADC using ADS1115 (I2C). Returns a list with voltge values '''
     
-    def __init__(self, numOfChannels=1, noiseThreshold=0.001, maxInterval=1, usergain=1, useraddress=0x48, logger=None):
+    def __init__(self, numOfChannels=1, noiseThreshold=0.001, maxInterval=1, usergain=1, useraddress=0x48, logger=None, useNumpy=False, rate=0, bufferSize=1000, numOfSamples=10, filters=None, changeSet=False, backend='adafruit', sim=None, datarate=None, continuous=False, rdyPin=None, autoThreshold=None, calibration=None):
         ''' Create I2C bus and initialize lists '''
         
         if logger is not None:                        # Use logger passed as argument
@@ -47,16 +80,39 @@ class ads1115:
             self.logger = logging.getLogger(__name__)    # Create from root logger
         else:                                          # Root logger already exists and no custom logger passed
             self.logger = logging.getLogger(__name__)    # Create from root logger
-        self.logger.info("ADS1115 using I2C at address {0}".format(str(useraddress)))
-        i2c = busio.I2C(board.SCL, board.SDA)  # Create the I2C bus
-        ads = ADS.ADS1115(i2c, gain=usergain, address=useraddress)   # Create the ADC object using the I2C bus
+        if useNumpy and np is None:
+            self.logger.error("useNumpy requires numpy (pip3 install numpy)")
+            sys.exit()
+        if (rate or continuous) and bufferSize <= numOfSamples:
+            self.logger.error("bufferSize ({0}) must be larger than numOfSamples ({1})".format(bufferSize, numOfSamples))
+            sys.exit()
         self.numOfChannels = numOfChannels
-        self.chan = [AnalogIn(ads, ADS.P0), # create analog input channel on pins
-                     AnalogIn(ads, ADS.P1),
-                     AnalogIn(ads, ADS.P2),
-                     AnalogIn(ads, ADS.P3)]
+        self.gain = usergain
+        self.bus = 'i2c1'   # physical bus, devices on the same bus are read one at a time (see Mcycle.py)
+        self.ads = None
+        self.rdyPin = rdyPin
+        self.rawType = 'int16'
+        if backend == 'sim':
+            from .Msimulate import simADS1115
+            self.sim = sim if sim is not None else simADS1115(gain=usergain)
+            self.logger.info("ADS1115 using simulated I2C bus ({0} SPS)".format(self.sim.datarate))
+            self.chan = self.sim.chan
+        elif backend == 'adafruit':
+            import adafruit_ads1x15.ads1115 as ADS  # hardware libraries only needed for the adafruit backend
+            from adafruit_ads1x15.analog_in import AnalogIn
+            self.logger.info("ADS1115 using I2C at address {0}".format(str(useraddress)))
+            i2c = sharedI2C()  # One I2C bus object shared by every ADS1115 on the bus (see MbusManager.py)
+            ads = ADS.ADS1115(i2c, gain=usergain, data_rate=datarate, address=useraddress)   # Create the ADC object using the I2C bus
+            self.ads = ads
+            self.chan = [AnalogIn(ads, ADS.P0), # create analog input channel on pins
+                         AnalogIn(ads, ADS.P1),
+                         AnalogIn(ads, ADS.P2),
+                         AnalogIn(ads, ADS.P3)]
+        else:
+            self.logger.error("Backend must be 'adafruit' or 'sim'")
+            sys.exit()
         self.noiseThreshold = noiseThreshold
-        self.numOfSamples = 10        # Number of samples to average
+        self.numOfSamples = numOfSamples        # Number of samples to average
         self.maxInterval = maxInterval  # interval in seconds to check for update
         self.time0 = time()
         # Initialize lists
@@ -65,25 +121,195 @@ class ads1115:
         self.adcValue = [x for x in range(self.numOfChannels)]
         self.adc = {}  # Dictionary for sending final results
         self.sensor = [[x for x in range(0, self.numOfSamples)] for x in range(0, self.numOfChannels)]
+        self.keys = ['a' + str(x) + 'f' for x in range(self.numOfChannels)]  # Precomputed keys for the final data
+        self.filters = filters if filters is not None else {}   # {channel: filterChain} used instead of the average
+        self.autoThreshold = autoThreshold   # noiseFloor that sets self.thresholds from the measured noise
+        self.changeSet = changeSet
+        self.thresholds = list(noiseThreshold) if isinstance(noiseThreshold, (list, tuple)) else [noiseThreshold] * self.numOfChannels
+        self.maxIntervals = list(maxInterval) if isinstance(maxInterval, (list, tuple)) else [maxInterval] * self.numOfChannels
+        self.maxInterval = min(self.maxIntervals)    # 'any channel changed' mode uses the shortest interval
+        self.chanTime0 = [self.time0] * self.numOfChannels   # last time each channel was returned (changeSet)
+        self.changed = [False] * self.numOfChannels
+        self.useNumpy = useNumpy
+        self.scale = PGA_RANGE[self.gain] / 32767   # raw to volt, same as AnalogIn.voltage
+        self.rawScale = self.scale
+        self.calibration = calibration
+        if calibration is not None:
+            calibration.setup(self.numOfChannels, (-PGA_RANGE[self.gain], PGA_RANGE[self.gain]))
+        if autoThreshold is not None:
+            autoThreshold.setup(self.scale)   # one count in volts
+        if self.useNumpy:             # Preallocate arrays once, getdata fills/updates them in place
+            self.sensor = np.zeros((self.numOfChannels, self.numOfSamples))
+            self.sensorAve = np.zeros(self.numOfChannels)
+            self.sensorLastRead = np.zeros(self.numOfChannels)
+            self.adcValue = np.zeros(self.numOfChannels)
+            self.delta = np.zeros(self.numOfChannels)
+            self.changed = np.zeros(self.numOfChannels, dtype=bool)
+            self.thresholds = np.array(self.thresholds, dtype=float)
         for x in range(self.numOfChannels): # initialize the first read for comparison later
-            self.sensorLastRead[x] = self.chan[x].value
+            self.sensorLastRead[x] = self.chan[x].voltage
+        self.sensorChanged = False
+        self.timelimit = False
+        self.sampler = None
+        self.conversion = None
+        if continuous:
+            datarate = datarate if datarate is not None else 860
+            if datarate not in DR_BITS:
+                self.logger.error("datarate must be one of {0}".format(sorted(DR_BITS)))
+                sys.exit()
+            if backend == 'sim':
+                self.conversion = self.sim.continuous(datarate)
+            else:
+                self.conversion = adsContinuous(ads.i2c_device, usergain, datarate, rdyPin, self.logger)
+        if rate or continuous:
+            self.buffer = ringBuffer(bufferSize, self.numOfChannels, self.useNumpy)
+            self.sampler = sampler(self._readframe, self.buffer, rate, self.logger)   # rate=0 in continuous mode, paced by the conversions
+            self.sampler.start()
+
+    def _sample(self):
+        ''' Fill self.sensor[x][i] with samples from every channel (raw when useNumpy, else volts).
+        False if the buffer is not full enough yet '''
+
+        if self.sampler is not None:
+            if self.sampler.error is not None:   # the bus is failing, the buffer only has old frames
+                return False
+            return self.buffer.latest(self.sensor)   # copy from the ring buffer, no bus access
+        if self.useNumpy:
+            for x in range(self.numOfChannels):
+                for i in range(self.numOfSamples):  # get raw samples, conversion to volts is done on the whole array
+                    self.sensor[x, i] = self.chan[x].value
+        else:
+            for x in range(self.numOfChannels):
+                for i in range(self.numOfSamples):  # get samples points from analog pin
+                    self.sensor[x][i] = self.chan[x].voltage
+        return True
+
+    def _readframe(self):
+        ''' One sample from every channel (raw when useNumpy, else volts). Called by the sampler thread '''
+
+        if self.conversion is not None:
+            frame = []
+            for x in range(self.numOfChannels):
+                self.conversion.select(x)   # no-op with 1 channel so it reads at the full data rate
+                frame.append(self.conversion.read())
+            return frame if self.useNumpy else [value * self.scale for value in frame]
+        if self.useNumpy:
+            return [self.chan[x].value for x in range(self.numOfChannels)]
+        return [self.chan[x].voltage for x in range(self.numOfChannels)]
+
+    def burst(self, out):
+        ''' Fill out[x, i] (channels x samples, ie a numpy memmap) with raw samples in continuous mode at 860 SPS
+        (the continuous mode datarate if set), one channel after the other. No averaging or threshold.
+        Returns [[start, end], ...] time of each channel '''
+
+        conversion = self.conversion
+        if conversion is None:   # continuous mode only for the burst, back to single-shot after
+            conversion = self.sim.continuous(860) if self.ads is None else adsContinuous(self.ads.i2c_device, self.gain, 860, self.rdyPin, self.logger)
+        times = []
+        try:
+            for x in range(self.numOfChannels):
+                conversion.select(x)   # discards the conversion started before the mux switch
+                t0 = time()
+                for i in range(out.shape[1]):
+                    out[x, i] = conversion.read()
+                times.append([t0, time()])
+        finally:
+            if conversion is not self.conversion:
+                conversion.close()
+        return times
+
+    def snapshot(self):
+        ''' Latest (time, frame) from the ring buffer (rate must be set) '''
+
+        return self.buffer.snapshot()
+
+    def window(self, n):
+        ''' Last n (times, frames) from the ring buffer, oldest first (rate must be set) '''
+
+        return self.buffer.window(n)
+
+    def stop(self):
+        ''' Stop the sampler thread and save the noise floor '''
+
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.autoThreshold is not None and self.autoThreshold.path is not None:
+            self.autoThreshold.save()
+        if self.conversion is not None:
+            self.conversion.close()
+
+    def _reduceArray(self):
+        ''' Vectorized raw to volt conversion, average and threshold check (useNumpy) '''
+
+        np.multiply(self.sensor, self.scale, out=self.sensor)   # raw to volts
+        if self.autoThreshold is not None:
+            self.autoThreshold.update(self.sensor, self.thresholds, self.changed)   # changed is still last call's
+        np.mean(self.sensor, axis=1, out=self.sensorAve)
+        for x in self.filters:
+            self._filter(x)
+        np.subtract(self.sensorAve, self.sensorLastRead, out=self.delta)
+        np.abs(self.delta, out=self.delta)
+        np.greater(self.delta, self.thresholds, out=self.changed)
+        if self.changed.any():
+            self.sensorChanged = True
+            if self.logger.isEnabledFor(logging.DEBUG): self.logger.debug('changed: {0} chan: {1} value: {2} previously: {3}'.format(self.sensorChanged, np.flatnonzero(self.changed), self.sensorAve, self.sensorLastRead))
+        self.sensorLastRead[:] = self.sensorAve
+        if self.calibration is not None:
+            self.calibration.apply(self.sensorAve, self.adcValue)
+            self.adc.update(zip(self.keys, self.adcValue.tolist()))
+        else:
+            self.adc.update(zip(self.keys, self.sensorAve.tolist()))
+
+    def _filter(self, x):
+        ''' Run channel x samples through its filter chain. Keeps the last value if a decimating filter has no output yet '''
+
+        value = self.filters[x].process(self.sensor[x].tolist() if self.useNumpy else self.sensor[x])
+        self.sensorAve[x] = self.sensorLastRead[x] if value is None else value
+
+    def _reduceList(self):
+        ''' Per channel average and threshold check '''
+
+        if self.autoThreshold is not None:
+            self.autoThreshold.update(self.sensor, self.thresholds, self.changed)   # changed is still last call's
+        for x in range(self.numOfChannels):
+            if x in self.filters:
+                self._filter(x)
+            else:
+                self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
+            self.changed[x] = abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.thresholds[x]
+            if self.changed[x]:
+                self.sensorChanged = True
+            self.logger.debug('changed: {0} chan: {1} value: {2:1.3f} previously: {3:1.3f}'.format(self.sensorChanged, x, self.sensorAve[x], self.sensorLastRead[x]))
+            self.adc[self.keys[x]] = self.sensorAve[x] if self.calibration is None else self.calibration.correct(x, self.sensorAve[x])
+            self.sensorLastRead[x] = self.sensorAve[x]
+
+    def _changeSet(self):
+        ''' Only the channels that changed or hit their own maxInterval. None if no channel is due '''
+
+        now = time()
+        data = {}
+        for x in range(self.numOfChannels):
+            if self.changed[x] or now - self.chanTime0[x] > self.maxIntervals[x]:
+                data[self.keys[x]] = self.adc[self.keys[x]]
+                self.chanTime0[x] = now
         self.sensorChanged = False
         self.timelimit = False
+        if data:
+            return data
 
     def getdata(self):
         ''' If adc is above noise threshold or time limit exceeded will return voltage of each channel '''
         
         if time() - self.time0 > self.maxInterval:
             self.timelimit = True
-        for x in range(self.numOfChannels):
-            for i in range(self.numOfSamples):  # get samples points from analog pin and average
-                self.sensor[x][i] = self.chan[x].voltage
-            self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
-            if abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.noiseThreshold:
-                self.sensorChanged = True
-            self.logger.debug('changed: {0} chan: {1} value: {2:1.3f} previously: {3:1.3f}'.format(self.sensorChanged, x, self.sensorAve[x], self.sensorLastRead[x]))
-            self.adc['a' + str(x) + 'f'] = self.sensorAve[x]            
-            self.sensorLastRead[x] = self.sensorAve[x]
+        if not self._sample():
+            return None
+        if self.useNumpy:
+            self._reduceArray()
+        else:
+            self._reduceList()
+        if self.changeSet:
+            return self._changeSet()
         if self.sensorChanged or self.timelimit:
             self.time0 = time()
             self.sensorChanged = False
@@ -91,6 +317,7 @@ class ads1115:
             return self.adc
       
 if __name__ == "__main__":
+    # Run as a module from the repo directory (the relative imports need the adc package): python3 -m adc.MadcADS1115_4CH
     
     logging.basicConfig(level=logging.DEBUG)
     logger_ads1115 = logging.getLogger('ads1115')
@@ -10,7 +10,27 @@ MCP3008 adc has 8 channels.  If any channel has a delta (current-previous) that
  R2=4.7kohm
  Noise threshold is in raw ADC - To find the noise threshold set initial threshold low and monitor
  Max time interval is used to catch drift/creep that is below the noise threshold.
- CS (chip select) - Uses SPI0 with GPIO 8 (CE0) or GPIO 7 (CE1)
+ CS (chip select) - Uses SPI0 with GPIO 8 (CE0) or GPIO 7 (CE1), or SPI1 with GPIO 18 (CE0), 17 (CE1) or 16 (CE2)
+ Backend - 'adafruit' (default) reads each sample through adafruit AnalogIn.
+           'spidev' reads all channel x sample conversions in one block transfer per getdata() (see MspidevBlock.py)
+           'sim' simulated bus, no hardware needed. Pass sim=simMCP3008(waveforms, vref, latency) (see Msimulate.py)
+ rate - Optional continuous acquisition. A sampler thread reads one frame (all channels) at rate Hz into a ring
+        buffer of bufferSize frames. getdata() then averages the latest frames from the buffer instead of
+        waiting on the bus, and snapshot()/window(n) return the raw timestamped frames. stop() ends the thread.
+ changeSet - Optional per channel mode. noiseThreshold and maxInterval can be a list (one per channel).
+             getdata() returns only the channels that changed by more than their threshold or whose
+             maxInterval is due, instead of every channel when any one changes
+ numOfSamples - Samples read per channel on each getdata() (default 10)
+ autoThreshold - Optional noiseFloor (see MnoiseFloor.py). Estimates each channel's noise and sets its threshold
+                 (with hysteresis) automatically, noiseThreshold is only used until it has calibrated
+ filters - Optional {channel: filterChain} (see Mfilters.py). Each sample of that channel is fed through
+           the chain and its output is used instead of the numOfSamples average (ie fast EMA on a joystick,
+           heavy decimation on a thermistor). In continuous mode the chain sees the latest numOfSamples frames
+           on every call, so set numOfSamples to the number of frames expected between calls
+ useNumpy - Optional. Keeps samples in a preallocated (channels x samples) numpy array and does the
+            averaging, threshold check and raw to volt conversion as vectorized operations
+ calibration - Optional calibration (see Mcalibration.py). Per channel offset/gain/linearity corrections from
+               a file, applied to the volts returned by getdata() (thresholds stay in raw ADC)
 
  Requires 4 lines. SCLK, MOSI, MISO, CS
  You can enable SPI1 with a dtoverlay configured in "/boot/config.txt"
@@ -21,16 +41,21 @@ MCP3008 adc has 8 channels.  If any channel has a delta (current-previous) that
       CS = GPIO 18(CE0) 17(CE1) 16(CE2)
 
 '''
-import busio, digitalio, board, logging
-import adafruit_mcp3xxx.mcp3008 as MCP
-from adafruit_mcp3xxx.analog_in import AnalogIn
+import logging
 from time import time, sleep
 import sys
+from .MringBuffer import ringBuffer, sampler
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CS_MAP = {8: (0, 0), 7: (0, 1), 18: (1, 0), 17: (1, 1), 16: (1, 2)}  # CS GPIO: (SPI bus, chip select) ie /dev/spidev1.2
 
 class mcp3008:
     ''' ADC using MCP3008 (SPI). Returns a list with voltge values '''
 
-    def __init__(self, numOfChannels, vref, noiseThreshold=350, maxInterval=1, cs=8, logger=None):
+    def __init__(self, numOfChannels, vref, noiseThreshold=350, maxInterval=1, cs=8, logger=None, backend='adafruit', useNumpy=False, rate=0, bufferSize=1000, numOfSamples=10, filters=None, changeSet=False, sim=None, autoThreshold=None, calibration=None):
         ''' Create spi connection and initialize lists '''
         
         if logger is not None:                        # Use logger passed as argument
@@ -41,27 +66,58 @@ class mcp3008:
         else:                                          # Root logger already exists and no custom logger passed
             self.logger = logging.getLogger(__name__)    # Create from root logger
         self.vref = vref
-        self.logger.info("MCP3008 using SPI SCLK:GPIO{0} MISO:GPIO{1} MOSI:GPIO{2} CS:GPIO{3}".format(board.SCK, board.MISO, board.MOSI, cs))
-        spi = busio.SPI(clock=board.SCK, MISO=board.MISO, MOSI=board.MOSI) # create the spi bus
-        if cs == 8:
-            cs = digitalio.DigitalInOut(board.D8) # create the cs (chip select). Use GPIO8 (CE0) or GPIO7 (CE1)
-        elif cs == 7:
-            cs = digitalio.DigitalInOut(board.D7) # create the cs (chip select). Use GPIO8 (CE0) or GPIO7 (CE1)
-        else:
-            self.logger.error("Chip Select pin must be 7 or 8")
+        if useNumpy and np is None:
+            self.logger.error("useNumpy requires numpy (pip3 install numpy)")
+            sys.exit()
+        if rate and bufferSize <= numOfSamples:
+            self.logger.error("bufferSize ({0}) must be larger than numOfSamples ({1})".format(bufferSize, numOfSamples))
             sys.exit()
-        mcp = MCP.MCP3008(spi, cs) # create the mcp object. Can pass Vref as last argument
+        if cs not in CS_MAP:
+            self.logger.error("Chip Select pin must be 8 or 7 (SPI0), or 18, 17 or 16 (SPI1)")
+            sys.exit()
+        bus, device = CS_MAP[cs]
+        self.bus = 'spi' + str(bus)   # physical bus, devices on the same bus are read one at a time (see Mcycle.py)
+        self.spiPort = (bus, device)
+        self.rawType = 'uint16'       # raw values are 10 bit scaled to 16 bit (see burst)
+        self.rawScale = vref / 65535  # raw to volt, same as valmap
         self.numOfChannels = numOfChannels
-        self.chan = [AnalogIn(mcp, MCP.P0), # create analog input channel on pins
-                     AnalogIn(mcp, MCP.P1),
-                     AnalogIn(mcp, MCP.P2),
-                     AnalogIn(mcp, MCP.P3),
-                     AnalogIn(mcp, MCP.P4),
-                     AnalogIn(mcp, MCP.P5),
-                     AnalogIn(mcp, MCP.P6),
-                     AnalogIn(mcp, MCP.P7)]
+        self.numOfSamples = numOfSamples             # Number of samples to average
+        self.block = None
+        self.burstBlock = None
+        self.sampler = None
+        if backend == 'spidev':
+            from .MspidevBlock import spidevBlock
+            self.logger.info("MCP3008 using spidev block transfer on /dev/spidev{0}.{1} (CS:GPIO{2})".format(bus, device, cs))
+            self.block = spidevBlock(bus, device, self.numOfChannels, self.numOfSamples)
+        elif backend == 'sim':
+            from .Msimulate import simMCP3008
+            self.sim = sim if sim is not None else simMCP3008(vref=vref)
+            self.logger.info("MCP3008 using simulated SPI bus ({0}us per transaction)".format(self.sim.latency * 1e6))
+            self.chan = self.sim.chan
+        elif backend == 'adafruit':
+            import busio, digitalio, board  # hardware libraries only needed for the adafruit backend
+            import adafruit_mcp3xxx.mcp3008 as MCP
+            from adafruit_mcp3xxx.analog_in import AnalogIn
+            if bus == 0:
+                sck, miso, mosi = board.SCK, board.MISO, board.MOSI
+            else:
+                sck, miso, mosi = board.SCK_1, board.MISO_1, board.MOSI_1   # SPI1 needs dtoverlay=spi1-3cs
+            self.logger.info("MCP3008 using SPI SCLK:GPIO{0} MISO:GPIO{1} MOSI:GPIO{2} CS:GPIO{3}".format(sck, miso, mosi, cs))
+            spi = busio.SPI(clock=sck, MISO=miso, MOSI=mosi) # create the spi bus
+            csPin = digitalio.DigitalInOut(getattr(board, 'D' + str(cs))) # create the cs (chip select)
+            mcp = MCP.MCP3008(spi, csPin) # create the mcp object. Can pass Vref as last argument
+            self.chan = [AnalogIn(mcp, MCP.P0), # create analog input channel on pins
+                         AnalogIn(mcp, MCP.P1),
+                         AnalogIn(mcp, MCP.P2),
+                         AnalogIn(mcp, MCP.P3),
+                         AnalogIn(mcp, MCP.P4),
+                         AnalogIn(mcp, MCP.P5),
+                         AnalogIn(mcp, MCP.P6),
+                         AnalogIn(mcp, MCP.P7)]
+        else:
+            self.logger.error("Backend must be 'adafruit', 'spidev' or 'sim'")
+            sys.exit()
         self.noiseThreshold = noiseThreshold
-        self.numOfSamples = 10             # Number of samples to average
         self.maxInterval = maxInterval  # interval in seconds to check for update
         self.time0 = time()   # time 0
         # Initialize lists
@@ -69,33 +125,196 @@ class mcp3008:
         self.sensorLastRead = [x for x in range(self.numOfChannels)]
         self.adcValue = [x for x in range(self.numOfChannels)]
         self.sensor = [[x for x in range(0, self.numOfSamples)] for x in range(0, self.numOfChannels)]
+        self.keys = ['a' + str(x) + 'f' for x in range(self.numOfChannels)]  # Precomputed keys for the final data
+        self.filters = filters if filters is not None else {}   # {channel: filterChain} used instead of the average
+        self.autoThreshold = autoThreshold   # noiseFloor that sets self.thresholds from the measured noise
+        self.changeSet = changeSet
+        self.thresholds = list(noiseThreshold) if isinstance(noiseThreshold, (list, tuple)) else [noiseThreshold] * self.numOfChannels
+        self.maxIntervals = list(maxInterval) if isinstance(maxInterval, (list, tuple)) else [maxInterval] * self.numOfChannels
+        self.maxInterval = min(self.maxIntervals)    # 'any channel changed' mode uses the shortest interval
+        self.chanTime0 = [self.time0] * self.numOfChannels   # last time each channel was returned (changeSet)
+        self.changed = [False] * self.numOfChannels
+        self.useNumpy = useNumpy
+        self.calibration = calibration
+        if calibration is not None:
+            calibration.setup(self.numOfChannels, (0, vref))
+        if autoThreshold is not None:
+            autoThreshold.setup(64)   # one 10 bit code in the 16 bit raw value
+        if self.useNumpy:             # Preallocate arrays once, getdata fills/updates them in place
+            self.sensor = np.zeros((self.numOfChannels, self.numOfSamples))
+            self.sensorAve = np.zeros(self.numOfChannels)
+            self.sensorLastRead = np.zeros(self.numOfChannels)
+            self.adcValue = np.zeros(self.numOfChannels)
+            self.delta = np.zeros(self.numOfChannels)
+            self.changed = np.zeros(self.numOfChannels, dtype=bool)
+            self.thresholds = np.array(self.thresholds, dtype=float)
+        self._sample()
         for x in range(self.numOfChannels): # initialize the first read for comparison later
-            self.sensorLastRead[x] = self.chan[x].value
+            self.sensorLastRead[x] = sum(self.sensor[x])/len(self.sensor[x])
         self.sensorChanged = False
         self.timelimit = False
         self.adc = {}   # Container for sending final data
+        if rate:
+            if self.block is not None:   # sampler reads one sample per channel per frame
+                self.frameblock = spidevBlock(bus, device, self.numOfChannels, 1)
+                self.frame = [[0] for x in range(self.numOfChannels)]
+            self.buffer = ringBuffer(bufferSize, self.numOfChannels, self.useNumpy)
+            self.sampler = sampler(self._readframe, self.buffer, rate, self.logger)
+            self.sampler.start()
     
     def valmap(self, value, istart, istop, ostart, ostop):
         ''' Used to convert from raw ADC to voltage '''
 
         return ostart + (ostop - ostart) * ((value - istart) / (istop - istart))
 
-    def getdata(self):
-        ''' If adc is above noise threshold or time limit exceeded will return voltage of each channel '''
-        
-        if time() - self.time0 > self.maxInterval:
-            self.timelimit = True
+    def _sample(self):
+        ''' Fill self.sensor[x][i] with raw samples from every channel. False if the buffer is not full enough yet '''
+
+        if self.sampler is not None:
+            if self.sampler.error is not None:   # the bus is failing, the buffer only has old frames
+                return False
+            return self.buffer.latest(self.sensor)   # copy from the ring buffer, no bus access
+        if self.block is not None:
+            self.block.read(self.sensor)   # one block transfer for all channels and samples
+        else:
+            for x in range(self.numOfChannels):
+                for i in range(self.numOfSamples):  # get samples points from analog pin
+                    self.sensor[x][i] = self.chan[x].value
+        return True
+
+    def _readframe(self):
+        ''' One raw sample from every channel. Called by the sampler thread '''
+
+        if self.block is not None:
+            self.frameblock.read(self.frame)
+            return [row[0] for row in self.frame]
+        return [self.chan[x].value for x in range(self.numOfChannels)]
+
+    def burst(self, out):
+        ''' Fill out[x, i] (channels x samples, ie a numpy memmap) with raw samples at the full bus rate. No averaging
+        or threshold. spidev reads every channel in chunks of one ioctl, adafruit one channel after the other.
+        Returns [[start, end], ...] time of each channel '''
+
+        numOfSamples = out.shape[1]
+        times = []
+        if self.block is not None:   # fixed block of up to 511 conversions, one ioctl per chunk decoded into out
+            if self.burstBlock is None:
+                from .MspidevBlock import spidevBlock, MAXFRAMES
+                self.burstBlock = spidevBlock(self.spiPort[0], self.spiPort[1], self.numOfChannels, max(1, MAXFRAMES // self.numOfChannels))
+                self.burstChunk = np.zeros((self.numOfChannels, self.burstBlock.numOfSamples), dtype=np.uint16)
+            chunk = self.burstBlock.numOfSamples
+            t0 = time()
+            for i in range(0, numOfSamples, chunk):
+                n = min(chunk, numOfSamples - i)
+                if n == chunk:
+                    self.burstBlock.read(out[:, i:i + n])
+                else:                 # last partial chunk
+                    self.burstBlock.read(self.burstChunk)
+                    out[:, i:i + n] = self.burstChunk[:, :n]
+            t1 = time()
+            return [[t0, t1] for x in range(self.numOfChannels)]
+        for x in range(self.numOfChannels):
+            chan = self.chan[x]
+            t0 = time()
+            for i in range(numOfSamples):
+                out[x, i] = chan.value
+            times.append([t0, time()])
+        return times
+
+    def snapshot(self):
+        ''' Latest (time, raw frame) from the ring buffer (rate must be set) '''
+
+        return self.buffer.snapshot()
+
+    def window(self, n):
+        ''' Last n (times, raw frames) from the ring buffer, oldest first (rate must be set) '''
+
+        return self.buffer.window(n)
+
+    def stop(self):
+        ''' Stop the sampler thread and save the noise floor '''
+
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.burstBlock is not None:
+            self.burstBlock.close()
+        if self.autoThreshold is not None and self.autoThreshold.path is not None:
+            self.autoThreshold.save()
+
+    def _reduceArray(self):
+        ''' Vectorized average, threshold check and raw to volt conversion (useNumpy) '''
+
+        if self.autoThreshold is not None:
+            self.autoThreshold.update(self.sensor, self.thresholds, self.changed)   # changed is still last call's
+        np.mean(self.sensor, axis=1, out=self.sensorAve)
+        for x in self.filters:
+            self._filter(x)
+        np.subtract(self.sensorAve, self.sensorLastRead, out=self.delta)
+        np.abs(self.delta, out=self.delta)
+        np.greater(self.delta, self.thresholds, out=self.changed)
+        if self.changed.any():
+            self.sensorChanged = True
+            if self.logger.isEnabledFor(logging.DEBUG): self.logger.debug('changed: {0} chan: {1} value: {2} previously: {3}'.format(self.sensorChanged, np.flatnonzero(self.changed), self.sensorAve, self.sensorLastRead))
+        np.multiply(self.sensorAve, self.vref / 65535, out=self.adcValue)
+        if self.calibration is not None:
+            self.calibration.apply(self.adcValue, self.adcValue)
+        self.sensorLastRead[:] = self.sensorAve
+        self.adc.update(zip(self.keys, self.adcValue.tolist()))
+
+    def _filter(self, x):
+        ''' Run channel x samples through its filter chain. Keeps the last value if a decimating filter has no output yet '''
+
+        value = self.filters[x].process(self.sensor[x].tolist() if self.useNumpy else self.sensor[x])
+        self.sensorAve[x] = self.sensorLastRead[x] if value is None else value
+
+    def _reduceList(self):
+        ''' Per channel average, threshold check and raw to volt conversion '''
+
+        if self.autoThreshold is not None:
+            self.autoThreshold.update(self.sensor, self.thresholds, self.changed)   # changed is still last call's
         for x in range(self.numOfChannels):
-            for i in range(self.numOfSamples):  # get samples points from analog pin and average
-                self.sensor[x][i] = self.chan[x].value
-            self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
-            if abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.noiseThreshold:
+            if x in self.filters:
+                self._filter(x)
+            else:
+                self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
+            self.changed[x] = abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.thresholds[x]
+            if self.changed[x]:
                 self.sensorChanged = True
                 self.logger.debug('changed: {0} chan: {1} value: {2:1.3f} previously: {3:1.3f}'.format(self.sensorChanged, x, self.sensorAve[x], self.sensorLastRead[x]))
             self.adcValue[x] = self.valmap(self.sensorAve[x], 0, 65535, 0, self.vref) # 4mV change is approx 500
+            if self.calibration is not None:
+                self.adcValue[x] = self.calibration.correct(x, self.adcValue[x])
             self.sensorLastRead[x] = self.sensorAve[x]
-            self.adc['a' + str(x) + 'f'] = self.adcValue[x]
+            self.adc[self.keys[x]] = self.adcValue[x]
             self.logger.debug('chan: {0} value: {1:1.3f}'.format(x, self.adcValue[x]))
+
+    def _changeSet(self):
+        ''' Only the channels that changed or hit their own maxInterval. None if no channel is due '''
+
+        now = time()
+        data = {}
+        for x in range(self.numOfChannels):
+            if self.changed[x] or now - self.chanTime0[x] > self.maxIntervals[x]:
+                data[self.keys[x]] = self.adc[self.keys[x]]
+                self.chanTime0[x] = now
+        self.sensorChanged = False
+        self.timelimit = False
+        if data:
+            return data
+
+    def getdata(self):
+        ''' If adc is above noise threshold or time limit exceeded will return voltage of each channel '''
+        
+        if time() - self.time0 > self.maxInterval:
+            self.timelimit = True
+        if not self._sample():
+            return None
+        if self.useNumpy:
+            self._reduceArray()
+        else:
+            self._reduceList()
+        if self.changeSet:
+            return self._changeSet()
         if self.sensorChanged or self.timelimit:
             self.time0 = time()
             self.sensorChanged = False
@@ -103,6 +322,7 @@ class mcp3008:
             return self.adc
       
 if __name__ == "__main__":
+    # Run as a module from the repo directory (the relative imports need the adc package): python3 -m adc.MadcMCP3008_8CH
   
     logging.basicConfig(level=logging.INFO)
     logger_mcp3008 = logging.getLogger('mcp3008')
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+''' Up to 5 MCP3008 (40 channels) read as one device.
+ SPI0 has 2 chip selects (GPIO 8, 7) and SPI1 has 3 (GPIO 18, 17, 16, needs dtoverlay=spi1-3cs).
+ Every getdata() reads every chip once: chips on the same bus are read one after the other, and SPI0 and SPI1
+ run at the same time on two worker threads (the spidev ioctl releases the GIL while the bus transfers).
+
+ Keys are a0f..a39f in chipSelects order x channel, so chipSelects=[8, 7, 18] with 8 channels each gives
+ CS8 -> a0f-a7f, CS7 -> a8f-a15f, CS18 -> a16f-a23f. The keys stay the same no matter which bus finishes first.
+ Same noise threshold / max interval rule as mcp3008: if any channel changed every channel is returned.
+
+ Backend - 'spidev' (default) one block transfer per chip (see MspidevBlock.py)
+           'adafruit' AnalogIn per sample, one busio.SPI per bus
+           'sim' simulated chips. Pass sims=[simMCP3008(...), ...] one per chip select (see Msimulate.py)
+ numOfChannels - channels used on each chip (1-8)
+ useNumpy - Optional. Samples kept in one (chips*channels x samples) array, averaging and conversion vectorized
+'''
+import logging, sys
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from .MadcMCP3008_8CH import CS_MAP
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class _analogInBlock:
+    ''' adafruit AnalogIn channels with the same read(sensor) interface as spidevBlock '''
+
+    def __init__(self, chan, numOfChannels, numOfSamples):
+        self.chan = chan
+        self.numOfChannels = numOfChannels
+        self.numOfSamples = numOfSamples
+
+    def read(self, sensor):
+        for x in range(self.numOfChannels):
+            for i in range(self.numOfSamples):
+                sensor[x][i] = self.chan[x].value
+
+    def close(self):
+        pass
+
+class mcp3008Array:
+    ''' Several MCP3008 on SPI0 and SPI1 read as a single device. Returns a dict with the voltage of every channel '''
+
+    def __init__(self, chipSelects=(8, 7, 18, 17, 16), numOfChannels=8, vref=3.3, noiseThreshold=350, maxInterval=1, logger=None, backend='spidev', useNumpy=False, numOfSamples=10, sims=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        for cs in chipSelects:
+            if cs not in CS_MAP:
+                self.logger.error("Chip Select pin must be 8 or 7 (SPI0), or 18, 17 or 16 (SPI1)")
+                sys.exit()
+        if len(set(chipSelects)) != len(chipSelects):
+            self.logger.error("Chip Select pins must be different")
+            sys.exit()
+        if useNumpy and np is None:
+            self.logger.error("useNumpy requires numpy (pip3 install numpy)")
+            sys.exit()
+        self.chipSelects = list(chipSelects)
+        self.numOfChips = len(self.chipSelects)
+        self.numOfChannels = numOfChannels       # per chip
+        self.numOfSamples = numOfSamples
+        self.vref = vref
+        self.noiseThreshold = noiseThreshold
+        self.maxInterval = maxInterval
+        self.useNumpy = useNumpy
+        if backend == 'spidev':
+            from .MspidevBlock import spidevBlock
+            self.blocks = [spidevBlock(CS_MAP[cs][0], CS_MAP[cs][1], numOfChannels, numOfSamples) for cs in self.chipSelects]
+        elif backend == 'sim':
+            from .Msimulate import simMCP3008
+            self.sims = sims if sims is not None else [simMCP3008(vref=vref) for cs in self.chipSelects]
+            self.blocks = [sim.block(numOfChannels, numOfSamples) for sim in self.sims]
+        elif backend == 'adafruit':
+            import busio, digitalio, board  # hardware libraries only needed for the adafruit backend
+            import adafruit_mcp3xxx.mcp3008 as MCP
+            from adafruit_mcp3xxx.analog_in import AnalogIn
+            spi = {}
+            self.blocks = []
+            for cs in self.chipSelects:
+                bus = CS_MAP[cs][0]
+                if bus not in spi:
+                    if bus == 0:
+                        spi[bus] = busio.SPI(clock=board.SCK, MISO=board.MISO, MOSI=board.MOSI)
+                    else:
+                        spi[bus] = busio.SPI(clock=board.SCK_1, MISO=board.MISO_1, MOSI=board.MOSI_1)
+                mcp = MCP.MCP3008(spi[bus], digitalio.DigitalInOut(getattr(board, 'D' + str(cs))))
+                chan = [AnalogIn(mcp, getattr(MCP, 'P' + str(x))) for x in range(numOfChannels)]
+                self.blocks.append(_analogInBlock(chan, numOfChannels, numOfSamples))
+        else:
+            self.logger.error("Backend must be 'spidev', 'adafruit' or 'sim'")
+            sys.exit()
+        total = self.numOfChips * self.numOfChannels
+        self.keys = ['a' + str(x) + 'f' for x in range(total)]
+        if self.useNumpy:
+            self.sensor = np.zeros((total, numOfSamples))
+            self.sensorAve = np.zeros(total)
+            self.sensorLastRead = np.zeros(total)
+            self.adcValue = np.zeros(total)
+            self.delta = np.zeros(total)
+        else:
+            self.sensor = [[0 for i in range(numOfSamples)] for x in range(total)]
+            self.sensorLastRead = [0.0 for x in range(total)]
+        # Each chip fills its own rows of self.sensor (a list slice of the same row lists, or an ndarray view)
+        self.rows = [self.sensor[c * numOfChannels:(c + 1) * numOfChannels] for c in range(self.numOfChips)]
+        self.buses = {}   # bus: [chip index, ...] in chipSelects order
+        for c, cs in enumerate(self.chipSelects):
+            self.buses.setdefault(CS_MAP[cs][0], []).append(c)
+        self.bus = tuple('spi' + str(bus) for bus in sorted(self.buses))   # uses both buses (see Mcycle.py)
+        self.pool = ThreadPoolExecutor(max_workers=len(self.buses)) if len(self.buses) > 1 else None
+        self.logger.info("MCP3008 array CS:GPIO{0} on SPI{1}, {2} channels".format(self.chipSelects, sorted(self.buses), total))
+        self.adc = {}
+        self._sample()
+        for x in range(total): # initialize the first read for comparison later
+            self.sensorLastRead[x] = sum(self.sensor[x]) / self.numOfSamples
+        self.time0 = time()
+
+    def _readBus(self, chips):
+        for c in chips:
+            self.blocks[c].read(self.rows[c])
+
+    def _sample(self):
+        ''' One pass over every chip, SPI0 and SPI1 in parallel '''
+
+        if self.pool is None:
+            for chips in self.buses.values():
+                self._readBus(chips)
+            return
+        for future in [self.pool.submit(self._readBus, chips) for chips in self.buses.values()]:
+            future.result()   # re-raises a bus error here
+
+    def getdata(self):
+        ''' If any channel is above noise threshold or time limit exceeded will return voltage of every channel '''
+
+        timelimit = time() - self.time0 > self.maxInterval
+        self._sample()
+        if self.useNumpy:
+            np.mean(self.sensor, axis=1, out=self.sensorAve)
+            np.subtract(self.sensorAve, self.sensorLastRead, out=self.delta)
+            changed = bool((np.abs(self.delta, out=self.delta) > self.noiseThreshold).any())
+            self.sensorLastRead[:] = self.sensorAve
+            np.multiply(self.sensorAve, self.vref / 65535, out=self.adcValue)
+            self.adc.update(zip(self.keys, self.adcValue.tolist()))
+        else:
+            changed = False
+            for x, key in enumerate(self.keys):
+                value = sum(self.sensor[x]) / self.numOfSamples
+                if abs(value - self.sensorLastRead[x]) > self.noiseThreshold:
+                    changed = True
+                self.sensorLastRead[x] = value
+                self.adc[key] = value * self.vref / 65535
+        if changed or timelimit:
+            self.time0 = time()
+            return self.adc
+
+    def stop(self):
+        ''' Shut down the bus worker threads and close the spi devices '''
+
+        if self.pool is not None:
+            self.pool.shutdown()
+        for block in self.blocks:
+            block.close()
+
+if __name__ == "__main__":
+    # Run as a module from the repo directory (the relative imports need the adc package): python3 -m adc.MadcMCP3008_Array
+
+    logging.basicConfig(level=logging.INFO)
+    logger_array = logging.getLogger('mcp3008Array')
+    logger_array.setLevel(logging.DEBUG)
+    array = mcp3008Array([8, 7, 18, 17, 16], 8, 3.3, 400, 1, logger=logger_array) # chip selects, channels per chip, vref, noiseThreshold, max time interval
+    try:
+        while True:
+            voltage = array.getdata()
+            if voltage is not None: logging.debug(voltage)
+    finally:
+        array.stop()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+''' ADS1115 continuous-conversion reader paced by the ALERT/RDY pin.
+ In single-shot mode (adafruit AnalogIn) every sample is config write, wait for the conversion, poll and read.
+ In continuous mode the chip converts back to back at the data rate and this just reads the conversion register
+ each time a conversion finishes.
+
+ ALERT/RDY as conversion ready: Hi_thresh MSB=1, Lo_thresh MSB=0 and COMP_QUE enabled. The pin then pulses
+ low for ~8us at the end of every conversion. Wire ALERT/RDY to a GPIO (pull-up) and pass it as rdyPin.
+ Without rdyPin the reader polls, sleeping one conversion period (1/datarate) between reads.
+
+ Data rate (SPS): 8, 16, 32, 64, 128, 250, 475, 860
+ Switching channels (mux) discards the next conversion so every sample kept is from the selected input.
+ 1 channel reads at the full data rate, N channels at datarate/(2N) per channel.
+'''
+from time import perf_counter, sleep
+import threading
+
+REG_CONVERSION = 0x00
+REG_CONFIG = 0x01
+REG_LO_THRESH = 0x02
+REG_HI_THRESH = 0x03
+PGA_BITS = {2/3: 0x0000, 1: 0x0200, 2: 0x0400, 4: 0x0600, 8: 0x0800, 16: 0x0A00}
+DR_BITS = {8: 0x0000, 16: 0x0020, 32: 0x0040, 64: 0x0060, 128: 0x0080, 250: 0x00A0, 475: 0x00C0, 860: 0x00E0}
+MODE_CONTINUOUS = 0x0000
+MODE_SINGLE = 0x0100
+COMP_QUE_1 = 0x0000          # assert ALERT/RDY after one conversion (enables the pin)
+
+class adsContinuous:
+    ''' Continuous-conversion reads on one ADS1115 through an adafruit_bus_device I2CDevice '''
+
+    def __init__(self, i2cDevice, gain=1, datarate=860, rdyPin=None, logger=None, settle=1):
+        if datarate not in DR_BITS:
+            raise ValueError("datarate must be one of {0}".format(sorted(DR_BITS)))
+        self.i2c = i2cDevice
+        self.gain = gain
+        self.datarate = datarate
+        self.period = 1 / datarate
+        self.logger = logger
+        self.settle = settle      # conversions to discard after switching channel
+        self.channel = None
+        self.buf = bytearray(3)
+        self.rbuf = bytearray(2)
+        self.nextConversion = 0.0
+        self.rdyPin = rdyPin
+        self.ready = None
+        self.timeouts = 0
+        self._write(REG_LO_THRESH, 0x0000)   # conversion ready mode for ALERT/RDY
+        self._write(REG_HI_THRESH, 0x8000)
+        if rdyPin is not None:
+            import RPi.GPIO as GPIO
+            self.GPIO = GPIO
+            self.ready = threading.Event()
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(rdyPin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.add_event_detect(rdyPin, GPIO.FALLING, callback=lambda pin: self.ready.set())
+        if self.logger is not None:
+            self.logger.info("ADS1115 continuous conversion at {0} SPS, {1}".format(datarate, "RDY on GPIO{0}".format(rdyPin) if rdyPin is not None else "polling"))
+
+    def _write(self, reg, value):
+        self.buf[0] = reg
+        self.buf[1] = (value >> 8) & 0xFF
+        self.buf[2] = value & 0xFF
+        with self.i2c as i2c:
+            i2c.write(self.buf)
+
+    def select(self, channel):
+        ''' Start continuous conversions on single ended input channel (0-3). Discards settle conversions '''
+
+        if channel == self.channel:
+            return
+        config = (0x4000 | (channel << 12)) | PGA_BITS[self.gain] | MODE_CONTINUOUS | DR_BITS[self.datarate] | COMP_QUE_1
+        self._write(REG_CONFIG, config)
+        with self.i2c as i2c:
+            i2c.write(bytes([REG_CONVERSION]))   # leave the pointer on the conversion register so reads are one transaction
+        if self.ready is not None:
+            self.ready.clear()
+        self.nextConversion = perf_counter() + self.period
+        self.channel = channel
+        for x in range(self.settle):
+            self.read()
+
+    def _wait(self):
+        ''' Block until the next conversion is ready (RDY pin or one period since the last read) '''
+
+        if self.ready is not None:
+            if self.ready.wait(4 * self.period):
+                self.ready.clear()
+                return
+            self.timeouts += 1            # missed edge, fall back to reading anyway
+            if self.timeouts == 1 and self.logger is not None:
+                self.logger.warning("No ALERT/RDY edge on GPIO{0}, check wiring. Reading without it".format(self.rdyPin))
+            return
+        now = perf_counter()
+        if self.nextConversion > now:
+            sleep(self.nextConversion - now)
+        self.nextConversion = max(now, self.nextConversion) + self.period
+
+    def read(self):
+        ''' Next raw conversion (signed 16 bit) from the selected channel '''
+
+        self._wait()
+        with self.i2c as i2c:
+            i2c.readinto(self.rbuf)
+        value = (self.rbuf[0] << 8) | self.rbuf[1]
+        return value - 65536 if value & 0x8000 else value
+
+    def close(self):
+        ''' Back to single-shot mode (chip powers down between conversions) and release the RDY pin '''
+
+        self._write(REG_CONFIG, 0x8000 | 0x4000 | PGA_BITS[self.gain] | MODE_SINGLE | DR_BITS[self.datarate] | 0x0003)
+        if self.ready is not None:
+            self.GPIO.remove_event_detect(self.rdyPin)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+''' asyncio runtime for the ADC drivers and a paho mqtt client.
+ asyncADC(device)  - async getdata() for mcp3008/ads1115/ads1115Group/mcp3008Array. The blocking bus read runs
+                     in the loop's executor so devices on different buses overlap their i/o in one process.
+                     Pass the same asyncio.Lock to devices that share a bus so their reads stay serialized.
+ asyncMQTT(client) - drives an existing paho mqtt.Client from the event loop (socket reader/writer callbacks
+                     instead of the loop_start() thread). connected/disconnected are asyncio.Events.
+ acquire()         - one task per device. Reads every period (deadline based, no drift) and queues
+                     (device, time, data) whenever getdata() returns data
+ publish()         - task that publishes queued data as json on the device's topic
+ runAsync()        - runs acquire for every device plus publish until the broker disconnects (or a task
+                     fails), then cancels the tasks and stops the devices. No loop_stop() in on_disconnect
+
+ asyncio.run(adc.runAsync({'mcp3008': adc.asyncADC(mcp)}, mqttc, {'mcp3008': 'pi2nred/mcp3008/pi'}, 0.5, logger))
+'''
+import asyncio, json
+from time import time
+
+class asyncADC:
+    ''' Async wrapper around a driver. getdata() runs the blocking read in an executor '''
+
+    def __init__(self, device, lock=None, executor=None):
+        self.device = device
+        self.lock = lock            # asyncio.Lock shared by devices on the same bus
+        self.executor = executor    # None is the loop's default ThreadPoolExecutor
+        self.pending = None
+
+    async def getdata(self):
+        loop = asyncio.get_running_loop()
+        if self.lock is None:
+            self.pending = loop.run_in_executor(self.executor, self.device.getdata)
+            return await asyncio.shield(self.pending)
+        async with self.lock:
+            self.pending = loop.run_in_executor(self.executor, self.device.getdata)
+            return await asyncio.shield(self.pending)
+
+    async def stop(self):
+        ''' Wait for a read still running in the executor (a cancelled task does not stop the thread), then stop the device '''
+
+        if self.pending is not None:
+            await asyncio.wait([self.pending])
+        self.device.stop()
+
+class asyncMQTT:
+    ''' Runs a paho mqtt.Client on the asyncio loop. Create it before client.connect() '''
+
+    def __init__(self, client, logger=None):
+        self.client = client
+        self.logger = logger
+        self.loop = asyncio.get_running_loop()
+        self.connected = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.rc = None
+        self.misc = None
+        self.userConnect = client.on_connect        # keep the script's callbacks and call them first
+        self.userDisconnect = client.on_disconnect
+        client.on_connect = self._onConnect
+        client.on_disconnect = self._onDisconnect
+        client.on_socket_open = self._onSocketOpen
+        client.on_socket_close = self._onSocketClose
+        client.on_socket_register_write = self._onSocketRegisterWrite
+        client.on_socket_unregister_write = self._onSocketUnregisterWrite
+
+    def _onConnect(self, client, userdata, flags, rc):
+        if self.userConnect is not None:
+            self.userConnect(client, userdata, flags, rc)
+        self.rc = rc
+        if rc == 0:
+            self.connected.set()
+        else:
+            self.disconnected.set()
+
+    def _onDisconnect(self, client, userdata, rc=0):
+        if self.userDisconnect is not None:
+            self.userDisconnect(client, userdata, rc)
+        self.rc = rc
+        self.connected.clear()
+        self.disconnected.set()
+
+    def _onSocketOpen(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self._misc())
+
+    def _onSocketClose(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def _onSocketRegisterWrite(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _onSocketUnregisterWrite(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc(self):
+        ''' Keepalive pings and retries, what loop_start() does once a second '''
+
+        while self.client.loop_misc() == 0:     # MQTT_ERR_SUCCESS
+            await asyncio.sleep(1)
+
+    async def waitConnected(self):
+        ''' True once connected, False if the broker refused the connection '''
+
+        done, pending = await asyncio.wait([asyncio.ensure_future(self.connected.wait()), asyncio.ensure_future(self.disconnected.wait())], return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return self.connected.is_set()
+
+async def acquire(name, device, period, queue, logger=None):
+    ''' Read device every period seconds and queue (name, time, data) when it returns data '''
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    overruns = 0
+    try:
+        while True:
+            data = await device.getdata()
+            if data is not None:
+                await queue.put((name, time(), dict(data)))   # copy, the driver reuses its dict on the next read
+            deadline += period
+            delay = deadline - loop.time()
+            if delay < 0:
+                overruns += 1
+                if delay < -period:   # more than a full period behind, resync instead of bursting
+                    deadline = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+    finally:
+        if logger is not None:
+            logger.info("{0} acquisition stopped, {1} overruns".format(name, overruns))
+
+async def publish(client, queue, topics, logger=None, encode=json.dumps):
+    ''' Publish queued data on topics[name], as json unless encode is given (ie encodePayload) '''
+
+    while True:
+        name, t, data = await queue.get()
+        payload = encode(data)
+        if logger is not None:
+            logger.debug("{0} {1}".format(topics[name], data))
+        client.publish(topics[name], payload)
+
+async def runAsync(devices, mqtt, topics, period, logger=None, queueSize=100, encode=json.dumps):
+    ''' devices {name: asyncADC}, topics {name: publish topic}. Runs until mqtt disconnects or a task fails '''
+
+    queue = asyncio.Queue(maxsize=queueSize)
+    tasks = [asyncio.ensure_future(acquire(name, device, period, queue, logger)) for name, device in devices.items()]
+    tasks.append(asyncio.ensure_future(publish(mqtt.client, queue, topics, logger, encode)))
+    disconnected = asyncio.ensure_future(mqtt.disconnected.wait())
+    try:
+        done, pending = await asyncio.wait(tasks + [disconnected], return_when=asyncio.FIRST_COMPLETED)
+        if disconnected in done and logger is not None:
+            logger.error("Disconnected result code {0}, stopping".format(mqtt.rc))
+    finally:   # also runs when runAsync() itself is cancelled (ctrl-C with asyncio.run)
+        for task in tasks + [disconnected]:
+            task.cancel()
+        await asyncio.gather(*tasks, disconnected, return_exceptions=True)
+        for device in devices.values():
+            await device.stop()
+    for task in done:
+        if task is not disconnected and not task.cancelled() and task.exception() is not None:
+            raise task.exception()
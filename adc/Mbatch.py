@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+''' Batching mqtt publisher for high rate capture.
+ Instead of one message per getdata() result, readings are collected per topic and sent as one message
+ with a timestamp per sample and one column per channel:
+  {"t": [1700000000.120, 1700000000.130, ...], "a0f": [1.2345, 1.2351, ...], "a1f": [0.51, 0.52, ...]}
+ A channel missing from a reading (changeSet mode) is null in that row so the columns stay aligned.
+
+ A topic's batch is sent when it has maxSamples readings (flush on size), when its oldest reading is
+ maxAge seconds old (flush on age, checked by add() and poll()) and by flush() at shutdown.
+
+ batch = adc.batchPublisher(mqtt_client, maxSamples=50, maxAge=0.5)
+ batch.add(topic, time(), data)    # every reading
+ batch.poll()                      # every loop, sends batches older than maxAge
+ batch.flush()                     # before disconnecting
+'''
+import json
+from time import time
+
+class _batch:
+    def __init__(self, t):
+        self.t0 = t                     # arrival of the first reading, for flush on age
+        self.times = []
+        self.columns = {}
+
+    def add(self, t, data):
+        n = len(self.times)
+        for key, value in data.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = [None] * n    # new channel, earlier rows did not have it
+            column.append(value)
+        self.times.append(round(t, 3))
+        for column in self.columns.values():
+            if len(column) == n:        # channel missing from this reading
+                column.append(None)
+
+    def payload(self):
+        payload = {'t': self.times}
+        payload.update(self.columns)
+        return payload
+
+class batchPublisher:
+    ''' Collects readings per topic and publishes them as one columnar message '''
+
+    def __init__(self, client, maxSamples=50, maxAge=0.5, logger=None, encode=json.dumps, qos=0):
+        self.client = client            # anything with publish(topic, payload, qos), ie paho mqtt.Client
+        self.maxSamples = maxSamples
+        self.maxAge = maxAge
+        self.logger = logger
+        self.encode = encode
+        self.qos = qos
+        self.batches = {}
+        self.messages = 0
+        self.samples = 0
+
+    def add(self, topic, t, data):
+        ''' Add one reading (dict) taken at time t, or a columnar batch with its own 't' list (ie compressor
+        output). Sends the topic's batch when full or too old '''
+
+        if data is None:
+            return
+        batch = self.batches.get(topic)
+        if batch is None:
+            batch = self.batches[topic] = _batch(time())
+        times = data.get('t')
+        if isinstance(times, list):
+            keys = [key for key in data if key != 't']
+            for row, ts in enumerate(times):
+                batch.add(ts, {key: data[key][row] for key in keys if data[key][row] is not None})
+        else:
+            batch.add(t, data)
+        if len(batch.times) >= self.maxSamples or time() - batch.t0 >= self.maxAge:
+            self._send(topic)
+
+    def poll(self):
+        ''' Send every batch whose first reading is older than maxAge '''
+
+        now = time()
+        for topic in [topic for topic, batch in self.batches.items() if now - batch.t0 >= self.maxAge]:
+            self._send(topic)
+
+    def flush(self):
+        ''' Send everything (shutdown) '''
+
+        for topic in list(self.batches):
+            self._send(topic)
+
+    def _send(self, topic):
+        batch = self.batches.pop(topic)
+        payload = self.encode(batch.payload())
+        self.client.publish(topic, payload, self.qos)
+        self.messages += 1
+        self.samples += len(batch.times)
+        if self.logger is not None:
+            self.logger.debug("{0} batch of {1} ({2} bytes)".format(topic, len(batch.times), len(payload)))
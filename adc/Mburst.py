@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+''' Burst capture of raw waveforms (vibration, transients) started by an mqtt command.
+ The normal getdata() path averages and thresholds, a burst keeps every sample: N samples per channel at the
+ fastest rate the backend reads (mcp3008 spidev block transfers of up to 511 conversions, every channel per
+ chunk, ads1115 continuous mode at 860 SPS one channel after the other), no averaging and no threshold.
+
+ Each burst is a .npy file (numpy header + raw channels x samples array) created at full size before the
+ capture and memory mapped, so the driver writes every sample straight into the file (no per sample
+ allocation, the page cache does the disk writes). A .json file next to it and the completion message have
+ the times, sample rate and raw to volt scale.
+  np.load('bursts/mcp3008_20240101-120000.000.npy', mmap_mode='r') * scale   # volts, channels x samples
+
+ Commands arrive on the device's ZCMD topic (nred2pi/<lvl2>ZCMD/burst) with payload {"samples": 10000}
+ (or just 10000) and optionally "device" when several devices share lvl2. on_message only queues the request,
+ the main loop runs it between reads so the bus is not shared with getdata(). A continuous mode sampler thread
+ is paused while its device is captured.
+ Needs numpy, without it the scripts still run and burst commands are logged and rejected. A bus error during
+ a capture is logged and the partial file removed.
+  bursts = adc.burstCapture('bursts', maxSamples=1000000)
+  bursts.request(msg.payload, ['mcp3008'])                  # on_message
+  for device, info in bursts.run(adcSet):                   # main loop
+      mqtt_client.publish('pi2nred/mcp3008/burst', json.dumps(info))
+'''
+import os, json, logging, collections
+from time import time, strftime, localtime
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class burstCapture:
+    ''' Runs queued burst requests on the drivers and saves each one to a memory mapped .npy file '''
+
+    def __init__(self, directory='bursts', maxSamples=1000000, logger=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        self.directory = directory
+        self.maxSamples = maxSamples     # per channel, keeps a typo in the command from filling the sd card
+        self.pending = collections.deque()   # (device, samples), appended by the mqtt thread
+        if np is None:                   # the scripts still run, burst commands are rejected
+            self.logger.warning("Burst capture disabled, it requires numpy (pip3 install numpy)")
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def request(self, payload, devices):
+        ''' Queue a burst from a command payload ({"samples": N, "device": name} or N) on the named devices.
+        devices are the names sharing the command topic, "device" in the payload picks one of them '''
+
+        if np is None:
+            self.logger.error("Burst command {0} rejected, burst capture requires numpy (pip3 install numpy)".format(payload))
+            return
+        try:
+            command = json.loads(payload)
+            if not isinstance(command, dict):
+                command = {'samples': command}
+            samples = int(command.get('samples', 0))
+        except (TypeError, ValueError) as e:
+            self.logger.error("Burst command {0} not understood ({1})".format(payload, e))
+            return
+        if not 0 < samples <= self.maxSamples:
+            self.logger.error("Burst samples must be 1-{0}, got {1}".format(self.maxSamples, samples))
+            return
+        if command.get('device') is not None:
+            devices = [device for device in devices if device == command['device']]
+        for device in devices:
+            self.pending.append((device, samples))
+
+    def run(self, devices):
+        ''' Capture every queued burst. devices is {name: driver} (adcSet). Returns [(name, info), ...] '''
+
+        done = []
+        while self.pending:
+            name, samples = self.pending.popleft()
+            if name not in devices:
+                self.logger.error("Burst requested on unknown device {0}".format(name))
+                continue
+            info = self.capture(name, devices[name], samples)
+            if info is not None:
+                done.append((name, info))
+        return done
+
+    def capture(self, name, device, samples):
+        ''' Capture samples per channel from device into <directory>/<name>_<time>.npy. Returns the info dict,
+        None if the capture failed (the file is removed) '''
+
+        if not hasattr(device, 'burst'):
+            self.logger.error("{0} does not support burst capture".format(name))
+            return None
+        now = time()
+        stamp = strftime('%Y%m%d-%H%M%S', localtime(now)) + '.{0:03d}'.format(int(now * 1000) % 1000)
+        filename = os.path.join(self.directory, '{0}_{1}.npy'.format(name, stamp))
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=device.rawType, shape=(device.numOfChannels, samples))
+        sampler = getattr(device, 'sampler', None)
+        self.logger.info("Burst of {0} samples x {1} channels on {2}".format(samples, device.numOfChannels, name))
+        try:
+            if sampler is not None:
+                with sampler.lock:      # pause the continuous mode sampler thread
+                    times = device.burst(out)
+            else:
+                times = device.burst(out)
+        except OSError as e:            # I2C/SPI error, the main loop keeps running
+            del out
+            os.remove(filename)         # no half written capture left behind
+            self.logger.error("Burst on {0} failed: {1}".format(name, e))
+            return None
+        out.flush()
+        del out                     # unmap
+        info = {'file': os.path.abspath(filename),
+                'device': name,
+                'channels': device.numOfChannels,
+                'samples': samples,
+                'dtype': device.rawType,
+                'scale': device.rawScale,    # volts per count
+                'start': round(times[0][0], 6),
+                'seconds': round(times[-1][1] - times[0][0], 6),
+                'times': [[round(t0, 6), round(t1, 6)] for t0, t1 in times],
+                'sps': [round(samples / (t1 - t0), 1) if t1 > t0 else 0 for t0, t1 in times]}
+        with open(filename[:-4] + '.json', 'w') as f:
+            json.dump(info, f)
+        self.logger.info("Burst saved to {0} ({1} SPS per channel)".format(filename, info['sps']))
+        return info
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+''' Shared I2C bus and multi ADS1115 scheduling.
+ sharedI2C() hands out one busio.I2C per physical bus (per SCL/SDA pin pair). Every ads1115 on that bus uses
+ the same object, and adafruit I2CDevice locks it around each transaction so devices on different threads
+ do not interleave.
+
+ ads1115Group runs up to 4 ADS1115 (0x48-0x4B) on one bus as one device. For each channel it starts a
+ single-shot conversion on every chip, waits one conversion time, then reads every chip. The conversions
+ overlap, so 4 chips cost about the same bus time as 1 chip plus the extra i2c reads.
+ getdata() returns all channels keyed a0f..a15f (chip order x channel) using the same noise threshold /
+ max interval rules as ads1115.
+'''
+import logging, sys, threading
+from time import time, sleep, perf_counter
+from .MadsContinuous import REG_CONVERSION, REG_CONFIG, PGA_BITS, DR_BITS, MODE_SINGLE
+
+CONFIG_POINTER = bytes([REG_CONFIG])          # register pointer writes, built once
+CONVERSION_POINTER = bytes([REG_CONVERSION])
+
+_buses = {}
+_busesLock = threading.Lock()
+
+def sharedI2C(scl=None, sda=None):
+    ''' One busio.I2C per SCL/SDA pair (default board.SCL/board.SDA, i2c-1 on the Pi) '''
+
+    import busio, board
+    scl = board.SCL if scl is None else scl
+    sda = board.SDA if sda is None else sda
+    with _busesLock:
+        if (scl, sda) not in _buses:
+            _buses[(scl, sda)] = busio.I2C(scl, sda)
+        return _buses[(scl, sda)]
+
+class adsChip:
+    ''' Register level single-shot conversions on one ADS1115, split into start() and read() so conversions on
+    several chips can run at the same time '''
+
+    def __init__(self, i2cDevice, gain=1, datarate=860):
+        self.i2c = i2cDevice
+        self.config = PGA_BITS[gain] | MODE_SINGLE | DR_BITS[datarate] | 0x0003   # comparator off
+        self.period = 1 / datarate
+        self.timeout = 4 * self.period + 0.005   # OS bit poll limit past the conversion time (plus i2c reads)
+        self.done = 0.0
+        self.buf = bytearray(3)
+        self.rbuf = bytearray(2)
+
+    def start(self, channel):
+        ''' Start a single-shot conversion on single ended input channel (0-3) '''
+
+        config = 0x8000 | 0x4000 | (channel << 12) | self.config
+        self.buf[0] = REG_CONFIG
+        self.buf[1] = config >> 8
+        self.buf[2] = config & 0xFF
+        with self.i2c as i2c:
+            i2c.write(self.buf)
+        self.done = perf_counter() + self.period
+
+    def read(self):
+        ''' Wait for the conversion started by start() and return it (signed 16 bit). OSError if the chip does
+        not finish within a few conversion times (wrong address, glitch), so the shared bus is not held forever '''
+
+        wait = self.done - perf_counter()
+        if wait > 0:
+            sleep(wait)
+        deadline = self.done + self.timeout
+        with self.i2c as i2c:
+            while True:   # OS bit reads 1 when the conversion is finished
+                i2c.write_then_readinto(CONFIG_POINTER, self.rbuf)
+                if self.rbuf[0] & 0x80:
+                    break
+                if perf_counter() > deadline:
+                    raise OSError("ADS1115 {0} conversion did not finish".format(hex(getattr(self.i2c, 'device_address', 0))))
+            i2c.write_then_readinto(CONVERSION_POINTER, self.rbuf)
+        value = (self.rbuf[0] << 8) | self.rbuf[1]
+        return value - 65536 if value & 0x8000 else value
+
+class ads1115Group:
+    ''' Several ADS1115 on one I2C bus read as a single device. Returns a dict with the voltage of every channel '''
+
+    def __init__(self, addresses=(0x48, 0x49, 0x4A, 0x4B), numOfChannels=4, noiseThreshold=0.001, maxInterval=1, usergain=1, logger=None, datarate=860, numOfSamples=10, backend='adafruit', sims=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        if datarate not in DR_BITS:
+            self.logger.error("datarate must be one of {0}".format(sorted(DR_BITS)))
+            sys.exit()
+        if backend == 'sim':
+            from .Msimulate import simADS1115
+            self.sims = sims if sims is not None else [simADS1115(gain=usergain, datarate=datarate) for x in addresses]
+            self.chips = [sim.chip() for sim in self.sims]
+        elif backend == 'adafruit':
+            from adafruit_bus_device.i2c_device import I2CDevice
+            i2c = sharedI2C()
+            self.chips = [adsChip(I2CDevice(i2c, address), usergain, datarate) for address in addresses]
+        else:
+            self.logger.error("Backend must be 'adafruit' or 'sim'")
+            sys.exit()
+        self.logger.info("ADS1115 group at {0} on one I2C bus, {1} SPS".format([hex(a) for a in addresses], datarate))
+        self.bus = 'i2c1'
+        self.numOfChips = len(self.chips)
+        self.numOfChannels = numOfChannels       # per chip
+        self.numOfSamples = numOfSamples
+        self.noiseThreshold = noiseThreshold
+        self.maxInterval = maxInterval
+        self.scale = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}[usergain] / 32767
+        total = self.numOfChips * self.numOfChannels
+        self.keys = ['a' + str(x) + 'f' for x in range(total)]
+        self.sensor = [[0 for i in range(self.numOfSamples)] for x in range(total)]
+        self.sensorLastRead = [0.0 for x in range(total)]
+        self.adc = {}
+        self._sample()
+        for x in range(total): # initialize the first read for comparison later
+            self.sensorLastRead[x] = sum(self.sensor[x]) / self.numOfSamples * self.scale
+        self.time0 = time()
+        self.stopped = False
+
+    def _sample(self):
+        ''' numOfSamples conversions of every channel on every chip, conversions overlapped across chips '''
+
+        for i in range(self.numOfSamples):
+            for channel in range(self.numOfChannels):
+                for chip in self.chips:
+                    chip.start(channel)
+                for c, chip in enumerate(self.chips):
+                    self.sensor[c * self.numOfChannels + channel][i] = chip.read()
+
+    def getdata(self):
+        ''' If any channel is above noise threshold or time limit exceeded will return voltage of every channel '''
+
+        if self.stopped:
+            return None
+        timelimit = time() - self.time0 > self.maxInterval
+        changed = False
+        self._sample()
+        for x, key in enumerate(self.keys):
+            value = sum(self.sensor[x]) / self.numOfSamples * self.scale
+            if abs(value - self.sensorLastRead[x]) > self.noiseThreshold:
+                changed = True
+            self.sensorLastRead[x] = value
+            self.adc[key] = value
+        if changed or timelimit:
+            self.time0 = time()
+            return self.adc
+
+    def stop(self):
+        ''' Stop reading: getdata() returns None afterwards and the chips are left idle (single-shot mode powers
+        down after each conversion). The shared I2C bus stays open for the other devices on it '''
+
+        self.stopped = True
+        self.logger.info("ADS1115 group stopped")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+''' Per channel calibration of the raw to volt conversion (offset, gain and nonlinearity, a vref that is not
+ exactly 3.3/5V). Corrections are kept in a json file keyed by device and address, like MnoiseFloor.py
+  {"mcp3008-cs8": {"0": {"kind": "linear", "points": [[0.012, 0.0], [1.641, 1.65], [3.271, 3.3]]},
+                   "1": {"kind": "poly", "coeffs": [0.0021, 1.0113, -0.0008]}}}
+  points are [reading, reference] pairs: piecewise linear between them, extended past the first and last
+  (one point is an offset only correction)
+  coeffs are np.polyfit coefficients (highest power first) from reading to reference
+
+ At start every channel's correction is compiled into the same form, straight line segments (a polynomial
+ is sampled into segments pieces over the input range), so the driver applies them to all channels at
+ once with a few numpy operations in getdata(). Channels without a correction are left as they are.
+  adc = mcp3008(2, 3.3, 400, 1, 8, calibration=calibration('calibration.json', 'mcp3008-cs8'))
+
+ Guided capture (numpy needed): the routine asks for a reference voltage on the inputs (measured with a
+ meter), averages samples raw readings per channel with the driver's burst() and repeats until a blank
+ line. The fit (linear points or a degree polynomial) is saved for the device key.
+  $ python3 -c "import adc; adc.guidedCalibration(adc.mcp3008(2, 3.3, 400, 1, 8), 'calibration.json', 'mcp3008-cs8')"
+'''
+import json, os
+from bisect import bisect_right
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class calibration:
+    ''' Corrections of one device from the calibration file, compiled to line segments per channel '''
+
+    def __init__(self, path='calibration.json', key='adc', segments=64, logger=None):
+        self.path = path
+        self.key = key
+        self.segments = segments    # pieces a polynomial is sampled into
+        self.logger = logger
+        self.channels = {}          # {channel: {"kind": ..., "points"/"coeffs": ...}} as in the file
+        self.numOfChannels = None
+        self.inputRange = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f).get(self.key, {})
+        except (OSError, ValueError):
+            saved = {}
+        self.channels = {int(x): entry for x, entry in saved.items()}
+        if self.logger is not None:
+            self.logger.info("Calibration {0}: channels {1} from {2}".format(self.key, sorted(self.channels), self.path))
+        if self.numOfChannels is not None:
+            self.setup(self.numOfChannels, self.inputRange)
+
+    def save(self):
+        ''' Write this device's corrections, keeping the other devices in the file '''
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        saved[self.key] = {str(x): entry for x, entry in sorted(self.channels.items())}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(saved, f, indent=1)
+        os.replace(tmp, self.path)   # atomic, a crash while saving keeps the old file
+
+    def set(self, x, points, kind='linear', degree=1):
+        ''' Correction of channel x from [[reading, reference], ...]. kind 'linear' (piecewise) or 'poly' '''
+
+        points = sorted([float(reading), float(reference)] for reading, reference in points)
+        if kind == 'poly':
+            if np is None:
+                raise RuntimeError("poly calibration needs numpy (pip3 install numpy)")
+            if len(points) <= degree:
+                raise ValueError("poly of degree {0} needs at least {1} points".format(degree, degree + 1))
+            coeffs = np.polyfit([p[0] for p in points], [p[1] for p in points], degree)
+            self.channels[x] = {'kind': 'poly', 'coeffs': [float(c) for c in coeffs], 'points': points}
+        else:
+            if not points:
+                raise ValueError("linear calibration needs at least 1 point")
+            self.channels[x] = {'kind': 'linear', 'points': points}
+        if self.numOfChannels is not None:
+            self.setup(self.numOfChannels, self.inputRange)
+
+    def _segments(self, entry, inputRange):
+        ''' (bounds, slopes, intercepts) of one channel. Segment i is used from bounds[i-1] up to bounds[i] '''
+
+        if entry['kind'] == 'poly':
+            low, high = inputRange
+            xs = [low + (high - low) * k / self.segments for k in range(self.segments + 1)]
+            points = [[x, sum(c * x ** p for p, c in enumerate(reversed(entry['coeffs'])))] for x in xs]
+        else:
+            points = entry['points']
+        if len(points) == 1:                # offset only
+            return [], [1.0], [points[0][1] - points[0][0]]
+        slopes, intercepts = [], []
+        for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+            slope = (y1 - y0) / (x1 - x0) if x1 != x0 else 1.0
+            slopes.append(slope)
+            intercepts.append(y0 - slope * x0)
+        return [p[0] for p in points[1:-1]], slopes, intercepts
+
+    def setup(self, numOfChannels, inputRange):
+        ''' Called by the driver. Compiles the corrections for numOfChannels over inputRange (low, high volts) '''
+
+        self.numOfChannels = numOfChannels
+        self.inputRange = inputRange
+        compiled = [self._segments(self.channels[x], inputRange) if x in self.channels else ([], [1.0], [0.0]) for x in range(numOfChannels)]
+        self.bounds = [c[0] for c in compiled]        # list form for correct()
+        self.slopes = [c[1] for c in compiled]
+        self.intercepts = [c[2] for c in compiled]
+        if np is not None:                             # padded (channels x segments) arrays for apply()
+            width = max(len(s) for s in self.slopes)
+            self.boundsArray = np.full((numOfChannels, max(width - 1, 1)), np.inf)
+            self.slopeArray = np.ones((numOfChannels, width))
+            self.interceptArray = np.zeros((numOfChannels, width))
+            for x in range(numOfChannels):
+                self.boundsArray[x, :len(self.bounds[x])] = self.bounds[x]
+                self.slopeArray[x, :len(self.slopes[x])] = self.slopes[x]
+                self.interceptArray[x, :len(self.intercepts[x])] = self.intercepts[x]
+            self.rows = np.arange(numOfChannels)
+            self.segment = np.zeros(numOfChannels, dtype=np.intp)
+
+    def apply(self, volts, out):
+        ''' Corrected volts of every channel into out (numpy arrays, one value per channel) '''
+
+        np.sum(volts[:, None] >= self.boundsArray, axis=1, out=self.segment)
+        np.multiply(volts, self.slopeArray[self.rows, self.segment], out=out)
+        out += self.interceptArray[self.rows, self.segment]
+
+    def correct(self, x, volts):
+        ''' Corrected volts of channel x (list path) '''
+
+        i = bisect_right(self.bounds[x], volts)
+        return volts * self.slopes[x][i] + self.intercepts[x][i]
+
+def guidedCalibration(device, path='calibration.json', key='adc', kind='linear', degree=1, samples=200, channels=None, ask=input):
+    ''' Interactive multi-point calibration of device (mcp3008 or ads1115), saved to path under key '''
+
+    if np is None:
+        raise RuntimeError("guidedCalibration needs numpy (pip3 install numpy)")
+    channels = list(range(device.numOfChannels)) if channels is None else channels
+    cal = calibration(path, key)
+    points = {x: [] for x in channels}
+    out = np.zeros((device.numOfChannels, samples), dtype=device.rawType)
+    print("Calibrating {0} channels {1} of {2}".format(key, channels, path))
+    while True:
+        text = ask("Apply a reference to channels {0}, enter its measured volts (blank to finish): ".format(channels)).strip()
+        if not text:
+            break
+        try:
+            reference = float(text)
+        except ValueError:
+            print("Not a number: {0}".format(text))
+            continue
+        device.burst(out)     # raw samples, no averaging/threshold/calibration
+        readings = out.mean(axis=1) * device.rawScale
+        for x in channels:
+            points[x].append([float(readings[x]), reference])
+            print("  a{0}: read {1:.5f} V, reference {2:.5f} V, error {3:+.5f} V".format(x, readings[x], reference, readings[x] - reference))
+    for x in channels:
+        if points[x]:
+            cal.set(x, points[x], kind, degree)
+    cal.save()
+    print("Saved {0} calibration for channels {1}".format(key, [x for x in channels if points[x]]))
+    return cal
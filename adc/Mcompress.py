@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+''' Swinging door compression of the readings before they are published (historian style).
+ Only the points needed to redraw each channel within +/- deviation are kept. Every kept point has the
+ time it was read, and drawing straight lines between kept points reproduces every dropped reading to
+ within deviation. A slow ramp (thermistor warming) becomes a handful of points instead of one message
+ per threshold step.
+
+ swingingDoor(deviation, maxInterval) - one channel. update(t, value) returns the points to keep
+ compressor(deviation, maxInterval)   - every channel of a device. deviation is one value or {key: deviation}
+                                        update(t, data) returns a columnar batch or None
+ The kept points are returned in the same columnar shape as Mbatch.py, {"t": [...], "a0f": [...], ...}, so
+ json, encodePayload and the node-red flow take them as they are. Channels keep points at different times,
+ a row has None for the channels that did not keep a point at its time.
+
+ The compressor needs every reading, so create the driver with maxInterval=0 (getdata() then returns each
+ call) and pass the time the reading was taken.
+ cmp = adc.compressor(0.002, 60)         # +/- 2mV, keep at least one point a minute
+ points = cmp.update(time(), ads.getdata())
+ flush() returns the last reading of each channel as a batch (call before shutting down)
+
+ The door is the range of slopes from the last kept point that pass within deviation of every reading
+ since. Each reading narrows it. The newest reading is held back and only kept when the line to the next
+ reading no longer fits through the door, so the error bound holds for every dropped reading.
+'''
+
+class swingingDoor:
+    ''' Swinging door compression of one channel '''
+
+    def __init__(self, deviation, maxInterval=None):
+        self.deviation = deviation
+        self.maxInterval = maxInterval   # keep a point at least this often (seconds), None for no limit
+        self.archived = None             # (t, value) of the last kept point
+        self.held = None                 # newest reading, not kept yet
+        self.lo = float('-inf')          # door: slopes that fit every reading since the kept point
+        self.hi = float('inf')
+
+    def update(self, t, value):
+        ''' Returns a list with the points to keep (empty most of the time) '''
+
+        if self.archived is None:
+            self.archived = (t, value)
+            return [(t, value)]
+        ta, va = self.archived
+        if t <= ta or (self.held is not None and t <= self.held[0]):
+            return []                    # out of order or repeated time
+        if self.held is None:
+            self.held = (t, value)
+            return []
+        tp, vp = self.held
+        dt = tp - ta
+        self.lo = max(self.lo, (vp - va - self.deviation) / dt)   # held reading becomes one the line has to pass
+        self.hi = min(self.hi, (vp - va + self.deviation) / dt)
+        slope = (value - va) / (t - ta)
+        if self.lo <= slope <= self.hi and (self.maxInterval is None or t - ta <= self.maxInterval):
+            self.held = (t, value)
+            return []
+        self.archived = self.held        # door closed, keep the held reading and start a new door from it
+        self.held = (t, value)
+        self.lo = float('-inf')
+        self.hi = float('inf')
+        return [self.archived]
+
+    def flush(self):
+        ''' Keep the held reading (end of data) '''
+
+        if self.held is None:
+            return []
+        self.archived = self.held
+        self.held = None
+        self.lo = float('-inf')
+        self.hi = float('inf')
+        return [self.archived]
+
+def _columns(points):
+    ''' {key: [(t, value), ...]} to {"t": [...], key: [...]} with None where a key has no point at a time '''
+
+    times = sorted({t for kept in points.values() for t, value in kept})
+    row = {t: i for i, t in enumerate(times)}
+    batch = {'t': [round(t, 3) for t in times]}
+    for key, kept in points.items():
+        column = batch[key] = [None] * len(times)
+        for t, value in kept:
+            column[row[t]] = value
+    return batch
+
+class compressor:
+    ''' One swingingDoor per key of the driver's data dict '''
+
+    def __init__(self, deviation, maxInterval=None):
+        self.deviation = deviation
+        self.maxInterval = maxInterval
+        self.doors = {}
+        self.count = 0   # readings in
+        self.kept = 0    # points out
+
+    def _door(self, key):
+        if key not in self.doors:
+            deviation = self.deviation[key] if isinstance(self.deviation, dict) else self.deviation
+            self.doors[key] = swingingDoor(deviation, self.maxInterval)
+        return self.doors[key]
+
+    def update(self, t, data):
+        ''' Feed one reading of every channel. Returns the kept points as {"t": [...], key: [...]}, None if none '''
+
+        if data is None:
+            return None
+        points = {}
+        for key, value in data.items():
+            self.count += 1
+            kept = self._door(key).update(t, value)
+            if kept:
+                points[key] = kept
+                self.kept += len(kept)
+        return _columns(points) if points else None
+
+    def flush(self):
+        ''' The held reading of every channel as a batch, None if none '''
+
+        points = {}
+        for key, door in self.doors.items():
+            kept = door.flush()
+            if kept:
+                points[key] = kept
+                self.kept += len(kept)
+        return _columns(points) if points else None
+
+    def ratio(self):
+        ''' Readings in per point kept '''
+
+        return self.count / self.kept if self.kept else 0.0
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+''' Devices, topics and mqtt settings from a config file instead of editing the HARDWARE/MQTT SETUP sections.
+ JSON (.json), TOML (.toml, python 3.11 tomllib or pip3 install tomli) or YAML (.yaml/.yml, pip3 install pyyaml),
+ same structure in every format (see adcConfig.toml):
+
+  [mqtt]          server, port (1883), clientId ('pi'), credentials (file with user and password lines,
+                  default ~/stem) or user/password, subLvl1 ('nred2' + clientId), pubLvl1 ('pi2nred')
+  [loop]          interval (0.5 s), workers (false, true for one process per bus group),
+                  outbox (SQLite file for store and forward, optional), encode ('json' or 'binary')
+  [devices.NAME]  type        'mcp3008', 'ads1115' or 'mcp3008Array'
+                  lvl2        topic level 2 (default NAME), publvl3 is appended to clientId for level 3
+                  channels    number of channels (per chip for mcp3008Array), required
+                  vref        mcp3008 reference voltage, required for mcp3008
+                  noiseThreshold, maxInterval   number or one per channel (number only for mcp3008Array)
+                  cs                            mcp3008 chip select GPIO (chipSelects list for mcp3008Array)
+                  gain, address                 ads1115
+                  filters     mcp3008/ads1115 {channel: [[stage, args...], ...]} ie {"0": [["ema", 0.5]], "1": [["median", 5], ["cic", 50, 2]]}
+                  noiseFloor  mcp3008/ads1115 noiseFloor() arguments ({k=4, path="noise.json"}), key defaults to NAME
+                  calibration mcp3008/ads1115 calibration file (Mcalibration.py), key is NAME
+                  any other driver argument (rate, useNumpy, numOfSamples, backend, changeSet, continuous, ...)
+
+ Everything is checked before any device is opened and every problem is logged, then the script exits.
+ config = adc.loadConfig('adcConfig.toml', logger)
+ adcSet = adc.buildDevices(config, logger)          # {name: driver}
+ deviceD, subTopics = adc.buildTopics(config)       # same deviceD as demoMQTT.setup_device
+
+ workers = adc.busWorkers(config, logger)           # optional, one process per bus group (all cores)
+ for t, frame in workers.read(timeout):             # frames the workers read since the last call
+'''
+import json, logging, sys, os, inspect
+import multiprocessing as mp
+from queue import Empty
+from .MadcMCP3008_8CH import mcp3008, CS_MAP
+from .MadcMCP3008_Array import mcp3008Array
+from .MadcADS1115_4CH import ads1115, PGA_RANGE
+from .Mfilters import filterChain, movingAverage, ema, median, cic
+from .MnoiseFloor import noiseFloor
+from .Mcalibration import calibration
+from .Mcycle import cycleExecutor
+from .Mscheduler import ticker
+
+MQTT_KEYS = {'server', 'port', 'clientId', 'credentials', 'user', 'password', 'subLvl1', 'pubLvl1'}
+LOOP_KEYS = {'interval', 'workers', 'outbox', 'encode'}
+DRIVERS = {'mcp3008': mcp3008, 'ads1115': ads1115, 'mcp3008Array': mcp3008Array}
+MAX_CHANNELS = {'mcp3008': 8, 'ads1115': 4, 'mcp3008Array': 8}
+STAGES = {'movingAverage': movingAverage, 'ema': ema, 'median': median, 'cic': cic}
+# config key: driver argument, set from the config instead of passed through
+NAMED = {'mcp3008': {'channels': 'numOfChannels', 'vref': 'vref', 'noiseThreshold': 'noiseThreshold', 'maxInterval': 'maxInterval', 'cs': 'cs'},
+         'ads1115': {'channels': 'numOfChannels', 'noiseThreshold': 'noiseThreshold', 'maxInterval': 'maxInterval', 'gain': 'usergain', 'address': 'useraddress'},
+         'mcp3008Array': {'channels': 'numOfChannels', 'vref': 'vref', 'noiseThreshold': 'noiseThreshold', 'maxInterval': 'maxInterval', 'chipSelects': 'chipSelects'}}
+REQUIRED = {'mcp3008': ('channels', 'vref'), 'ads1115': ('channels',), 'mcp3008Array': ('channels',)}
+COMMON = {'type', 'lvl2', 'publvl3'}
+OBJECTS = {'filters': 'filters', 'noiseFloor': 'autoThreshold', 'calibration': 'calibration'}   # config key: driver argument built from it
+PER_CHANNEL = {'mcp3008', 'ads1115'}     # drivers that take one noiseThreshold/maxInterval per channel
+NOT_CONFIGURABLE = {'logger', 'sim', 'sims', 'filters', 'autoThreshold', 'calibration'}   # objects built from the sections above
+
+def _logger(logger):
+    if logger is not None:                        # Use logger passed as argument
+        return logger
+    if len(logging.getLogger().handlers) == 0:     # Root logger does not exist and no custom logger passed
+        logging.basicConfig(level=logging.INFO)      # Create root logger
+    return logging.getLogger(__name__)             # Create from root logger
+
+def readConfig(path):
+    ''' Parse the file by its extension, no checks '''
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib       # python < 3.11
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if ext in ('.yaml', '.yml'):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f)
+    with open(path) as f:
+        return json.load(f)
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _perChannel(errors, where, name, value, channels):
+    if isinstance(value, list):
+        if len(value) != channels or not all(_number(v) for v in value):
+            errors.append("{0}: {1} needs one number per channel ({2})".format(where, name, channels))
+    elif not _number(value):
+        errors.append("{0}: {1} must be a number or a list".format(where, name))
+
+def _bus(dtype, device):
+    ''' Physical buses of a device from its config (same names as the drivers' bus attribute) '''
+
+    if dtype == 'ads1115':
+        return {'i2c1'}
+    if dtype == 'mcp3008':
+        return {'spi' + str(CS_MAP[device.get('cs', 8)][0])}
+    return {'spi' + str(CS_MAP[cs][0]) for cs in device.get('chipSelects', (8, 7, 18, 17, 16))}
+
+def _supports(dtype, key):
+    ''' True if the driver takes the object built from config key (filters, noiseFloor, calibration) '''
+
+    return OBJECTS[key] in inspect.signature(DRIVERS[dtype]).parameters
+
+def _filters(errors, where, filters, total):
+    if not isinstance(filters, dict):
+        errors.append("{0}: filters must be a table {{channel: [[stage, args...], ...]}}".format(where))
+        return
+    for x, stages in filters.items():
+        if not str(x).isdigit() or int(x) >= total:
+            errors.append("{0}: filters channel {1} does not exist".format(where, x))
+        if not isinstance(stages, list):
+            errors.append("{0}: filters channel {1} must be a list of [stage, args...]".format(where, x))
+            continue
+        for stage in stages:
+            if not isinstance(stage, list) or not stage or stage[0] not in STAGES:
+                errors.append("{0}: filter stage {1} must be [name, args...] with name one of {2}".format(where, stage, sorted(STAGES)))
+                continue
+            try:
+                inspect.signature(STAGES[stage[0]]).bind(*stage[1:])
+            except TypeError as e:
+                errors.append("{0}: filter stage {1}: {2}".format(where, stage, e))
+
+def _noiseFloor(errors, where, settings):
+    if not isinstance(settings, dict):
+        errors.append("{0}: noiseFloor must be a table of noiseFloor() arguments".format(where))
+        return
+    allowed = set(inspect.signature(noiseFloor).parameters) - {'logger'}
+    for key in settings:
+        if key not in allowed:
+            errors.append("{0}: unknown noiseFloor setting '{1}' (one of {2})".format(where, key, sorted(allowed)))
+
+def _address(value):
+    return int(value, 0) if isinstance(value, str) else value   # "0x48" in json/yaml
+
+def validateConfig(config):
+    ''' List of every problem found in the config (empty if it is fine) '''
+
+    errors = []
+    if not isinstance(config, dict):
+        return ["config must be a table/object"]
+    for section in config:
+        if section not in ('mqtt', 'loop', 'devices'):
+            errors.append("unknown section [{0}]".format(section))
+    for section, allowed in (('mqtt', MQTT_KEYS), ('loop', LOOP_KEYS)):
+        if not isinstance(config.get(section, {}), dict):
+            errors.append("[{0}] must be a table/object".format(section))
+            return errors
+        for key in config.get(section, {}):
+            if key not in allowed:
+                errors.append("[{0}] unknown setting '{1}' (one of {2})".format(section, key, sorted(allowed)))
+    mqttConfig = config.get('mqtt', {})
+    if not mqttConfig.get('server'):
+        errors.append("[mqtt] server is required")
+    if 'port' in mqttConfig and not isinstance(mqttConfig['port'], int):
+        errors.append("[mqtt] port must be an integer")
+    loop = config.get('loop', {})
+    if 'interval' in loop and not (_number(loop['interval']) and loop['interval'] > 0):
+        errors.append("[loop] interval must be a positive number of seconds")
+    if loop.get('encode', 'json') not in ('json', 'binary'):
+        errors.append("[loop] encode must be 'json' or 'binary'")
+    devices = config.get('devices')
+    if not isinstance(devices, dict) or not devices:
+        errors.append("[devices] needs at least one device")
+        return errors
+    used = {}    # chip select / i2c address: device, two devices can not share one
+    for name, device in devices.items():
+        where = "[devices.{0}]".format(name)
+        if not isinstance(device, dict):
+            errors.append("{0}: must be a table/object".format(where))
+            continue
+        dtype = device.get('type')
+        if dtype not in DRIVERS:
+            errors.append("{0}: type must be one of {1}".format(where, sorted(DRIVERS)))
+            continue
+        allowed = set(inspect.signature(DRIVERS[dtype]).parameters) - set(NAMED[dtype].values()) - NOT_CONFIGURABLE
+        for key in device:
+            if key in OBJECTS:
+                if not _supports(dtype, key):
+                    errors.append("{0}: {1} is not supported by {2}".format(where, key, dtype))
+            elif key not in COMMON and key not in NAMED[dtype] and key not in allowed:
+                errors.append("{0}: unknown setting '{1}'".format(where, key))
+        for key in REQUIRED[dtype]:
+            if key not in device:
+                errors.append("{0}: {1} is required".format(where, key))
+        channels = device.get('channels')
+        if not isinstance(channels, int) or not 1 <= channels <= MAX_CHANNELS[dtype]:
+            errors.append("{0}: channels must be 1-{1}".format(where, MAX_CHANNELS[dtype]))
+            continue
+        total = channels * len(device.get('chipSelects', (8, 7, 18, 17, 16))) if dtype == 'mcp3008Array' else channels
+        for key in ('noiseThreshold', 'maxInterval'):
+            if key in device:
+                if dtype in PER_CHANNEL:
+                    _perChannel(errors, where, key, device[key], channels)
+                elif not _number(device[key]):
+                    errors.append("{0}: {1} must be a number for {2}".format(where, key, dtype))
+        if 'vref' in device and not (_number(device['vref']) and device['vref'] > 0):
+            errors.append("{0}: vref must be a positive number".format(where))
+        if dtype == 'ads1115':
+            if device.get('gain', 1) not in PGA_RANGE:
+                errors.append("{0}: gain must be one of 2/3, 1, 2, 4, 8, 16".format(where))
+            try:
+                address = _address(device.get('address', 0x48))
+            except ValueError:
+                address = None
+            if address not in (0x48, 0x49, 0x4A, 0x4B):
+                errors.append("{0}: address must be 0x48-0x4B".format(where))
+            claims = [('i2c', address)]
+        else:
+            chipSelects = [device.get('cs', 8)] if dtype == 'mcp3008' else list(device.get('chipSelects', (8, 7, 18, 17, 16)))
+            bad = [cs for cs in chipSelects if cs not in CS_MAP]
+            if bad:
+                errors.append("{0}: chip select {1} must be 8, 7 (SPI0) or 18, 17, 16 (SPI1)".format(where, bad))
+            claims = [('cs', cs) for cs in chipSelects]
+        if device.get('backend') != 'sim':
+            for claim in claims:
+                if claim in used:
+                    errors.append("{0}: {1} {2} already used by {3}".format(where, claim[0], claim[1], used[claim]))
+                used[claim] = name
+        if 'filters' in device and _supports(dtype, 'filters'):
+            _filters(errors, where, device['filters'], total)
+        if 'noiseFloor' in device and _supports(dtype, 'noiseFloor'):
+            _noiseFloor(errors, where, device['noiseFloor'])
+        if 'calibration' in device and not isinstance(device['calibration'], str):
+            errors.append("{0}: calibration must be a file name".format(where))
+        for key in ('rate', 'bufferSize', 'numOfSamples'):
+            if key in device and not (_number(device[key]) and device[key] >= 0):
+                errors.append("{0}: {1} must be a number >= 0".format(where, key))
+        if (device.get('rate') or device.get('continuous')) and _number(device.get('bufferSize', 1000)) and _number(device.get('numOfSamples', 10)):
+            if device.get('bufferSize', 1000) <= device.get('numOfSamples', 10):
+                errors.append("{0}: bufferSize must be larger than numOfSamples".format(where))
+    return errors
+
+def loadConfig(path, logger=None):
+    ''' Read and validate the config file. Logs every problem and exits if there are any '''
+
+    logger = _logger(logger)
+    try:
+        config = readConfig(path)
+    except ImportError as e:
+        logger.error("{0} needs {1} (pip3 install {2})".format(path, e.name, 'pyyaml' if e.name == 'yaml' else e.name))
+        sys.exit()
+    except (OSError, ValueError) as e:
+        logger.error("Can not read config {0}: {1}".format(path, e))
+        sys.exit()
+    errors = validateConfig(config)
+    for error in errors:
+        logger.error("{0}: {1}".format(path, error))
+    if errors:
+        sys.exit()
+    logger.info("Config {0}: {1} devices".format(path, len(config['devices'])))
+    return config
+
+def buildDevice(name, device, logger=None):
+    ''' Create the driver of one [devices.NAME] section '''
+
+    dtype = device['type']
+    kwargs = {NAMED[dtype][key]: value for key, value in device.items() if key in NAMED[dtype]}
+    kwargs.update({key: value for key, value in device.items() if key not in COMMON and key not in OBJECTS and key not in NAMED[dtype]})
+    if 'useraddress' in kwargs:
+        kwargs['useraddress'] = _address(kwargs['useraddress'])
+    if 'filters' in device:
+        kwargs['filters'] = {int(x): filterChain(*[STAGES[stage[0]](*stage[1:]) for stage in stages]) for x, stages in device['filters'].items()}
+    if 'noiseFloor' in device:
+        kwargs['autoThreshold'] = noiseFloor(**dict({'key': name, 'logger': logger}, **device['noiseFloor']))
+    if 'calibration' in device:
+        kwargs['calibration'] = calibration(device['calibration'], name, logger=logger)
+    return DRIVERS[dtype](logger=logger, **kwargs)
+
+def buildDevices(config, logger=None, names=None):
+    ''' {name: driver} (adcSet) for every device in the config, or only names '''
+
+    return {name: buildDevice(name, device, logger) for name, device in config['devices'].items() if names is None or name in names}
+
+def deviceKeys(device):
+    ''' Data keys the driver returns (a0f, a1f, ...) '''
+
+    channels = device['channels']
+    if device['type'] == 'mcp3008Array':
+        channels *= len(device.get('chipSelects', (8, 7, 18, 17, 16)))
+    return ['a' + str(x) + 'f' for x in range(channels)]
+
+def buildTopics(config):
+    ''' (deviceD, subscribe topics) with the same topics and fields demoMQTT.setup_device creates '''
+
+    mqttConfig = config['mqtt']
+    clientId = mqttConfig.get('clientId', 'pi')
+    subLvl1 = mqttConfig.get('subLvl1', 'nred2' + clientId)
+    pubLvl1 = mqttConfig.get('pubLvl1', 'pi2nred')
+    deviceD = {}
+    subTopics = []
+    for name, device in config['devices'].items():
+        lvl2 = device.get('lvl2', name)
+        topic = "{0}/{1}ZCMD/+".format(subLvl1, lvl2)
+        if topic not in subTopics:
+            subTopics.append(topic)
+        deviceD[name] = {'data': {key: 0 for key in deviceKeys(device)},
+                         'lvl2': lvl2,
+                         'pubtopic': "{0}/{1}/{2}{3}".format(pubLvl1, lvl2, clientId, device.get('publvl3', '')),
+                         'send': False}
+    return deviceD, subTopics
+
+def busGroups(config):
+    ''' [[device names], ...] with devices sharing a bus in the same group (like cycleExecutor) '''
+
+    groups = []
+    for name, device in config['devices'].items():
+        buses = {name} if device.get('backend') == 'sim' else _bus(device['type'], device)   # sim devices have no real bus
+        merged = [name]
+        for group in [g for g in groups if g[0] & buses]:
+            groups.remove(group)
+            buses |= group[0]
+            merged = group[1] + merged
+        groups.append((buses, merged))
+    return [names for buses, names in groups]
+
+def _worker(config, names, queue, stopped, interval):
+    ''' Worker process: opens its devices and reads them every interval until stopped '''
+
+    logger = logging.getLogger('worker ' + '+'.join(names))
+    devices = buildDevices(config, logger, names)
+    cycle = cycleExecutor(devices, logger)
+    clock = ticker(interval, logger)
+    try:
+        for tick in clock:
+            if stopped.is_set():
+                break
+            t, frame = cycle.read()
+            if frame:
+                queue.put((t, frame))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cycle.stop()
+
+class busWorkers:
+    ''' One process per bus group so the bus reads and reductions of a node with many ADCs use every core.
+    Each process creates its own devices from the config (hardware handles can not be shared) '''
+
+    def __init__(self, config, logger=None, interval=None):
+        self.logger = _logger(logger)
+        self.groups = busGroups(config)
+        self.queue = mp.Queue()
+        self.stopped = mp.Event()
+        interval = interval if interval is not None else config.get('loop', {}).get('interval', 0.5)
+        self.processes = [mp.Process(target=_worker, args=(config, names, self.queue, self.stopped, interval), daemon=True) for names in self.groups]
+        for worker, (process, names) in enumerate(zip(self.processes, self.groups)):
+            process.start()
+            self.logger.info("Worker {0} (pid {1}): {2}".format(worker, process.pid, names))
+
+    def read(self, timeout=1.0):
+        ''' [(t, frame), ...] read by the workers since the last call, waits up to timeout for the first '''
+
+        try:
+            frames = [self.queue.get(timeout=timeout)]
+        except Empty:
+            return []
+        while True:
+            try:
+                frames.append(self.queue.get_nowait())
+            except Empty:
+                return frames
+
+    def alive(self):
+        return all(process.is_alive() for process in self.processes)
+
+    def stop(self):
+        ''' Stop the workers (each stops its devices) '''
+
+        self.stopped.set()
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
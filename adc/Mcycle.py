@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+''' Reads every device once per cycle with the physical buses running at the same time.
+ Devices are grouped by their bus attribute ('i2c1', 'spi0', 'spi1'. mcp3008Array is on both SPI buses).
+ Each bus group gets one worker thread that reads its devices one after the other, so devices sharing a
+ bus stay serialized while I2C and SPI run in parallel. A cycle takes about max(bus times) instead of the
+ sum of every device.
+
+ cycle = adc.cycleExecutor({'ads1115': ads, 'mcp3008': mcp}, logger)
+ t, frame = cycle.read()     # frame = {device: getdata() result}, devices returning None are left out
+ cycle.busTimes              # seconds each bus group took in the last cycle
+'''
+import logging
+from time import time, perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+class cycleExecutor:
+    ''' One worker per bus group. read() returns (time, {device: data}) for one cycle '''
+
+    def __init__(self, devices, logger=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        self.devices = devices
+        self.groups = []   # [(set of buses, [device names])], groups sharing any bus are merged
+        for name, device in devices.items():
+            bus = getattr(device, 'bus', name)        # no bus attribute, treat the device as its own bus
+            buses = set(bus) if isinstance(bus, tuple) else {bus}
+            merged = [name]
+            for group in [g for g in self.groups if g[0] & buses]:
+                self.groups.remove(group)
+                buses |= group[0]
+                merged = group[1] + merged
+            self.groups.append((buses, merged))
+        self.keys = ['+'.join(sorted(buses)) for buses, names in self.groups]
+        self.pool = ThreadPoolExecutor(max_workers=len(self.groups)) if len(self.groups) > 1 else None
+        self.busTimes = {key: 0.0 for key in self.keys}
+        for key, (buses, names) in zip(self.keys, self.groups):
+            self.logger.info("Bus {0}: {1}".format(key, names))
+
+    def _readGroup(self, names):
+        t0 = perf_counter()
+        data = [(name, self.devices[name].getdata()) for name in names]
+        return data, perf_counter() - t0
+
+    def read(self):
+        ''' Read every device once. Returns (cycle start time, {device: data}) '''
+
+        t = time()
+        if self.pool is None:
+            results = [self._readGroup(names) for buses, names in self.groups]
+        else:
+            futures = [self.pool.submit(self._readGroup, names) for buses, names in self.groups]
+            results = [future.result() for future in futures]   # re-raises a device error here
+        frame = {}
+        for key, (data, seconds) in zip(self.keys, results):
+            self.busTimes[key] = seconds
+            for name, value in data:
+                if value is not None:
+                    frame[name] = value
+        return t, frame
+
+    def stop(self):
+        ''' Shut down the workers and stop every device '''
+
+        if self.pool is not None:
+            self.pool.shutdown()
+        for device in self.devices.values():
+            device.stop()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+''' Spectral features of fast sampled channels (vibration, AC coupled sensors), computed on the Pi so only a
+ feature vector per window is published instead of kHz of raw samples.
+
+ spectralFeatures(numOfChannels, windowSize, rate, bands)
+  Samples are collected into a preallocated (channels x windowSize) window. Each full window is processed for
+  every channel at once with numpy (hann window, rfft) and gives per channel
+   a0rmsf    RMS around the mean (AC part)         a0dcf     mean
+   a0ppf     peak to peak                           a0crestf  crest factor, peak / RMS
+   a0freqf   dominant frequency (Hz), DC excluded   a0b0f ..  energy (units^2) in each (low, high) Hz band
+  Band energies are scaled so they add up to rms^2 when the bands cover the whole spectrum.
+  Keys end in f so node-red/influxWriter store them as float fields like the readings.
+
+  overlap - samples shared by consecutive windows (windowSize/2 doubles the message rate)
+  rate    - sample rate in Hz, None to measure it from the sample times of each window
+  scale   - applied to the raw samples first, ie driver.rawScale for volts
+
+ feed(times, block) takes a (channels x n) block, poll(buffer) the frames a driver's sampler added to its ring
+ buffer (rate=, useNumpy=True) since the last poll. Both return [(t, features), ...], t is the window's last sample.
+ mcp = adc.mcp3008(2, 5, 400, 1, 8, backend='spidev', useNumpy=True, rate=4000, bufferSize=8000)
+ fft = adc.spectralFeatures(2, 1024, 4000, [(0, 50), (50, 200), (200, 2000)], scale=mcp.rawScale)
+ for t, features in fft.poll(mcp.buffer):   # ~4 windows/s
+     mqtt_client.publish('pi2nred/mcp3008/features', json.dumps(features))
+'''
+import logging, sys
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class spectralFeatures:
+    ''' Windowed FFT band energies, RMS, peak to peak, crest factor and dominant frequency per channel '''
+
+    def __init__(self, numOfChannels, windowSize=1024, rate=None, bands=(), overlap=0, window='hann', keys=None, scale=1.0, logger=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        if np is None:
+            self.logger.error("spectralFeatures requires numpy (pip3 install numpy)")
+            sys.exit()
+        if not 0 <= overlap < windowSize:
+            self.logger.error("overlap must be 0 to windowSize-1")
+            sys.exit()
+        self.numOfChannels = numOfChannels
+        self.windowSize = windowSize
+        self.rate = rate
+        self.bands = list(bands)
+        self.hop = windowSize - overlap     # new samples per window
+        self.scale = scale
+        self.keys = keys if keys is not None else ['a' + str(x) for x in range(numOfChannels)]   # key prefix per channel
+        self.window = np.hanning(windowSize) if window == 'hann' else np.ones(windowSize)
+        bins = windowSize // 2 + 1
+        self.psdScale = np.full(bins, 2.0 / (windowSize * np.sum(self.window ** 2)))   # one sided mean square per bin
+        self.psdScale[0] /= 2
+        if windowSize % 2 == 0:
+            self.psdScale[-1] /= 2
+        # Reusable buffers, only the rfft output is allocated per window
+        self.t = np.zeros(windowSize)
+        self.data = np.zeros((numOfChannels, windowSize))
+        self.work = np.zeros((numOfChannels, windowSize))
+        self.power = np.zeros((numOfChannels, bins))
+        self.dc = np.zeros(numOfChannels)
+        self.rms = np.zeros(numOfChannels)
+        self.peak = np.zeros(numOfChannels)
+        self.pp = np.zeros(numOfChannels)
+        self.fill = 0                       # samples in the current window
+        self.read = 0                       # ring buffer frames consumed by poll()
+        self.windows = 0
+        self.binEdges = None                # (rate, [(first, last) bin per band]), recomputed if the rate changes
+
+    def _bandBins(self, rate):
+        if self.binEdges is None or self.binEdges[0] != rate:
+            resolution = rate / self.windowSize
+            edges = [(int(np.ceil(low / resolution)), int(np.floor(high / resolution)) + 1) for low, high in self.bands]
+            self.binEdges = (rate, edges)
+        return self.binEdges[1]
+
+    def _compute(self):
+        ''' Features of the full window in self.data '''
+
+        rate = self.rate
+        if rate is None:
+            span = self.t[-1] - self.t[0]
+            rate = (self.windowSize - 1) / span if span > 0 else 0.0
+        np.multiply(self.data, self.scale, out=self.work)
+        np.mean(self.work, axis=1, out=self.dc)
+        self.work -= self.dc[:, None]                  # AC part
+        np.ptp(self.work, axis=1, out=self.pp)
+        np.max(np.abs(self.work), axis=1, out=self.peak)
+        np.sqrt(np.mean(np.square(self.work), axis=1), out=self.rms)
+        self.work *= self.window
+        spectrum = np.fft.rfft(self.work, axis=1)
+        np.square(spectrum.real, out=self.power)
+        self.power += np.square(spectrum.imag)
+        self.power *= self.psdScale
+        dominant = np.argmax(self.power[:, 1:], axis=1) + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crest = np.where(self.rms > 0, self.peak / self.rms, 0.0)
+        bandEnergy = [np.sum(self.power[:, first:last], axis=1) for first, last in self._bandBins(rate)] if rate else []
+        features = {}
+        for x in range(self.numOfChannels):
+            key = self.keys[x]
+            features[key + 'rmsf'] = round(float(self.rms[x]), 6)
+            features[key + 'dcf'] = round(float(self.dc[x]), 6)
+            features[key + 'ppf'] = round(float(self.pp[x]), 6)
+            features[key + 'crestf'] = round(float(crest[x]), 3)
+            features[key + 'freqf'] = round(float(dominant[x] * rate / self.windowSize), 2)
+            for b, energy in enumerate(bandEnergy):
+                features['{0}b{1}f'.format(key, b)] = float('{0:.6g}'.format(energy[x]))
+        self.windows += 1
+        return features
+
+    def feed(self, times, block):
+        ''' Add (channels x n) samples taken at times. Returns [(t, features), ...] for every window completed '''
+
+        results = []
+        n = len(times)
+        first = 0
+        while first < n:
+            count = min(n - first, self.windowSize - self.fill)
+            self.t[self.fill:self.fill + count] = times[first:first + count]
+            self.data[:, self.fill:self.fill + count] = block[:, first:first + count]
+            self.fill += count
+            first += count
+            if self.fill == self.windowSize:
+                results.append((float(self.t[-1]), self._compute()))
+                keep = self.windowSize - self.hop     # overlap moves to the front of the window
+                if keep:
+                    self.t[:keep] = self.t[self.hop:]
+                    self.data[:, :keep] = self.data[:, self.hop:]
+                self.fill = keep
+        return results
+
+    def poll(self, buffer):
+        ''' Feed the frames added to a driver's ring buffer (useNumpy) since the last poll '''
+
+        first, times, frames = buffer.since(self.read)
+        if first > self.read and self.read:
+            self.logger.warning("Spectral features fell behind the sampler, {0} frames lost".format(first - self.read))
+        self.read = first + len(times)
+        if not len(times):
+            return []
+        return self.feed(times, frames.T)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+''' Streaming filters for per channel smoothing, used in place of the plain numOfSamples average.
+ Every stage keeps incremental state and is fed one sample at a time with update(value).
+ update returns the filtered value, or None when a decimating stage has no output yet.
+
+ movingAverage(n)          - boxcar over the last n samples (running sum)
+ ema(alpha)                - exponential moving average. alpha 0-1, higher is faster/less smoothing
+ median(n)                 - median of the last n samples, rejects spikes shorter than n/2 samples
+ cic(decimation, order=1)  - decimating CIC filter, one output every decimation samples.
+                             order=1 is a boxcar average of each block of decimation samples
+
+ Stages are chained with filterChain. The driver feeds every raw sample of a channel through the chain
+ on each getdata() and uses the last output as that channel's value
+ ie filters={0: filterChain(ema(0.5)), 1: filterChain(median(5), cic(50, 2))}
+'''
+from bisect import insort, bisect_left
+
+class movingAverage:
+    ''' Moving average of the last n samples '''
+
+    def __init__(self, n):
+        self.n = n
+        self.window = [0.0 for x in range(n)]
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, value):
+        self.total += value - self.window[self.index]
+        self.window[self.index] = value
+        self.index = (self.index + 1) % self.n
+        if self.count < self.n:
+            self.count += 1
+        return self.total / self.count
+
+class ema:
+    ''' Exponential moving average. First sample seeds the average '''
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+class median:
+    ''' Median of the last n samples. Keeps a sorted copy of the window so each update is one insert and one remove '''
+
+    def __init__(self, n):
+        self.n = n
+        self.window = [0.0 for x in range(n)]
+        self.sorted = []
+        self.index = 0
+
+    def update(self, value):
+        if len(self.sorted) == self.n:
+            del self.sorted[bisect_left(self.sorted, self.window[self.index])]
+        self.window[self.index] = value
+        self.index = (self.index + 1) % self.n
+        insort(self.sorted, value)
+        return self.sorted[len(self.sorted) // 2]
+
+class cic:
+    ''' Decimating CIC filter, one output every decimation samples, normalized to unity gain.
+    Built as order cascaded running sums of length decimation (same response as integrator/comb
+    pairs) so the state stays bounded on long runs instead of integrators growing forever '''
+
+    def __init__(self, decimation, order=1):
+        self.decimation = decimation
+        self.order = order
+        self.gain = decimation ** order
+        self.windows = [[0.0 for x in range(decimation)] for k in range(order)]
+        self.totals = [0.0 for k in range(order)]
+        self.index = 0
+        self.count = 0
+        self.warmup = order - 1   # outputs to skip until every stage has a full window
+
+    def update(self, value):
+        for k in range(self.order):
+            window = self.windows[k]
+            self.totals[k] += value - window[self.index]
+            window[self.index] = value
+            value = self.totals[k]
+        self.index = (self.index + 1) % self.decimation
+        self.count += 1
+        if self.count < self.decimation:
+            return None
+        self.count = 0
+        if self.warmup:
+            self.warmup -= 1
+            return None
+        return value / self.gain
+
+class filterChain:
+    ''' Runs samples through each stage in order. A stage returning None stops the chain for that sample '''
+
+    def __init__(self, *stages):
+        self.stages = stages
+        self.value = None   # last output of the chain
+
+    def update(self, value):
+        for stage in self.stages:
+            value = stage.update(value)
+            if value is None:
+                return None
+        self.value = value
+        return value
+
+    def process(self, samples):
+        ''' Feed a block of samples. Returns the newest output, None if the chain produced no output '''
+
+        output = None
+        for value in samples:
+            value = self.update(value)
+            if value is not None:
+                output = value
+        return output
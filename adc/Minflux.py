@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+''' Writes readings straight to InfluxDB (line protocol over http), skipping mqtt -> node-red -> influxdb.
+ Uses the same convention as the node-red 'parse MQTT JSON str' function so the data lands in the same series:
+  measurement 'adc', tags location=topic level 1 and device=topic level 2 (pi2nred/mcp3008/pi -> pi2nred, mcp3008)
+  keys ending in f are float fields, keys ending in i are integer fields, other keys are skipped.
+ add() takes a getdata() dict, or a batch {"t": [...], "a0f": [...]} (see Mbatch.py) for one point per sample.
+
+ Lines are buffered and POSTed gzip compressed by a writer thread when batchSize lines are waiting or the oldest
+ is maxAge seconds old, so add() never waits on the network. One keep-alive http connection is reused for every
+ write. If a write fails the lines stay buffered (up to maxBuffered, oldest dropped) and the next write is tried
+ after a backoff that doubles from maxAge up to maxBackoff seconds. close() stops the thread and writes what is left.
+
+ InfluxDB 1.8 - influxWriter('http://localhost:8086', database='adc')          (username/password optional)
+ InfluxDB 2.x - influxWriter('http://localhost:8086', org='organisation', bucket='bucket', token='...')
+'''
+import gzip, base64, http.client, threading
+from time import time
+from urllib.parse import urlsplit, urlencode
+
+def _escapeTag(value):
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+def _field(key, value):
+    ''' key=value in line protocol, None to skip (same rules as parseFloat/parseInt in node-red) '''
+
+    if value is None:
+        return None
+    try:
+        if key.endswith('f'):
+            value = float(value)
+            return None if value != value else '{0}={1!r}'.format(key, value)   # NaN is not allowed
+        if key.endswith('i'):
+            return '{0}={1}i'.format(key, int(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return None
+
+class influxWriter:
+    ''' Batched, gzip compressed line protocol writes over a pooled http connection '''
+
+    def __init__(self, url='http://localhost:8086', database='adc', measurement='adc', batchSize=500, maxAge=1.0, compress=True,
+                 username=None, password=None, org=None, bucket=None, token=None, maxBuffered=100000, timeout=5, maxBackoff=60, logger=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.https = parts.scheme == 'https'
+        self.measurement = measurement.replace(',', '\\,').replace(' ', '\\ ')
+        self.batchSize = batchSize
+        self.maxAge = maxAge
+        self.compress = compress
+        self.maxBuffered = maxBuffered
+        self.timeout = timeout
+        self.logger = logger
+        self.headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        if compress:
+            self.headers['Content-Encoding'] = 'gzip'
+        if token is not None:    # 2.x api (also works on 1.8 with bucket=database/retention policy)
+            self.path = '/api/v2/write?' + urlencode({'org': org or '', 'bucket': bucket or database, 'precision': 'ms'})
+            self.headers['Authorization'] = 'Token ' + token
+        else:
+            self.path = '/write?' + urlencode({'db': database, 'precision': 'ms'})
+            if username is not None:
+                self.headers['Authorization'] = 'Basic ' + base64.b64encode('{0}:{1}'.format(username, password).encode()).decode()
+        self.maxBackoff = maxBackoff
+        self.conn = None
+        self.lines = []
+        self.t0 = None           # arrival of the oldest buffered line
+        self.retryAt = 0         # no write before this time after a failure
+        self.backoff = maxAge
+        self.lock = threading.Lock()        # lines/t0, held only to append or take the lines
+        self.writeLock = threading.Lock()   # one write at a time (writer thread or flush())
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.tags = {}           # topic: ',location=..,device=..' (cached)
+        self.points = 0
+        self.writes = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='influxWriter', daemon=True)
+        self.thread.start()
+
+    def _tags(self, topic):
+        tags = self.tags.get(topic)
+        if tags is None:
+            pTopic = topic.split('/')
+            tags = self.tags[topic] = ',location={0},device={1}'.format(_escapeTag(pTopic[0]), _escapeTag(pTopic[1] if len(pTopic) > 1 else ''))
+        return tags
+
+    def _line(self, tags, t, fields):
+        fields = ','.join(field for field in fields if field is not None)
+        if fields:
+            self.lines.append('{0}{1} {2} {3}'.format(self.measurement, tags, fields, int(round(t * 1000))))
+
+    def add(self, topic, t, data):
+        ''' Add a getdata() dict read at time t (or a columnar batch with its own 't') '''
+
+        if data is None:
+            return
+        tags = self._tags(topic)
+        times = data.get('t')
+        with self.lock:
+            if self.t0 is None:
+                self.t0 = time()
+            if isinstance(times, list):
+                keys = [key for key in data if key != 't']
+                for row, ts in enumerate(times):
+                    self._line(tags, ts, [_field(key, data[key][row]) for key in keys])
+            else:
+                self._line(tags, t, [_field(key, value) for key, value in data.items()])
+        if self._due():
+            self.wake.set()
+
+    def poll(self):
+        ''' Wake the writer if the oldest buffered line is older than maxAge (the writer also checks on its own) '''
+
+        if self._due():
+            self.wake.set()
+
+    def _due(self):
+        now = time()
+        return now >= self.retryAt and (len(self.lines) >= self.batchSize or (self.t0 is not None and now - self.t0 >= self.maxAge))
+
+    def _run(self):
+        ''' Writer thread '''
+
+        while not self.stopped.is_set():
+            self.wake.wait(self.maxAge)
+            self.wake.clear()
+            if not self.stopped.is_set() and self._due():
+                self.flush()
+
+    def _connect(self):
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _post(self, body):
+        ''' POST on the kept-alive connection. A connection the server closed is reopened once '''
+
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = self._connect()
+            try:
+                self.conn.request('POST', self.path, body, self.headers)
+                response = self.conn.getresponse()
+                text = response.read()
+                return response.status, text
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def flush(self):
+        ''' Write every buffered line now. Returns True on success '''
+
+        with self.writeLock:
+            with self.lock:
+                lines = self.lines
+                self.lines = []
+                self.t0 = None
+            if not lines:
+                return True
+            body = '\n'.join(lines).encode()
+            if self.compress:
+                body = gzip.compress(body, 5)
+            try:
+                status, text = self._post(body)
+            except (http.client.HTTPException, OSError) as e:
+                status, text = None, str(e)
+            if status is not None and status < 300:
+                self.points += len(lines)
+                self.writes += 1
+                self.retryAt = 0
+                self.backoff = self.maxAge
+                return True
+            if status is not None and 400 <= status < 500 and status != 429:   # bad data, retrying will not help
+                if self.logger is not None:
+                    self.logger.error("InfluxDB rejected {0} lines ({1}): {2}".format(len(lines), status, text[:200]))
+                self.dropped += len(lines)
+                return False
+            with self.lock:
+                self.lines = lines + self.lines    # keep them in order ahead of the lines added meanwhile
+                if len(self.lines) > self.maxBuffered:
+                    drop = len(self.lines) - self.maxBuffered
+                    del self.lines[:drop]
+                    self.dropped += drop
+                self.t0 = time()
+            self.retryAt = time() + self.backoff
+            if self.logger is not None:
+                self.logger.warning("InfluxDB write failed ({0}), keeping {1} lines, retry in {2:.1f}s".format(status or text, len(self.lines), self.backoff))
+            self.backoff = min(self.backoff * 2, self.maxBackoff)
+            return False
+
+    def close(self):
+        ''' Stop the writer thread and write what is left (one attempt) '''
+
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+''' Automatic per channel noise thresholds, used in place of a hand tuned noiseThreshold.
+ Every getdata() the samples of each channel are compared to their own average (the signal does not move
+ much within one block of numOfSamples) and the residuals go into a rolling window per channel. The noise
+ floor is the robust std dev of that window, sigma = 1.4826 * MAD (median absolute deviation), so a real
+ step inside a block does not inflate it the way a plain std dev would.
+
+ getdata() compares averages of numOfSamples samples, whose difference has std dev sigma*sqrt(2/n), so
+  upper = max(minThreshold, step, k * sigma * sqrt(2/n))   - a quiet channel has to move this much to be reported
+  lower = upper * hysteresis                               - a channel that moved last call keeps being reported
+                                                             until it moves less than this (no chatter at the edge)
+ step is one ADC code, set by the driver (64 raw for mcp3008, rawScale volts for ads1115). With noise below
+ one code most samples of a block read the same code and the MAD underestimates sigma, the floor keeps the
+ threshold from dropping under the code size and reporting every code flicker.
+ Until calibration residuals per channel have been collected the driver's noiseThreshold is used.
+ Thresholds are in the same units as the driver's noiseThreshold (raw for mcp3008, volts for ads1115).
+
+ With path set the noise floor is saved to a json file (keyed by key, so several devices can share one
+ file) every saveInterval seconds and on stop(), and loaded at start so a restart is already calibrated.
+
+ adc = mcp3008(2, 5, 400, 1, 8, autoThreshold=noiseFloor(k=4, path='noise.json', key='mcp3008-cs8'))
+'''
+import json, os
+from time import time
+
+class noiseFloor:
+    ''' Rolling MAD noise estimate per channel. The driver calls update() every getdata() '''
+
+    def __init__(self, k=4, hysteresis=0.5, window=500, calibration=100, every=10, minThreshold=0, path=None, key='adc', saveInterval=300, logger=None):
+        self.k = k
+        self.hysteresis = hysteresis
+        self.size = window          # residuals kept per channel
+        self.calibration = calibration
+        self.every = every          # recompute sigma every n calls (the median sort is the expensive part)
+        self.minThreshold = minThreshold
+        self.step = 0               # one ADC code in threshold units, set by the driver with setup()
+        self.path = path
+        self.key = key
+        self.saveInterval = saveInterval
+        self.logger = logger
+        self.numOfChannels = None
+        self.sigma = None           # per channel noise std dev of one sample, None until calibrated
+        self.calls = 0
+        self.lastSave = time()
+        if path is not None:
+            self.load()
+
+    def setup(self, step):
+        ''' Called by the driver with the size of one ADC code (same units as noiseThreshold) '''
+
+        self.step = step
+
+    def _start(self, numOfChannels, numOfSamples):
+        self.numOfChannels = numOfChannels
+        self.numOfSamples = numOfSamples
+        self.windows = [[] for x in range(numOfChannels)]
+        self.index = [0] * numOfChannels
+        self.last = [None] * numOfChannels        # previous block average, used when numOfSamples is 1
+        if self.sigma is None or len(self.sigma) != numOfChannels:
+            self.sigma = [None] * numOfChannels
+        # residual from the block mean has variance sigma^2 (n-1)/n, a difference of 1 sample averages 2 sigma^2
+        self.correction = (numOfSamples / (numOfSamples - 1)) ** 0.5 if numOfSamples > 1 else 0.5 ** 0.5
+
+    def _add(self, x, value):
+        window = self.windows[x]
+        if len(window) < self.size:
+            window.append(value)
+        else:
+            window[self.index[x]] = value
+            self.index[x] = (self.index[x] + 1) % self.size
+
+    def update(self, sensor, thresholds, moving):
+        ''' Add this call's residuals and write the upper (or lower if moving[x]) threshold into thresholds[x] '''
+
+        if self.numOfChannels is None:
+            self._start(len(sensor), len(sensor[0]))
+        for x in range(self.numOfChannels):
+            samples = sensor[x].tolist() if hasattr(sensor[x], 'tolist') else sensor[x]
+            mean = sum(samples) / self.numOfSamples
+            if self.numOfSamples > 1:
+                for value in samples:
+                    self._add(x, value - mean)
+            elif self.last[x] is not None:
+                self._add(x, mean - self.last[x])
+            self.last[x] = mean
+        self.calls += 1
+        if self.calls % self.every == 0:
+            self._estimate()
+        for x in range(self.numOfChannels):
+            if self.sigma[x] is not None:
+                upper = self.threshold(x)
+                thresholds[x] = upper * self.hysteresis if moving[x] else upper
+        if self.path is not None and time() - self.lastSave > self.saveInterval:
+            self.save()
+
+    def _estimate(self):
+        for x, window in enumerate(self.windows):
+            if len(window) < self.calibration:
+                continue
+            ordered = sorted(window)
+            median = ordered[len(ordered) // 2]
+            deviations = sorted(abs(value - median) for value in window)
+            calibrated = self.sigma[x] is not None
+            self.sigma[x] = 1.4826 * deviations[len(deviations) // 2] * self.correction
+            if not calibrated and self.logger is not None:
+                self.logger.info("{0} channel {1} noise floor {2:.6g}, threshold {3:.6g}".format(self.key, x, self.sigma[x], self.threshold(x)))
+
+    def threshold(self, x):
+        ''' Upper threshold for channel x, None while still calibrating '''
+
+        if self.sigma is None or self.sigma[x] is None:
+            return None
+        return max(self.minThreshold, self.step, self.k * self.sigma[x] * (2 / self.numOfSamples) ** 0.5)
+
+    def load(self):
+        ''' Warm start from the saved noise floor of this key '''
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f).get(self.key)
+        except (OSError, ValueError):
+            return
+        if saved is not None:
+            self.sigma = saved['sigma']
+            if self.logger is not None:
+                self.logger.info("{0} noise floor loaded from {1}: {2}".format(self.key, self.path, self.sigma))
+
+    def save(self):
+        ''' Write this key's noise floor, keeping other keys in the file. Written to a temp file and renamed '''
+
+        self.lastSave = time()
+        if self.sigma is None or all(sigma is None for sigma in self.sigma):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        saved[self.key] = {'sigma': self.sigma, 'time': self.lastSave}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(saved, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+''' Store and forward for the mqtt publishers, so readings taken while the broker is down are not lost.
+ outbox(path, maxMessages)  - SQLite (WAL mode) queue of (time, topic, payload) on disk. When it holds
+                              maxMessages the oldest are dropped to make room (oldest-first eviction)
+ storeAndForward(client, outbox, rate, batchSize)
+                            - publish() goes straight to the broker while connected and the outbox is
+                              empty, otherwise to the outbox. A drain thread sends the outbox in batches
+                              of batchSize (oldest first) once the client is connected again, at most rate
+                              messages/s so a broker restart is not met by every node at full speed.
+                              New readings queue behind the outbox while it drains so the order is kept.
+
+ paho reconnects by itself (loop_start) as long as loop_stop() is not called in on_disconnect.
+ sf = adc.storeAndForward(mqtt_client, adc.outbox('outbox.db', 100000), rate=200)
+ sf.publish(topic, payload)
+ sf.stop()
+'''
+import sqlite3, threading
+from time import time
+
+class outbox:
+    ''' Bounded durable message queue in a SQLite file '''
+
+    def __init__(self, path='outbox.db', maxMessages=100000, logger=None):
+        self.path = path
+        self.maxMessages = maxMessages
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)   # autocommit, every statement is its own transaction
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')   # WAL + NORMAL survives a crash, only a power cut can lose the last commits
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, t REAL, topic TEXT, payload BLOB)')
+        self.count = self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        self.evicted = 0
+        if self.count and self.logger is not None:
+            self.logger.info("Outbox {0} has {1} messages from before the restart".format(path, self.count))
+
+    def put(self, topic, payload, t=None):
+        with self.lock:
+            self.db.execute('INSERT INTO outbox (t, topic, payload) VALUES (?, ?, ?)', (time() if t is None else t, topic, payload))
+            self.count += 1
+            if self.count > self.maxMessages:
+                drop = self.count - self.maxMessages
+                self.db.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)', (drop,))
+                self.count -= drop
+                self.evicted += drop
+                if self.logger is not None and (self.evicted == drop or self.evicted % 1000 < drop):   # first time, then every 1000
+                    self.logger.warning("Outbox full ({0}), {1} oldest messages dropped so far".format(self.maxMessages, self.evicted))
+
+    def peek(self, n):
+        ''' Oldest n messages as [(id, t, topic, payload)] '''
+
+        with self.lock:
+            return self.db.execute('SELECT id, t, topic, payload FROM outbox ORDER BY id LIMIT ?', (n,)).fetchall()
+
+    def remove(self, lastId):
+        ''' Delete every message up to and including lastId (after they were sent) '''
+
+        with self.lock:
+            cursor = self.db.execute('DELETE FROM outbox WHERE id <= ?', (lastId,))
+            self.count -= cursor.rowcount
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class storeAndForward:
+    ''' Publishes through the outbox whenever the broker is not reachable '''
+
+    def __init__(self, client, box, rate=200, batchSize=100, qos=0, logger=None):
+        self.client = client     # paho mqtt.Client running loop_start()
+        self.box = box
+        self.rate = rate         # max messages/s while draining
+        self.batchSize = batchSize
+        self.qos = qos
+        self.logger = logger
+        self.stored = 0
+        self.forwarded = 0
+        self.stopped = threading.Event()
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def publish(self, topic, payload, qos=None):
+        ''' Same call as client.publish (so batchPublisher can publish through it) '''
+
+        if len(self.box) == 0 and self.client.is_connected():
+            if self.client.publish(topic, payload, self.qos if qos is None else qos).rc == 0:   # MQTT_ERR_SUCCESS
+                return
+        self.box.put(topic, payload)
+        self.stored += 1
+        self.wake.set()
+
+    def _drain(self):
+        while not self.stopped.is_set():
+            self.wake.wait(1)
+            self.wake.clear()
+            while len(self.box) and self.client.is_connected() and not self.stopped.is_set():
+                t0 = time()
+                batch = self.box.peek(self.batchSize)
+                sent = None
+                for id, t, topic, payload in batch:
+                    if self.client.publish(topic, payload, self.qos).rc != 0:
+                        break            # lost the connection again, the rest stays in the outbox
+                    sent = id
+                if sent is None:
+                    break
+                self.box.remove(sent)
+                self.forwarded += len([row for row in batch if row[0] <= sent])
+                if self.logger is not None and len(self.box) == 0:
+                    self.logger.info("Outbox drained, {0} stored messages forwarded".format(self.forwarded))
+                delay = len(batch) / self.rate - (time() - t0)   # rate limit
+                if delay > 0:
+                    self.stopped.wait(delay)
+
+    def stop(self):
+        ''' Stop the drain thread. Whatever is still in the outbox is sent after the next start '''
+
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join()
+        self.box.close()
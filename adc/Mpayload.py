@@ -0,0 +1 @@
+../upyADC/lib/payload.py
\ No newline at end of file
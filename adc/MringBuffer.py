@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+''' Fixed size ring buffer of timestamped frames (one raw sample per channel).
+ Single writer (the sampler thread) and any number of readers, no lock.
+ The writer fills a slot and then bumps the frame count. Readers copy the frames
+ they want and then check the count again. If the writer lapped into the copied
+ range while reading, they copy again (since() drops the overwritten oldest frames instead).
+'''
+from time import time, perf_counter
+import threading
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ringBuffer:
+    ''' Preallocated ring of size frames x numOfChannels with a timestamp per frame '''
+
+    def __init__(self, size, numOfChannels, useNumpy=False):
+        self.size = size
+        self.numOfChannels = numOfChannels
+        self.useNumpy = useNumpy
+        if self.useNumpy:
+            self.t = np.zeros(size)
+            self.data = np.zeros((size, numOfChannels))
+        else:
+            self.t = [0.0 for x in range(size)]
+            self.data = [[0 for x in range(numOfChannels)] for x in range(size)]
+        self.count = 0   # Total frames written. Next slot is count % size
+
+    def put(self, t, frame):
+        ''' Writer only. Store frame (one value per channel) taken at time t '''
+
+        i = self.count % self.size
+        self.t[i] = t
+        self.data[i][:] = frame
+        self.count += 1   # publish the frame after it is written
+
+    def _copy(self, n, copyfunc):
+        ''' Run copyfunc(first, n) on the last n frames, retry if the writer overwrote them meanwhile '''
+
+        while True:
+            end = self.count
+            if end < n or n >= self.size:
+                return None
+            result = copyfunc(end - n, n)
+            if self.count - end < self.size - n:    # none of the copied slots were reused or are being written
+                return result
+
+    def _indexes(self, first, n):
+        return [(first + k) % self.size for k in range(n)]
+
+    def window(self, n):
+        ''' Copy of the last n frames as (times, frames) oldest first. None if not enough frames yet '''
+
+        def copy(first, n):
+            idx = self._indexes(first, n)
+            if self.useNumpy:
+                return self.t[idx], self.data[idx]
+            return [self.t[i] for i in idx], [self.data[i][:] for i in idx]
+        return self._copy(n, copy)
+
+    def since(self, count):
+        ''' Copy of every frame written after the first count frames as (first, times, frames), oldest first.
+        Frames already overwritten are skipped, first is the number of the oldest frame returned '''
+
+        while True:
+            end = self.count
+            first = max(count, end - self.size + 1)
+            n = end - first
+            idx = self._indexes(first, n)
+            if self.useNumpy:
+                t, frames = self.t[idx], self.data[idx]
+            else:
+                t, frames = [self.t[i] for i in idx], [self.data[i][:] for i in idx]
+            # frame count - size + 1 and later are intact, the writer fills slot count % size before bumping count
+            skip = self.count - self.size + 1 - first
+            if skip <= 0:
+                return first, t, frames
+            if skip < n:                  # drop the oldest frames the writer reached while copying
+                return first + skip, t[skip:], frames[skip:]
+
+    def snapshot(self):
+        ''' Latest frame as (time, frame). None if nothing sampled yet '''
+
+        result = self.window(1)
+        if result is not None:
+            return result[0][0], result[1][0]
+
+    def latest(self, out):
+        ''' Fill out[x][i] (channels x samples) with the last samples of each channel. False if not enough frames yet '''
+
+        n = len(out[0])
+        def copy(first, n):
+            idx = self._indexes(first, n)
+            if self.useNumpy:
+                out[:] = self.data[idx].T
+            else:
+                for i, slot in enumerate(idx):
+                    frame = self.data[slot]
+                    for x in range(self.numOfChannels):
+                        out[x][i] = frame[x]
+            return True
+        return self._copy(n, copy) is not None
+
+class sampler(threading.Thread):
+    ''' Daemon thread that calls readframe() at a fixed rate and stores the frames in a ringBuffer.
+    rate=0 runs free, for readframe functions that pace themselves (ie waiting on a conversion ready pin).
+    A read that raises is logged (at most every logInterval seconds) and retried, error is set until a read
+    succeeds so the driver's getdata() returns None instead of averaging stale frames '''
+
+    def __init__(self, readframe, buffer, rate, logger):
+        threading.Thread.__init__(self, daemon=True)
+        self.readframe = readframe
+        self.buffer = buffer
+        self.period = 1 / rate if rate else 0
+        self.logger = logger
+        self.overruns = 0   # ticks where reading the bus took longer than the period
+        self.errors = 0     # failed reads
+        self.error = None   # last read error while the bus is failing, None once a read succeeds again
+        self.logInterval = 10   # seconds between logged read errors
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()   # held while reading a frame, a burst capture holds it to pause the sampler
+
+    def run(self):
+        self.logger.info("Sampler started at {0} with {1} frame buffer".format("{0} Hz".format(1 / self.period) if self.period else "device rate", self.buffer.size))
+        nexttick = perf_counter()
+        logged = 0
+        while not self.stopped.is_set():
+            try:
+                with self.lock:
+                    frame = self.readframe()
+            except Exception as e:           # I2C/SPI glitch, keep the thread alive and retry
+                self.errors += 1
+                if self.error is None or time() - logged > self.logInterval:
+                    self.logger.error("Sampler read failed ({0} errors): {1}".format(self.errors, e))
+                    logged = time()
+                self.error = e
+                self.stopped.wait(max(self.period, 0.1))
+                nexttick = perf_counter()
+                continue
+            if self.error is not None:
+                self.logger.info("Sampler reads recovered after {0} errors".format(self.errors))
+                self.error = None
+            self.buffer.put(time(), frame)
+            if not self.period:
+                continue
+            nexttick += self.period          # deadline based so the rate does not drift with read time
+            delay = nexttick - perf_counter()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                self.overruns += 1
+                if delay < -self.period:      # more than a full period behind, resync instead of bursting
+                    nexttick = perf_counter()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.logger.info("Sampler stopped. {0} frames, {1} overruns".format(self.buffer.count, self.overruns))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+''' Fixed rate scheduler for the ADC main loops.
+ Ticks fire on a fixed grid, deadline = t0 + n*period, so time spent doing the work does not push the
+ following ticks back (no drift). Between ticks the thread sleeps, and only the last spin seconds before a
+ deadline are busy waited to take out the OS wake up latency. spin=0 sleeps the whole way (lowest CPU).
+
+ for tick in adc.ticker(0.5, logger):     # every 0.5s
+     data = adc.getdata()
+
+ Overruns - the work took longer than the period and the next deadline had already passed. The tick fires
+            straight away. If a whole period or more was missed those ticks are skipped (counted in skipped)
+            and the grid is kept, rather than firing a burst of late ticks.
+ Jitter   - how late each tick fired compared to its deadline. stats() returns count/mean/std/max in us,
+            and report() logs them. reportInterval (seconds) logs them periodically while running.
+'''
+import threading
+from time import perf_counter
+
+class ticker:
+    ''' Iterate (or call wait()) to block until the next tick. Yields the tick number '''
+
+    def __init__(self, period, logger=None, spin=0.0002, reportInterval=0):
+        self.period = period
+        self.logger = logger
+        self.spin = spin
+        self.reportInterval = reportInterval
+        self.stopped = threading.Event()
+        self.t0 = None
+        self.n = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitterMean = 0.0   # running mean/variance (Welford) of the lateness in seconds
+        self.jitterM2 = 0.0
+        self.jitterMax = 0.0
+        self.nextReport = 0.0
+
+    def wait(self):
+        ''' Block until the next deadline. Returns the tick number, None if stop() was called '''
+
+        now = perf_counter()
+        if self.t0 is None:            # first tick fires immediately and sets the grid
+            self.t0 = now
+            self.nextReport = now + self.reportInterval
+        deadline = self.t0 + self.n * self.period
+        if now > deadline and self.n:
+            self.overruns += 1
+            missed = int((now - deadline) / self.period)
+            if missed:
+                self.skipped += missed
+                self.n += missed
+                deadline += missed * self.period
+        else:
+            if deadline - now > self.spin:
+                self.stopped.wait(deadline - now - self.spin)
+            while perf_counter() < deadline and not self.stopped.is_set():
+                pass
+        if self.stopped.is_set():
+            return None
+        late = perf_counter() - deadline
+        self.ticks += 1
+        delta = late - self.jitterMean
+        self.jitterMean += delta / self.ticks
+        self.jitterM2 += delta * (late - self.jitterMean)
+        if late > self.jitterMax:
+            self.jitterMax = late
+        if self.reportInterval and deadline >= self.nextReport:
+            self.nextReport = deadline + self.reportInterval
+            self.report()
+        tick = self.n
+        self.n += 1
+        return tick
+
+    def __iter__(self):
+        while True:
+            tick = self.wait()
+            if tick is None:
+                return
+            yield tick
+
+    def stop(self):
+        ''' End the iteration. Safe to call from another thread, wakes a sleeping wait() '''
+
+        self.stopped.set()
+
+    def stats(self):
+        ''' Tick count, overruns, skipped ticks and jitter (lateness) in us '''
+
+        std = (self.jitterM2 / (self.ticks - 1)) ** 0.5 if self.ticks > 1 else 0.0
+        return {'ticks': self.ticks, 'overruns': self.overruns, 'skipped': self.skipped,
+                'jitter_mean_us': round(self.jitterMean * 1e6, 1), 'jitter_std_us': round(std * 1e6, 1),
+                'jitter_max_us': round(self.jitterMax * 1e6, 1)}
+
+    def report(self):
+        if self.logger is not None:
+            self.logger.info("Ticker {0}s: {ticks} ticks, {overruns} overruns, {skipped} skipped, jitter mean {jitter_mean_us}us "
+                             "std {jitter_std_us}us max {jitter_max_us}us".format(self.period, **self.stats()))
+
+if __name__ == "__main__":
+
+    import logging
+    from time import sleep
+    logging.basicConfig(level=logging.INFO)
+    clock = ticker(0.01, logging.getLogger('ticker'), reportInterval=1)
+    for tick in clock:
+        sleep(0.015 if tick % 50 == 49 else 0.002)   # some work, with an overrun every 50 ticks
+        if tick >= 300:
+            clock.stop()
+    clock.report()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+''' Simulated MCP3008/ADS1115 buses so the drivers run (and can be benchmarked) without hardware.
+ Pass backend='sim' when creating the driver, optionally with sim=simMCP3008(...) or sim=simADS1115(...).
+
+ Waveforms are functions of time (seconds) returning volts:
+  dc(level, noise)                                 - constant level plus gaussian noise (noise is std dev in V)
+  sine(amplitude, freq, offset, noise)             - sine wave
+  step(low, high, period, noise)                   - square wave switching every period/2 seconds
+  joystick(center, span, holdtime, noise, seed)    - sits at center, then moves to a random position and back
+
+ Latency per transaction is injected so throughput looks like the real bus.
+  MCP3008 - latency in seconds per 3 byte SPI transaction (default 30us, ~1MHz SPI plus driver overhead)
+            block(numOfChannels, numOfSamples) returns a block reader like MspidevBlock.spidevBlock
+  ADS1115 - single-shot conversion time 1/datarate plus i2c overhead (default 128 SPS -> ~8ms per sample)
+            continuous(datarate) returns a continuous-conversion reader paced at 1/datarate per sample
+            chip() returns split start()/read() single-shot conversions (used by ads1115Group)
+'''
+from time import perf_counter, sleep
+import math, random
+
+def dc(level, noise=0.0, seed=None):
+    rand = random.Random(seed)
+    return lambda t: level + (rand.gauss(0, noise) if noise else 0.0)
+
+def sine(amplitude, freq, offset=0.0, noise=0.0, seed=None):
+    rand = random.Random(seed)
+    return lambda t: offset + amplitude * math.sin(2 * math.pi * freq * t) + (rand.gauss(0, noise) if noise else 0.0)
+
+def step(low, high, period, noise=0.0, seed=None):
+    rand = random.Random(seed)
+    return lambda t: (high if (t % period) >= period / 2 else low) + (rand.gauss(0, noise) if noise else 0.0)
+
+def joystick(center, span, holdtime=1.0, noise=0.0, seed=None):
+    ''' Alternates between resting at center and a random deflection, each held for about holdtime seconds '''
+
+    rand = random.Random(seed)
+    state = {'until': 0.0, 'level': center, 'moved': False}
+    def wave(t):
+        if t >= state['until']:
+            state['moved'] = not state['moved']
+            state['level'] = center + rand.uniform(-span, span) if state['moved'] else center
+            state['until'] = t + rand.uniform(0.5, 1.5) * holdtime
+        return state['level'] + (rand.gauss(0, noise) if noise else 0.0)
+    return wave
+
+def _delay(seconds):
+    ''' sleep() is too coarse below ~1ms so short delays busy wait '''
+
+    if seconds >= 0.001:
+        sleep(seconds)
+    elif seconds > 0:
+        end = perf_counter() + seconds
+        while perf_counter() < end:
+            pass
+
+class _simChannel:
+    ''' Looks like an adafruit AnalogIn: .value (16 bit scaled) and .voltage '''
+
+    def __init__(self, sim, x):
+        self.sim = sim
+        self.x = x
+
+    @property
+    def value(self):
+        return self.sim.read(self.x)
+
+    @property
+    def voltage(self):
+        return self.sim.read(self.x) * self.sim.lsb
+
+class simMCP3008:
+    ''' 8 channel 10 bit ADC on a simulated SPI bus '''
+
+    def __init__(self, waveforms=None, vref=3.3, latency=30e-6):
+        self.vref = vref
+        self.latency = latency
+        self.waveforms = waveforms if waveforms is not None else [dc(vref / 2, vref / 500, seed=x) for x in range(8)]
+        self.lsb = vref / 65535        # .value is scaled to 16 bit like AnalogIn
+        self.transactions = 0
+        self.t0 = perf_counter()
+        self.chan = [_simChannel(self, x) for x in range(len(self.waveforms))]
+
+    def read(self, x):
+        _delay(self.latency)
+        self.transactions += 1
+        volts = self.waveforms[x](perf_counter() - self.t0)
+        code = min(max(int(round(volts / self.vref * 1023)), 0), 1023)
+        return code << 6
+
+    def block(self, numOfChannels, numOfSamples):
+        ''' Block reader with the same read(sensor) interface as MspidevBlock.spidevBlock '''
+
+        return _simBlock(self, numOfChannels, numOfSamples)
+
+class _simBlock:
+    ''' All conversions of one call cost one sleep, so like the real ioctl the GIL is released while the bus runs '''
+
+    def __init__(self, sim, numOfChannels, numOfSamples):
+        self.sim = sim
+        self.numOfChannels = numOfChannels
+        self.numOfSamples = numOfSamples
+
+    def read(self, sensor):
+        sim = self.sim
+        _delay(sim.latency * self.numOfChannels * self.numOfSamples)
+        sim.transactions += self.numOfChannels * self.numOfSamples
+        t = perf_counter() - sim.t0
+        for x in range(self.numOfChannels):
+            for i in range(self.numOfSamples):
+                volts = sim.waveforms[x](t)
+                sensor[x][i] = min(max(int(round(volts / sim.vref * 1023)), 0), 1023) << 6
+
+    def close(self):
+        pass
+
+class simADS1115:
+    ''' 4 channel 16 bit ADC on a simulated I2C bus, single-shot conversions '''
+
+    def __init__(self, waveforms=None, gain=1, datarate=128, i2cOverhead=300e-6):
+        fsr = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}[gain]
+        self.fsr = fsr
+        self.datarate = datarate
+        self.latency = 1 / datarate + i2cOverhead   # conversion time plus config write/poll/read
+        self.waveforms = waveforms if waveforms is not None else [dc(1.65, 0.0005, seed=x) for x in range(4)]
+        self.lsb = fsr / 32767         # same scaling as AnalogIn.voltage
+        self.transactions = 0
+        self.t0 = perf_counter()
+        self.chan = [_simChannel(self, x) for x in range(len(self.waveforms))]
+
+    def _convert(self, x):
+        volts = self.waveforms[x](perf_counter() - self.t0)
+        return min(max(int(round(volts / self.lsb)), -32768), 32767)
+
+    def read(self, x):
+        _delay(self.latency)
+        self.transactions += 1
+        return self._convert(x)
+
+    def continuous(self, datarate=860, settle=1):
+        ''' Continuous-conversion reader with the same interface as MadsContinuous.adsContinuous '''
+
+        return _simContinuous(self, datarate, settle)
+
+    def chip(self):
+        ''' Split single-shot start()/read() like MbusManager.adsChip (for ads1115Group) '''
+
+        return _simChip(self)
+
+class _simChip:
+    ''' Conversion finishes 1/datarate after start(), read() waits for it plus the i2c read '''
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.period = 1 / sim.datarate
+        self.overhead = sim.latency - self.period
+        self.channel = 0
+        self.done = 0.0
+
+    def start(self, channel):
+        self.channel = channel
+        _delay(self.overhead / 2)       # config write
+        self.done = perf_counter() + self.period
+
+    def read(self):
+        _delay(self.done - perf_counter())
+        _delay(self.overhead / 2)       # status poll and conversion read
+        self.sim.transactions += 1
+        return self.sim._convert(self.channel)
+
+class _simContinuous:
+    ''' Back to back conversions every 1/datarate, one i2c read per sample '''
+
+    def __init__(self, sim, datarate, settle):
+        self.sim = sim
+        self.datarate = datarate
+        self.period = 1 / datarate
+        self.settle = settle
+        self.channel = None
+        self.nextConversion = 0.0
+
+    def select(self, channel):
+        if channel == self.channel:
+            return
+        self.channel = channel
+        self.nextConversion = perf_counter() + self.period
+        for x in range(self.settle):
+            self.read()
+
+    def read(self):
+        now = perf_counter()
+        _delay(self.nextConversion - now)
+        self.nextConversion = max(now, self.nextConversion) + self.period
+        self.sim.transactions += 1
+        return self.sim._convert(self.channel)
+
+    def close(self):
+        pass
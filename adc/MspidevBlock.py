@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+''' Raw spidev block transfer for the MCP3008.
+ All channel x sample conversions for one getdata() call are queued as a single
+ SPI_IOC_MESSAGE ioctl (one syscall) instead of one AnalogIn.value per sample.
+
+ The MCP3008 only starts a new conversion on a falling edge of CS, so a plain
+ xfer2 of the whole command buffer (CS held low) would return zeros after the first
+ sample. Each 3 byte frame is sent as its own spi_ioc_transfer with cs_change=1
+ so the kernel toggles CS between frames while everything still goes out in one call.
+
+ Values are returned scaled to 16 bit (raw10 << 6) to match adafruit AnalogIn.value,
+ so noise thresholds stay the same for both backends.
+'''
+import spidev, fcntl, ctypes
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class _spiIocTransfer(ctypes.Structure):
+    ''' struct spi_ioc_transfer from linux/spi/spidev.h (32 bytes) '''
+    _fields_ = [("tx_buf", ctypes.c_uint64),
+                ("rx_buf", ctypes.c_uint64),
+                ("len", ctypes.c_uint32),
+                ("speed_hz", ctypes.c_uint32),
+                ("delay_usecs", ctypes.c_uint16),
+                ("bits_per_word", ctypes.c_uint8),
+                ("cs_change", ctypes.c_uint8),
+                ("tx_nbits", ctypes.c_uint8),
+                ("rx_nbits", ctypes.c_uint8),
+                ("word_delay_usecs", ctypes.c_uint8),
+                ("pad", ctypes.c_uint8)]
+
+def _spiIocMessage(n):
+    ''' SPI_IOC_MESSAGE(n) = _IOW('k', 0, char[n*32]) '''
+    return (1 << 30) | ((n * ctypes.sizeof(_spiIocTransfer)) << 16) | (ord('k') << 8)
+
+MAXFRAMES = 511   # ioctl size field is 14 bits, 511 x 32 bytes is the largest message
+
+class spidevBlock:
+    ''' Reads numOfChannels x numOfSamples MCP3008 conversions with one ioctl per call '''
+
+    def __init__(self, bus, device, numOfChannels, numOfSamples, speed=1000000):
+        self.spi = spidev.SpiDev()
+        self.spi.open(bus, device)     # /dev/spidev<bus>.<device>
+        self.spi.max_speed_hz = speed
+        self.fd = self.spi.fileno()
+        self.numOfChannels = numOfChannels
+        self.numOfSamples = numOfSamples
+        self.numOfFrames = numOfChannels * numOfSamples
+        # tx/rx buffers and transfer structs are built once and reused every call
+        self.txbuf = (ctypes.c_uint8 * (3 * self.numOfFrames))()
+        self.rxbuf = (ctypes.c_uint8 * (3 * self.numOfFrames))()
+        for x in range(numOfChannels):
+            for i in range(numOfSamples):
+                k = 3 * (x * numOfSamples + i)
+                self.txbuf[k] = 1                  # start bit
+                self.txbuf[k + 1] = (8 + x) << 4   # single ended, channel x
+        self.messages = []
+        txaddr = ctypes.addressof(self.txbuf)
+        rxaddr = ctypes.addressof(self.rxbuf)
+        for first in range(0, self.numOfFrames, MAXFRAMES):
+            count = min(MAXFRAMES, self.numOfFrames - first)
+            xfers = (_spiIocTransfer * count)()
+            for j in range(count):
+                xfers[j].tx_buf = txaddr + 3 * (first + j)
+                xfers[j].rx_buf = rxaddr + 3 * (first + j)
+                xfers[j].len = 3
+                xfers[j].speed_hz = speed
+                xfers[j].bits_per_word = 8
+                xfers[j].cs_change = 1 if j < count - 1 else 0  # release CS between frames, not after the last
+            self.messages.append((_spiIocMessage(count), xfers))
+        if np is not None:   # numpy view on the rx buffer (no copy) for vectorized decode into ndarrays
+            self.rxarray = np.frombuffer(self.rxbuf, dtype=np.uint8).reshape(numOfChannels, numOfSamples, 3)
+
+    def read(self, sensor):
+        ''' Fill sensor[x][i] with 16 bit scaled values for every channel and sample '''
+
+        for request, xfers in self.messages:
+            fcntl.ioctl(self.fd, request, xfers)
+        if np is not None and isinstance(sensor, np.ndarray):
+            np.left_shift(((self.rxarray[:, :, 1] & 3).astype(np.uint16) << 8) | self.rxarray[:, :, 2], 6, out=sensor, casting='unsafe')
+            return
+        rx = bytes(self.rxbuf)
+        values = [(((rx[k + 1] & 3) << 8) | rx[k + 2]) << 6 for k in range(0, 3 * self.numOfFrames, 3)]
+        n = self.numOfSamples
+        for x in range(self.numOfChannels):
+            sensor[x][:] = values[x * n:(x + 1) * n]
+
+    def close(self):
+        self.spi.close()
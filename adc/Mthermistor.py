@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+''' NTC thermistor temperatures from raw ADC codes through a lookup table built once at setup.
+ The divider math, log and Steinhart-Hart equation run for every table entry when the table is built, so a
+ conversion is only an interpolation between two entries. A frame of 40 sensors is a few numpy operations.
+
+ thermistor(R0, T0, beta, R1, Vcc)           - beta equation, R0 ohms at T0 C (ie 10k at 25C, B 3950)
+ thermistor(A=, B=, C=, R1=, Vcc=)           - full Steinhart-Hart 1/T = A + B ln(R) + C ln(R)^3
+  R1 is the fixed resistor from Vcc to the ADC input and the thermistor goes from the input to ground
+  (highSide=True for the thermistor on the Vcc side).
+
+ thermistorTable(sensors, scale, maxCode)    - one table per distinct sensor, sensors is one thermistor per channel
+  scale   - volts per raw code (driver.rawScale, ie vref/65535 for mcp3008, 4.096/32767 for ads1115 gain 1)
+  maxCode - highest raw code (65535 mcp3008, 32767 ads1115)
+  step    - raw codes per table entry (default gives ~1024 entries, the mcp3008 10 bit codes exactly)
+  convert(codes) - one code per sensor, or (sensors x samples), to degrees C (numbers, NaN for an open or
+                   shorted sensor)
+  fromVolts(volts) - same from getdata() volts
+
+ ntc = adc.thermistor(R0=10000, T0=25, beta=3950, R1=10000, Vcc=3.3)
+ table = adc.thermistorTable([ntc] * 40, mcps.rawScale, 65535)
+ temps = table.convert(frame)   # 40 raw codes -> 40 temperatures
+'''
+import math
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+KELVIN = 273.15
+
+class thermistor:
+    ''' Coefficients and divider of one NTC thermistor '''
+
+    def __init__(self, R0=10000, T0=25, beta=3950, R1=10000, Vcc=3.3, A=None, B=None, C=None, highSide=False):
+        self.R0 = R0
+        self.T0 = T0
+        self.beta = beta
+        self.A, self.B, self.C = A, B, C
+        self.R1 = R1
+        self.Vcc = Vcc
+        self.highSide = highSide
+
+    def key(self):
+        ''' Sensors with the same key share a table '''
+
+        return (self.R0, self.T0, self.beta, self.A, self.B, self.C, self.R1, self.Vcc, self.highSide)
+
+    def resistance(self, volts):
+        ''' Thermistor resistance from the divider output, None outside 0..Vcc (open or shorted) '''
+
+        if not 0 < volts < self.Vcc:
+            return None
+        if self.highSide:
+            return self.R1 * (self.Vcc - volts) / volts
+        return volts * self.R1 / (self.Vcc - volts)
+
+    def temperature(self, volts):
+        ''' Degrees C from the divider output (exact, used to build the table). NaN outside 0..Vcc '''
+
+        R = self.resistance(volts)
+        if R is None:
+            return float('nan')
+        lnR = math.log(R)
+        if self.A is not None:
+            inverse = self.A + self.B * lnR + self.C * lnR ** 3
+        else:
+            inverse = 1 / (self.T0 + KELVIN) + (lnR - math.log(self.R0)) / self.beta
+        return 1 / inverse - KELVIN
+
+class thermistorTable:
+    ''' Raw code to temperature lookup tables for a set of thermistors, converted with vectorized interpolation '''
+
+    def __init__(self, sensors, scale, maxCode=65535, step=None):
+        self.sensors = sensors
+        self.scale = scale
+        self.maxCode = maxCode
+        self.step = step if step is not None else max(1, (maxCode + 1) // 1024)
+        self.size = maxCode // self.step + 2        # entries, the last one is past maxCode
+        rows = {}
+        self.rows = []                              # table row of each sensor
+        tables = []
+        for sensor in sensors:
+            key = sensor.key()
+            if key not in rows:
+                rows[key] = len(tables)
+                tables.append([sensor.temperature(k * self.step * scale) for k in range(self.size)])
+            self.rows.append(rows[key])
+        if np is not None:
+            self.table = np.array(tables)
+            self.slope = np.diff(self.table, axis=1)    # per entry slope so convert is one multiply-add
+            self.rowIndex = np.array(self.rows)
+        else:
+            self.table = tables
+
+    def convert(self, codes):
+        ''' Temperatures (C) for one raw code per sensor, or a (sensors x samples) array '''
+
+        if np is None:
+            return [self._convertOne(self.table[row], code) for row, code in zip(self.rows, codes)]
+        pos = np.asarray(codes, dtype=float) / self.step
+        np.clip(pos, 0, self.size - 1.000001, out=pos)
+        index = pos.astype(np.intp)
+        pos -= index                                # fraction between the two entries
+        rows = self.rowIndex if pos.ndim == 1 else self.rowIndex[:, None]
+        return self.table[rows, index] + pos * self.slope[rows, index]
+
+    def _convertOne(self, table, code):
+        pos = min(max(code / self.step, 0), self.size - 1.000001)
+        index = int(pos)
+        return table[index] + (pos - index) * (table[index + 1] - table[index])
+
+    def fromVolts(self, volts):
+        ''' Temperatures (C) from volts (getdata() values) instead of raw codes '''
+
+        if np is None:
+            return self.convert([v / self.scale for v in volts])
+        return self.convert(np.asarray(volts, dtype=float) / self.scale)
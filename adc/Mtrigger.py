@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+''' Oscilloscope style triggered capture. Sample fast in continuous mode (rate=, useNumpy=True), keep the recent
+ history of every channel in a preallocated circular pre-trigger buffer and publish only the short blocks
+ around an event (a transient, a knock, a button bounce) instead of averaged readings.
+
+ trigger(channel, mode, level, high, slope)
+  'rising'  - channel crosses level going up          'falling' - crosses level going down
+  'window'  - leaves the level..high window            'slope'   - rate of change reaches slope (units/s,
+                                                                    negative slope for a falling edge)
+  Levels are in the units fed to the engine (raw counts from the driver's ring buffer).
+
+ triggerEngine(numOfChannels, triggers, preSamples, postSamples)
+  feed(times, block) takes a (channels x n) block. Every trigger is evaluated on the whole block with numpy
+  (no python check per sample). When one fires the engine waits for postSamples more samples and freezes
+  preSamples + postSamples of every channel. The trigger re-arms holdoff samples after it fired (default
+  postSamples). poll(buffer) feeds the frames a driver's sampler added to its ring buffer since the last poll.
+  Both return [(info, block), ...] with block as columns {"t": [...], "a0f": [...], ...} (like Mbatch.py)
+  and info {"trigger", "channel", "time", "preSamples"}.
+
+ mcp = adc.mcp3008(2, 5, 400, 1, 8, backend='spidev', useNumpy=True, rate=5000, bufferSize=10000)
+ scope = adc.triggerEngine(2, [adc.trigger(0, 'rising', 40000)], preSamples=500, postSamples=1500, scale=mcp.rawScale)
+ for info, block in scope.poll(mcp.buffer):   # every loop, faster than bufferSize/rate
+     mqtt_client.publish('pi2nred/mcp3008/trigger', json.dumps(dict(block, trigger=info)))
+'''
+import logging, sys
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MODES = ('rising', 'falling', 'window', 'slope')
+
+class trigger:
+    ''' Trigger condition on one channel, evaluated on blocks of samples '''
+
+    def __init__(self, channel, mode='rising', level=0.0, high=None, slope=None, name=None):
+        if mode not in MODES:
+            raise ValueError("trigger mode must be one of {0}".format(MODES))
+        if mode == 'window' and high is None:
+            raise ValueError("window trigger needs level (low) and high")
+        if mode == 'slope' and not slope:
+            raise ValueError("slope trigger needs a non zero slope")
+        self.channel = channel
+        self.mode = mode
+        self.level = level
+        self.high = high
+        self.slope = slope
+        self.name = name if name is not None else '{0} a{1}'.format(mode, channel)
+
+    def first(self, t, x):
+        ''' Index of the first sample in x[2:] that fires, None if none. x[0:2] are the two samples before the block '''
+
+        cur, prev = x[2:], x[1:-1]
+        if self.mode == 'rising':
+            hits = (prev < self.level) & (cur >= self.level)
+        elif self.mode == 'falling':
+            hits = (prev > self.level) & (cur <= self.level)
+        elif self.mode == 'window':
+            out = (x < self.level) | (x > self.high)
+            hits = out[2:] & ~out[1:-1]
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = np.diff(x) / np.diff(t)
+            rate[~np.isfinite(rate)] = 0.0     # repeated timestamps
+            if self.slope > 0:
+                hits = (rate[:-1] < self.slope) & (rate[1:] >= self.slope)
+            else:
+                hits = (rate[:-1] > self.slope) & (rate[1:] <= self.slope)
+        index = np.flatnonzero(hits)
+        return int(index[0]) if len(index) else None
+
+class triggerEngine:
+    ''' Circular pre-trigger buffer of every channel plus the triggers that freeze blocks out of it '''
+
+    def __init__(self, numOfChannels, triggers, preSamples=500, postSamples=500, holdoff=None, blockSize=1000, keys=None, scale=1.0, logger=None):
+        if logger is not None:                        # Use logger passed as argument
+            self.logger = logger
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        if np is None:
+            self.logger.error("triggerEngine requires numpy (pip3 install numpy)")
+            sys.exit()
+        self.numOfChannels = numOfChannels
+        self.triggers = triggers
+        self.preSamples = preSamples
+        self.postSamples = postSamples
+        self.holdoff = holdoff if holdoff is not None else postSamples   # samples after a trigger before re-arming
+        self.blockSize = blockSize       # feed() processes longer blocks in pieces of blockSize
+        self.keys = keys if keys is not None else ['a' + str(x) + 'f' for x in range(numOfChannels)]
+        self.scale = scale               # applied to the frozen block, ie driver.rawScale for volts
+        self.size = preSamples + postSamples + blockSize
+        self.t = np.zeros(self.size)     # circular pre-trigger buffer, fixed memory
+        self.data = np.zeros((numOfChannels, self.size))
+        self.frozenT = np.zeros(preSamples + postSamples)
+        self.frozen = np.zeros((numOfChannels, preSamples + postSamples))
+        self.count = 0                   # samples written
+        self.armed = preSamples          # first sample a trigger may fire on (full pre-trigger history)
+        self.evaluated = 0               # samples already checked without a trigger, only new ones are checked
+        self.pending = None              # (sample number, trigger) waiting for its post-trigger samples
+        self.read = 0                    # ring buffer frames consumed by poll()
+        self.lost = 0
+        self.fired = 0
+
+    def _write(self, times, block):
+        n = len(times)
+        i = self.count % self.size
+        first = min(n, self.size - i)
+        self.t[i:i + first] = times[:first]
+        self.data[:, i:i + first] = block[:, :first]
+        if first < n:                    # wrap around
+            self.t[:n - first] = times[first:]
+            self.data[:, :n - first] = block[:, first:]
+        self.count += n
+
+    def _evaluate(self):
+        ''' First trigger to fire from self.armed on, as (sample number, trigger) '''
+
+        start = max(self.armed, self.evaluated, self.count - self.size + 2)
+        if start >= self.count:
+            return None
+        idx = np.maximum(np.arange(start - 2, self.count), 0) % self.size
+        t = self.t[idx]
+        best = None
+        for trig in self.triggers:
+            k = trig.first(t, self.data[trig.channel, idx])
+            if k is not None and (best is None or k < best[0]):
+                best = (k, trig)
+        if best is None:
+            self.evaluated = self.count
+            return None
+        return start + best[0], best[1]
+
+    def _freeze(self, index, trig):
+        idx = np.arange(index - self.preSamples, index + self.postSamples) % self.size
+        np.take(self.t, idx, out=self.frozenT)
+        np.take(self.data, idx, axis=1, out=self.frozen)
+        block = {'t': np.round(self.frozenT, 6).tolist()}
+        for x in range(self.numOfChannels):
+            block[self.keys[x]] = (self.frozen[x] * self.scale).tolist()
+        info = {'trigger': trig.name, 'channel': trig.channel, 'time': float(self.t[index % self.size]), 'preSamples': self.preSamples}
+        self.fired += 1
+        self.logger.debug("Triggered {0} at {1}".format(trig.name, info['time']))
+        return info, block
+
+    def feed(self, times, block):
+        ''' Add (channels x n) samples taken at times. Returns the frozen [(info, block), ...] '''
+
+        events = []
+        for first in range(0, len(times), self.blockSize):
+            self._write(times[first:first + self.blockSize], block[:, first:first + self.blockSize])
+            while True:
+                if self.pending is None:
+                    self.pending = self._evaluate()
+                    if self.pending is None:
+                        break
+                index, trig = self.pending
+                if self.count < index + self.postSamples:
+                    break                # wait for the post-trigger samples
+                events.append(self._freeze(index, trig))
+                self.pending = None
+                self.armed = index + self.holdoff
+        return events
+
+    def poll(self, buffer):
+        ''' Feed the frames added to a driver's ring buffer (useNumpy) since the last poll '''
+
+        first, times, frames = buffer.since(self.read)
+        if first > self.read and self.read:
+            self.lost += first - self.read
+            self.logger.warning("Trigger engine fell behind the sampler, {0} frames lost".format(self.lost))
+        self.read = first + len(times)
+        if not len(times):
+            return []
+        return self.feed(times, frames.T)
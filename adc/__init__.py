@@ -1,2 +1,21 @@
 from .MadcMCP3008_8CH import mcp3008
-from .MadcADS1115_4CH import ads1115
\ No newline at end of file
+from .MadcMCP3008_Array import mcp3008Array
+from .MadcADS1115_4CH import ads1115
+from .Mfilters import filterChain, movingAverage, ema, median, cic
+from .MnoiseFloor import noiseFloor
+from .Mcompress import compressor, swingingDoor
+from .Msimulate import simMCP3008, simADS1115, dc, sine, step, joystick
+from .MbusManager import ads1115Group, sharedI2C
+from .Mscheduler import ticker
+from .Mcycle import cycleExecutor
+from .Mbatch import batchPublisher
+from .Moutbox import outbox, storeAndForward
+from .Minflux import influxWriter
+from .Mburst import burstCapture
+from .Mtrigger import trigger, triggerEngine
+from .Mfeatures import spectralFeatures
+from .Mthermistor import thermistor, thermistorTable
+from .Mcalibration import calibration, guidedCalibration
+from .Mconfig import loadConfig, validateConfig, buildDevices, buildTopics, busGroups, busWorkers
+from .Mpayload import encode as encodePayload, decode as decodePayload
+from .Masync import asyncADC, asyncMQTT, runAsync
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+'''
+asyncio version of demoMQTT.py. One event loop runs everything:
+ each ADC is a task that reads it every msginterval (blocking bus reads run in the executor, so the
+ ADS1115 on I2C and the MCP3008 on SPI overlap), a publisher task sends the readings, and paho is driven
+ from the loop instead of the loop_start() thread.
+ When the broker disconnects the tasks are cancelled, the ADCs stopped and the script exits.
+
+Publishes on pi2nred/<lvl2>/<MQTT_CLIENT_ID> with the same json payload as demoMQTT.py
+
+Check Hardware and MQTT setup sections for pin assignments and topics
+'''
+
+import sys, logging, asyncio
+import paho.mqtt.client as mqtt
+from os import path
+from pathlib import Path
+import adc
+
+def on_connect(client, userdata, flags, rc):
+    """ on connect callback verifies a connection established and subscribe to TOPICs"""
+    if rc==0:
+        for topic in MQTT_SUB_TOPIC:
+            client.subscribe(topic)
+            logging.info("Subscribed to: {0}".format(topic))
+        logging.info("Successful Connection: {0}".format(str(rc)))
+    else:
+        logging.info("Unsuccessful Connection - Code {0}".format(str(rc)))
+
+def on_message(client, userdata, msg):
+    """on message callback will receive messages from the server/broker. Must be subscribed to the topic in on_connect"""
+    logging.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
+
+async def main():
+    global MQTT_SUB_TOPIC
+
+    #==== LOGGING/DEBUGGING ============#
+    logging.basicConfig(level=logging.INFO) # Set to CRITICAL to turn logging off. Set to DEBUG to get variables. Set to INFO for status messages.
+    logger = logging.getLogger('asyncADC')
+
+    #==== HARDWARE SETUP ===============#
+    i2cLock = asyncio.Lock()   # devices on the same bus share a lock so their reads do not overlap
+    spiLock = asyncio.Lock()
+    adcSet = {}  # Can comment out any ADC type not being used
+    adcSet['ads1115'] = adc.asyncADC(adc.ads1115(1, 0.003, 1, 1, 0x48), i2cLock) # numOfChannels, noiseThreshold (V), max interval, gain=1 (+/-4.1V readings), address
+    adcSet['mcp3008'] = adc.asyncADC(adc.mcp3008(2, 5, 400, 1, 8), spiLock) # numOfChannels, vref, noiseThreshold (raw ADC), maxInterval = 1sec, and ChipSelect GPIO pin
+    msginterval = 0.5
+
+    #=======   MQTT SETUP ==============#
+    home = str(Path.home())                       # Import mqtt and wifi info. Remove if hard coding in python script
+    with open(path.join(home, "stem"),"r") as f:
+        user_info = f.read().splitlines()
+    MQTT_SERVER = '10.0.0.115'                    # Replace with IP address of device running mqtt server/broker
+    MQTT_USER = user_info[0]                      # Replace with your mqtt user ID
+    MQTT_PASSWORD = user_info[1]                  # Replace with your mqtt password
+    MQTT_CLIENT_ID = 'pi'
+    MQTT_SUB_TOPIC = ['nred2' + MQTT_CLIENT_ID + '/adcZCMD/+']
+    topics = {device: 'pi2nred/' + device + '/' + MQTT_CLIENT_ID for device in adcSet}   # lvl2 is the device name
+
+    #==== START/BIND MQTT FUNCTIONS ====#
+    mqtt_client = mqtt.Client(MQTT_CLIENT_ID) # Create mqtt_client object
+    mqtt_client.username_pw_set(MQTT_USER, MQTT_PASSWORD) # Need user/password to connect to broker
+    mqtt_client.on_connect = on_connect    # Bind on connect
+    mqtt_client.on_message = on_message    # Bind on message
+    broker = adc.asyncMQTT(mqtt_client, logger)  # Drive the client from the event loop (must be created before connect)
+    logger.info("Connecting to: {0}".format(MQTT_SERVER))
+    mqtt_client.connect(MQTT_SERVER, 1883)
+    if not await broker.waitConnected():   # If connection failed stop. Use the rc code to trouble shoot
+        for device in adcSet.values():
+            await device.stop()
+        sys.exit()
+
+    #==== MAIN LOOP ====================#
+    try:
+        await adc.runAsync(adcSet, broker, topics, msginterval, logger)   # returns when the broker disconnects
+    finally:
+        mqtt_client.disconnect()
+        logger.info("Cleaned up")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Pressed ctrl-C")
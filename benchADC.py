@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+''' Microbenchmark for the getdata() hot path of mcp3008, ads1115 and espADC on simulated buses.
+ Sweeps read path, channel count, numOfSamples and noise level and reports per configuration
+  calls/s, samples/s, p50/p99 latency (us), net memory blocks and peak bytes allocated per call.
+ Results are written to a json baseline. Pass --compare with an older baseline to flag regressions.
+
+ $ python3 benchADC.py                                  # write bench_baseline.json
+ $ python3 benchADC.py --compare bench_baseline.json     # write bench_latest.json, exit code 1 if p50 latency regressed more than --tolerance
+ $ python3 benchADC.py --latency                         # include simulated bus latency (slow, measures throughput not CPU)
+
+ By default the simulated bus latency is zero so the numbers are the Python cost of getdata().
+ espADC is MicroPython code. It is loaded from upyADC/lib/adc.py with small machine/utime shims backed by
+ the same simulated waveforms, so only its logic is measured (not esp32 speed).
+'''
+import sys, json, logging, argparse, platform, tracemalloc, importlib.util, types
+from time import perf_counter, perf_counter_ns, time
+from os import path
+import adc
+
+CHANNELS = {'mcp3008': range(1, 9), 'ads1115': range(1, 5), 'espADC': range(1, 9)}
+SAMPLES = [1, 10]
+NOISE = [0.0, 0.002, 0.02]     # Volts (std dev)
+# read paths: sample = one bus read per sample (adafruit), block = one transfer per call (spidev, sim.block()),
+# numpy = useNumpy sample matrix
+VARIANTS = {'mcp3008': ['sample', 'block', 'numpy', 'block+numpy'], 'ads1115': ['sample', 'numpy'], 'espADC': ['sample']}
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def load_espADC(waveforms):
+    ''' Import upyADC/lib/adc.py with machine/utime shims reading from the simulated waveforms '''
+
+    t0 = perf_counter()
+    machine = types.ModuleType('machine')
+    class Pin:
+        def __init__(self, pin, *args):
+            self.pin = pin
+    class ADC:
+        ATTN_11DB = 3
+        def __init__(self, pin):
+            self.wave = waveforms[len(self.instances) % len(waveforms)]
+            self.instances.append(self)
+        def atten(self, attn):
+            pass
+        def read(self):
+            return min(max(int(self.wave(perf_counter() - t0) / 3.3 * 4095), 0), 4095)
+    ADC.instances = []
+    machine.Pin, machine.ADC = Pin, ADC
+    utime = types.ModuleType('utime')
+    utime.ticks_ms = lambda: int(perf_counter() * 1000)
+    utime.ticks_diff = lambda a, b: a - b
+    timer = types.ModuleType('timer')
+    timer.TimerFunc = lambda f: f
+    sys.modules.update({'machine': machine, 'utime': utime, 'ulogging': logging, 'timer': timer})
+    spec = importlib.util.spec_from_file_location('espadc', path.join(path.dirname(path.abspath(__file__)), 'upyADC', 'lib', 'adc.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.espADC
+
+def create(driver, variant, channels, samples, noise, latency, logger):
+    useNumpy = 'numpy' in variant
+    if driver == 'mcp3008':
+        waves = [adc.sine(1.0, 2, 1.65, noise, seed=x) for x in range(8)]
+        sim = adc.simMCP3008(waves, 3.3) if latency else adc.simMCP3008(waves, 3.3, latency=0)
+        device = adc.mcp3008(channels, 3.3, 400, 1, 8, logger, backend='sim', sim=sim, numOfSamples=samples, useNumpy=useNumpy)
+        if 'block' in variant:   # same read(sensor) path as backend='spidev', one simulated transfer per call
+            device.block = sim.block(channels, samples)
+        return device
+    if driver == 'ads1115':
+        waves = [adc.sine(1.0, 2, 1.65, noise, seed=x) for x in range(4)]
+        sim = adc.simADS1115(waves, 1) if latency else adc.simADS1115(waves, 1, datarate=float('inf'), i2cOverhead=0)
+        return adc.ads1115(channels, 0.003, 1, 1, 0x48, logger, numOfSamples=samples, backend='sim', sim=sim, useNumpy=useNumpy)
+    espADC = load_espADC([adc.sine(1.0, 2, 1.65, noise, seed=x) for x in range(8)])
+    device = espADC(list(range(32, 32 + channels)), 3.3, 35, 1000, logger=logger)
+    device.numOfSamples = samples
+    device.sensor = [[0 for i in range(samples)] for x in range(channels)]
+    return device
+
+def measure(device, duration, minCalls=50):
+    ''' Time individual getdata() calls, then count memory blocks/peak bytes over a separate run '''
+
+    for x in range(5):   # warm up
+        device.getdata()
+    times = []
+    end = perf_counter() + duration
+    while perf_counter() < end or len(times) < minCalls:
+        t = perf_counter_ns()
+        device.getdata()
+        times.append(perf_counter_ns() - t)
+    calls = len(times)
+    times.sort()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for x in range(minCalls):
+        device.getdata()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    netblocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {'calls_per_s': round(calls / (sum(times) / 1e9), 1),
+            'p50_us': round(times[calls // 2] / 1000, 2),
+            'p99_us': round(times[min(calls - 1, int(calls * 0.99))] / 1000, 2),
+            'net_blocks_per_call': round(netblocks / minCalls, 2),
+            'peak_bytes_per_call': peak}
+
+def run(args, logger):
+    results = []
+    for driver in args.drivers:
+        for variant in VARIANTS[driver]:
+            if variant not in args.variants:
+                continue
+            if 'numpy' in variant and numpy is None:
+                print("{0:8} {1}: skipped, numpy not installed".format(driver, variant))
+                continue
+            for channels in CHANNELS[driver]:
+                for samples in SAMPLES:
+                    for noise in NOISE:
+                        device = create(driver, variant, channels, samples, noise, args.latency, logger)
+                        result = {'driver': driver, 'variant': variant, 'channels': channels, 'samples': samples, 'noise': noise}
+                        result.update(measure(device, args.duration))
+                        result['samples_per_s'] = round(result['calls_per_s'] * channels * samples, 1)
+                        results.append(result)
+                        print("{driver:8} {variant:11} ch:{channels} n:{samples:2} noise:{noise:<5} {calls_per_s:>10.1f} calls/s {samples_per_s:>11.1f} samples/s "
+                              "p50:{p50_us:>8.2f}us p99:{p99_us:>8.2f}us blocks/call:{net_blocks_per_call:>5} peak:{peak_bytes_per_call}B".format(**result))
+    return results
+
+def _key(r):
+    return r['driver'], r.get('variant', 'sample'), r['channels'], r['samples'], r['noise']   # baselines without variant were the sample path
+
+def compare(results, baseline, tolerance):
+    ''' Print configurations whose p50 latency is more than tolerance slower than the baseline. Returns count '''
+
+    old = {_key(r): r for r in baseline['results']}
+    regressions = 0
+    for r in results:
+        b = old.get(_key(r))
+        if b is not None and r['p50_us'] > b['p50_us'] * (1 + tolerance):
+            regressions += 1
+            print("REGRESSION {driver} {variant} ch:{channels} n:{samples} noise:{noise} p50 {0}us -> {1}us".format(b['p50_us'], r['p50_us'], **r))
+    print("{0} regressions against baseline ({1} configurations, tolerance {2:.0%})".format(regressions, len(results), tolerance))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drivers', nargs='+', default=list(CHANNELS), choices=list(CHANNELS))
+    parser.add_argument('--variants', nargs='+', default=sorted({v for variants in VARIANTS.values() for v in variants}),
+                        help='read paths to time: sample, block, numpy, block+numpy')
+    parser.add_argument('--duration', type=float, default=0.2, help='seconds timed per configuration')
+    parser.add_argument('--latency', action='store_true', help='include simulated bus latency')
+    parser.add_argument('--output', help='results json (default bench_baseline.json, bench_latest.json with --compare)')
+    parser.add_argument('--compare', help='baseline json to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p50 slowdown before flagging (0.2 = 20%%)')
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = 'bench_latest.json' if args.compare else 'bench_baseline.json'
+    baseline = None
+    if args.compare:
+        if path.realpath(args.output) == path.realpath(args.compare):
+            parser.error("--output and --compare are the same file, the baseline would be overwritten before the comparison")
+        with open(args.compare) as f:   # read before running, a missing baseline fails now and not after the sweep
+            baseline = json.load(f)
+
+    logger = logging.getLogger('bench')
+    logger.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args, logger)
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'time': time(),
+                   'latency': args.latency, 'results': results}, f, indent=1)
+    print("Wrote {0}".format(args.output))
+    if baseline is not None:
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+'''
+Config file version of demoMQTT.py. The devices, topics and broker come from a TOML/JSON/YAML file
+(adcConfig.toml by default) instead of the HARDWARE SETUP and MQTT SETUP sections, so a deployment only
+edits the config. The file is checked before any device is opened (see adc/Mconfig.py).
+
+ $ python3 configADCmqtt.py adcConfig.toml
+
+With [loop] workers = true each bus group (I2C, SPI0, SPI1) is read in its own process and this process
+only publishes, so a node with many ADCs uses every core.
+
+Commands on nred2pi/<lvl2>ZCMD/burst are handled like demoMQTT.py (raw capture to bursts/*.npy, published on
+pi2nred/<lvl2>/burst). Bursts need the devices in this process, so they are rejected with workers = true.
+
+Publishes on pi2nred/<lvl2>/<clientId><publvl3> with the same payload as demoMQTT.py
+'''
+
+import sys, json, logging
+from time import sleep
+import paho.mqtt.client as mqtt
+from os import path
+import adc
+
+def on_connect(client, userdata, flags, rc):
+    """ on connect callback verifies a connection established and subscribe to TOPICs"""
+    if rc==0:
+        mqtt_client.connected = True
+        for topic in MQTT_SUB_TOPIC:
+            client.subscribe(topic)
+            logging.info("Subscribed to: {0}".format(topic))
+        logging.info("Successful Connection: {0}".format(str(rc)))
+    else:
+        mqtt_client.failed_connection = True  # If rc != 0 then failed to connect. Set flag to stop mqtt loop
+        logging.info("Unsuccessful Connection - Code {0}".format(str(rc)))
+
+def on_message(client, userdata, msg):
+    """on message callback will receive messages from the server/broker. Must be subscribed to the topic in on_connect"""
+    logging.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
+    pTopic = msg.topic.split('/')   # nred2pi/<lvl2>ZCMD/<command>
+    if len(pTopic) == 3 and pTopic[1].endswith('ZCMD') and pTopic[2] == 'burst':
+        if bursts is None:
+            logging.error("Burst command on {0} rejected, bursts need [loop] workers = false".format(msg.topic))
+            return
+        lvl2 = pTopic[1][:-len('ZCMD')]
+        bursts.request(msg.payload, [device for device in deviceD if deviceD[device]['lvl2'] == lvl2]) # Runs in the main loop
+
+def on_disconnect(client, userdata, rc=0):
+    logging.error("DisConnected result code "+str(rc))   # loop_start thread keeps running and reconnects
+
+def main():
+    global MQTT_SUB_TOPIC, mqtt_client, deviceD, bursts
+
+    #==== LOGGING/DEBUGGING ============#
+    logging.basicConfig(level=logging.INFO) # Set to CRITICAL to turn logging off. Set to DEBUG to get variables. Set to INFO for status messages.
+    logger = logging.getLogger('configADC')
+
+    #==== CONFIG =======================#
+    configPath = sys.argv[1] if len(sys.argv) > 1 else path.join(path.dirname(path.abspath(__file__)), 'adcConfig.toml')
+    config = adc.loadConfig(configPath, logger)    # exits with every problem logged if the file is not valid
+    mqttConfig = config['mqtt']
+    loop = config.get('loop', {})
+    deviceD, MQTT_SUB_TOPIC = adc.buildTopics(config)
+    bursts = None if loop.get('workers') else adc.burstCapture(path.join(path.dirname(path.abspath(__file__)), 'bursts'), logger=logger)
+    for device in deviceD:
+        logger.info("{0} Publishing to: {1} keys: {2}".format(device, deviceD[device]['pubtopic'], list(deviceD[device]['data'])))
+    if 'user' in mqttConfig:
+        MQTT_USER, MQTT_PASSWORD = mqttConfig['user'], mqttConfig.get('password', '')
+    else:
+        with open(path.expanduser(mqttConfig.get('credentials', '~/stem')), "r") as f:   # user and password lines
+            MQTT_USER, MQTT_PASSWORD = f.read().splitlines()[:2]
+
+    #==== START/BIND MQTT FUNCTIONS ====#
+    mqtt.Client.connected = False          # Flag for initial connection (different than mqtt.Client.is_connected)
+    mqtt.Client.failed_connection = False  # Flag for failed initial connection
+    mqtt_client = mqtt.Client(mqttConfig.get('clientId', 'pi')) # Create mqtt_client object
+    mqtt_client.username_pw_set(MQTT_USER, MQTT_PASSWORD) # Need user/password to connect to broker
+    mqtt_client.on_connect = on_connect    # Bind on connect
+    mqtt_client.on_disconnect = on_disconnect    # Bind on disconnect
+    mqtt_client.on_message = on_message    # Bind on message
+    mqtt_client.reconnect_delay_set(min_delay=1, max_delay=60) # Reconnect backoff after the broker drops
+    logger.info("Connecting to: {0}".format(mqttConfig['server']))
+    mqtt_client.connect(mqttConfig['server'], mqttConfig.get('port', 1883))
+    mqtt_client.loop_start()
+    while not mqtt_client.connected and not mqtt_client.failed_connection:
+        logger.info("Waiting")
+        sleep(1)
+    if mqtt_client.failed_connection:      # If connection failed then stop the loop and main program. Use the rc code to trouble shoot
+        mqtt_client.loop_stop()
+        sys.exit()
+
+    #==== MAIN LOOP ====================#
+    interval = loop.get('interval', 0.5)
+    encode = adc.encodePayload if loop.get('encode', 'json') == 'binary' else json.dumps
+    publisher = adc.storeAndForward(mqtt_client, adc.outbox(loop['outbox'], 100000), rate=200, logger=logger) if 'outbox' in loop else mqtt_client
+    workers = cycle = None
+    try:
+        if loop.get('workers'):
+            workers = adc.busWorkers(config, logger, interval)   # each process opens and reads its own bus group
+            while workers.alive():
+                for t, frame in workers.read(interval * 2):
+                    for device, data in frame.items():
+                        publisher.publish(deviceD[device]['pubtopic'], encode(data))
+            logger.error("A bus worker stopped, exiting")
+        else:
+            adcSet = adc.buildDevices(config, logger)
+            cycle = adc.cycleExecutor(adcSet, logger) # Reads the I2C and SPI devices at the same time
+            for tick in adc.ticker(interval, logger, reportInterval=300):
+                t, frame = cycle.read()
+                for device, data in frame.items():
+                    publisher.publish(deviceD[device]['pubtopic'], encode(data))
+                for device, info in bursts.run(adcSet): # Burst captures requested over mqtt, saved to bursts/*.npy
+                    publisher.publish("{0}/{1}/burst".format(mqttConfig.get('pubLvl1', 'pi2nred'), deviceD[device]['lvl2']), json.dumps(info))
+    except KeyboardInterrupt:
+        logger.info("Pressed ctrl-C")
+    finally:
+        if workers is not None: workers.stop()
+        if cycle is not None: cycle.stop()
+        if publisher is not mqtt_client: publisher.stop()
+        mqtt_client.loop_stop()
+        logger.info("Cleaned up")
+
+if __name__ == "__main__":
+    main()
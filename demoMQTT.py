@@ -54,7 +54,7 @@ Check Hardware and MQTT setup sections for pin assignments and topics
 '''
 
 import sys, json, logging, re
-from time import sleep, perf_counter
+from time import sleep, time
 import paho.mqtt.client as mqtt
 from os import path
 from pathlib import Path
@@ -181,6 +181,10 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """on message callback will receive messages from the server/broker. Must be subscribed to the topic in on_connect"""
     mqtt_logger.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
+    pTopic = msg.topic.split('/')   # nred2pi/<lvl2>ZCMD/<command>
+    if len(pTopic) == 3 and pTopic[1].endswith('ZCMD') and pTopic[2] == 'burst':
+        lvl2 = pTopic[1][:-len('ZCMD')]
+        bursts.request(msg.payload, [device for device in deviceD if deviceD[device]['lvl2'] == lvl2]) # Runs in the main loop
 
 def on_publish(client, userdata, mid):
     """on publish will send data to broker"""
@@ -189,8 +193,7 @@ def on_publish(client, userdata, mid):
     pass 
 
 def on_disconnect(client, userdata,rc=0):
-    main_logger.error("DisConnected result code "+str(rc))
-    mqtt_client.loop_stop()
+    main_logger.error("DisConnected result code "+str(rc))   # loop_start thread keeps running and reconnects, readings go to the outbox meanwhile
 
 def mqtt_setup(IPaddress):
     global MQTT_SERVER, MQTT_CLIENT_ID, MQTT_USER, MQTT_PASSWORD, MQTT_SUB_TOPIC, MQTT_PUB_LVL1, MQTT_SUB_LVL1, MQTT_REGEX
@@ -242,7 +245,7 @@ def main():
     global deviceD, printcolor      # Containers setup in 'create' functions and used for Publishing mqtt
     global MQTT_SERVER, MQTT_USER, MQTT_PASSWORD, MQTT_CLIENT_ID, mqtt_client, MQTT_PUB_LVL1
     global _loggers, main_logger, mqtt_logger
-    global adc
+    global adc, bursts
 
     main_logger_level= logging.DEBUG # CRITICAL=logging off. DEBUG=get variables. INFO=status messages.
     main_logger_type = 'custom'       # 'basic' or 'custom' (with option for log files)
@@ -288,6 +291,21 @@ def main():
     data_keys = ['a0f'] # If topic lvl2 name repeats would likely want the data_keys to be unique
     setup_device(device, lvl2, publvl3, data_keys)
     adcSet[device] = adc.mcp3008(2, 5, 400, 1, 8, adc_logger) # numOfChannels, vref, noiseThreshold (raw ADC), maxInterval = 1sec, and ChipSelect GPIO pin (7 or 8)
+    #adcSet[device] = adc.mcp3008(2, 5, [400, 800], [1, 10], 8, adc_logger, changeSet=True) # Per channel threshold/maxInterval. getdata() returns (and main loop publishes) only channels that changed or are due
+    #adcSet[device] = adc.mcp3008(2, 5, 400, 1, 8, adc_logger, calibration=adc.calibration('calibration.json', 'mcp3008-cs8', logger=adc_logger)) # Per channel corrections, capture them with adc.guidedCalibration (see Mcalibration.py)
+    #adcSet[device] = adc.mcp3008(2, 5, 400, 1, 8, adc_logger, rate=500) # Continuous mode. Sampler thread fills a ring buffer at 500Hz, getdata() reads the buffer instead of the bus
+    influx = None   # Optional. Write readings straight to InfluxDB (same measurement/tags/fields as the node-red flow)
+    #influx = adc.influxWriter('http://localhost:8086', database='adc', logger=main_logger) # Batched, gzip line protocol writes
+    bursts = adc.burstCapture(path.join(path.dirname(path.abspath(__file__)), 'bursts'), logger=main_logger) # Raw waveform capture on nred2pi/<lvl2>ZCMD/burst {"samples": 10000}, commands are rejected without numpy
+    triggerD = {}   # Optional scope style capture per device. Publishes pre+post trigger blocks on pi2nred/<lvl2>/trigger
+    #adcSet['mcp3008'] = adc.mcp3008(2, 5, 400, 1, 8, adc_logger, backend='spidev', useNumpy=True, rate=5000, bufferSize=10000) # Sample at 5kHz into the ring buffer
+    #triggerD['mcp3008'] = adc.triggerEngine(2, [adc.trigger(0, 'rising', 40000), adc.trigger(1, 'slope', slope=-2e6)], preSamples=500, postSamples=1500, scale=adcSet['mcp3008'].rawScale, logger=adc_logger)
+    featureD = {}   # Optional spectral features per device. Publishes RMS/peak to peak/crest/dominant Hz/band energies per window on pi2nred/<lvl2>/features
+    #adcSet['mcp3008'] = adc.mcp3008(2, 5, 400, 1, 8, adc_logger, backend='spidev', useNumpy=True, rate=4000, bufferSize=8000) # Sample at 4kHz into the ring buffer
+    #featureD['mcp3008'] = adc.spectralFeatures(2, 1024, 4000, [(0, 50), (50, 200), (200, 2000)], scale=adcSet['mcp3008'].rawScale, logger=adc_logger) # ~4 messages/s
+    compressD = {}  # Optional swinging door compression per device. Payload becomes a batch {"t": [...], key: [...]} of the kept points
+    #adcSet['ads1115'] = adc.ads1115(1, 0.003, 0, 1, 0x48, adc_logger) # maxInterval=0 so every reading goes to the compressor
+    #compressD['ads1115'] = adc.compressor(0.002, 60) # Keep the points needed to redraw within +/-2mV, at least one a minute
     
     
     #==== START/BIND MQTT FUNCTIONS ====#
@@ -301,6 +319,7 @@ def main():
     mqtt_client.on_disconnect = on_disconnect    # Bind on disconnect
     mqtt_client.on_message = on_message    # Bind on message
     mqtt_client.on_publish = on_publish    # Bind on publish
+    mqtt_client.reconnect_delay_set(min_delay=1, max_delay=60) # Reconnect backoff after the broker drops
     main_logger.info("Connecting to: {0}".format(MQTT_SERVER))
     mqtt_client.connect(MQTT_SERVER, 1883) # Connect to mqtt broker. This is a blocking function. Script will stop while connecting.
     mqtt_client.loop_start()               # Start monitoring loop as asynchronous. Starts a new thread and will process incoming/outgoing messages.
@@ -314,21 +333,54 @@ def main():
 
     #==== MAIN LOOP ====================#
     # MQTT setup is successful. Initialize dictionaries and start the main loop.
-    t0_sec = perf_counter()
     msginterval = 0.5
+    publisher = adc.storeAndForward(mqtt_client, adc.outbox(path.join(path.dirname(path.abspath(__file__)), 'outbox.db'), 100000), rate=200, logger=main_logger) # Readings go to outbox.db while the broker is down and are sent after reconnecting
+    encode = json.dumps   # adc.encodePayload for compact binary payloads (decode with adc.decodePayload, see Mpayload.py)
+    batch = None    # Optional batching for high rate capture. One message per topic with columns {"t": [...], "a0f": [...]}
+    #msginterval, batch = 0.01, adc.batchPublisher(publisher, maxSamples=50, maxAge=0.5, encode=encode) # Read at 100Hz, send every 50 readings or 0.5s
+    clock = adc.ticker(msginterval, main_logger, reportInterval=300) # Fixed rate ticks, sleeps between reads. Logs overruns/jitter every 5min
+    cycle = adc.cycleExecutor(adcSet, adc_logger) # Reads the I2C and SPI devices at the same time, one frame per cycle
     try:
-        while True:
-            if (perf_counter() - t0_sec) > msginterval:
-                for device, adc in adcSet.items():
-                    deviceD[device]['data'] = adc.getdata() # Get the readings from each adc
-                    if deviceD[device]['data'] is not None:
-                        main_logger.debug("{} {}".format(deviceD[device]['pubtopic'], json.dumps(deviceD[device]['data'])))
-                        mqtt_client.publish(deviceD[device]['pubtopic'], json.dumps(deviceD[device]['data']))
-                t0_sec = perf_counter()
+        for tick in clock:
+            t, frame = cycle.read() # Get the readings from each adc (devices with no new data are left out)
+            for device, data in frame.items():
+                if influx is not None: influx.add(deviceD[device]['pubtopic'], t, data)
+                if device in compressD:
+                    data = compressD[device].update(t, data)
+                    if data is None: continue
+                deviceD[device]['data'] = data
+                if batch is not None:
+                    batch.add(deviceD[device]['pubtopic'], t, data)
+                    continue
+                main_logger.debug("{} {}".format(deviceD[device]['pubtopic'], deviceD[device]['data']))
+                publisher.publish(deviceD[device]['pubtopic'], encode(deviceD[device]['data']))
+            for device, features in featureD.items():
+                for t, data in features.poll(adcSet[device].buffer): # One feature vector per completed window
+                    if influx is not None: influx.add(MQTT_PUB_LVL1 + deviceD[device]['lvl2'] + '/features', t, data)
+                    publisher.publish(MQTT_PUB_LVL1 + deviceD[device]['lvl2'] + '/features', encode(data))
+            for device, scope in triggerD.items():
+                for info, block in scope.poll(adcSet[device].buffer): # Blocks frozen around each trigger since the last tick
+                    publisher.publish(MQTT_PUB_LVL1 + deviceD[device]['lvl2'] + '/trigger', json.dumps(dict(block, trigger=info)))
+            for device, info in bursts.run(adcSet): # Burst captures requested over mqtt, saved to bursts/*.npy
+                publisher.publish(MQTT_PUB_LVL1 + deviceD[device]['lvl2'] + '/burst', json.dumps(info))
+            if batch is not None: batch.poll()   # send batches older than maxAge
+            if influx is not None: influx.poll()
     except KeyboardInterrupt:
         main_logger.info("Pressed ctrl-C")
     finally:
         # Do any cleanup here
+        clock.report()
+        for device, cmp in compressD.items():   # the compressor holds back the newest point of every channel
+            data = cmp.flush()
+            if data is None: continue
+            if batch is not None:
+                batch.add(deviceD[device]['pubtopic'], time(), data)
+            else:
+                publisher.publish(deviceD[device]['pubtopic'], encode(data))
+        if batch is not None: batch.flush()   # send what is left before disconnecting
+        if influx is not None: influx.close()   # write what is left
+        publisher.stop()   # anything still in the outbox is sent on the next start
+        cycle.stop()   # stops the bus workers and the continuous mode sampler threads
         main_logger.info("Cleaned up")
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+''' Compact binary mqtt payloads, used instead of json. Same file on the esp32 (lib/payload.py, MicroPython)
+and the Pi (adc/Mpayload.py links to it), so every publisher and the consumer share one format.
+
+One reading {"a0f": 1.2345, "a1f": 0.5} or a batch {"t": [...], "a0f": [...], ...} (see adc/Mbatch.py)
+is packed little endian as
+ header  B version (1)  B value type  B channels  H samples  B flags (1 = timestamps, 2 = column types, 4 = batch,
+                                                                  8 = scale)
+ schema  B length + channel keys joined by ','
+ types   B value type per channel                                   (only with column types)
+ scale   d volts per count of the integer value type columns         (only with scale)
+ time    d first timestamp (epoch s) + I ms offset per sample       (only with timestamps)
+ values  one column per channel, samples values each of the value type
+Value types: 'f' float32 (volts, default), 'h' int16 (ADS1115 raw), 'H' uint16 (MCP3008/esp32 raw counts).
+Integer value types take integer values (raw counts), or volts with scale= (volts per count, ie driver.rawScale):
+encode divides by scale and rounds, decode multiplies the counts back to volts. Anything else raises ValueError.
+Keys ending in 'i' (ie buttoni) are integers, sent as 'i' int32 columns (never scaled) unless the value type is
+an integer type without scale.
+A missing value (None) is NaN for float32, -32768 for int16, 65535 for uint16 and -2147483648 for int32,
+decoded back to None. A batch (list columns) decodes to lists even with one sample, a reading to values.
+
+ payload.encode({'a0f': 1.2345678901234, 'a1f': 0.512345678})   json 44 bytes, binary 22 bytes
+ payload.encode(batch)                            50 samples x 2 channels of volts, json ~2.9kB, binary 622 bytes
+ payload.encode(batch, 'H', scale=3.3/65535)      same batch as 16 bit counts (mcp3008 resolution), binary 430 bytes
+ payload.decode(msg.payload)                      back to the dict (json payloads are decoded too)
+'''
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+VERSION = 1
+MISSING = {'h': -32768, 'H': 65535, 'i': -2147483648}
+
+def _integer(value):
+    number = int(value)
+    if isinstance(value, float) and number != value:
+        raise ValueError("{0} is not an integer count, pass scale= (volts per count) to send volts".format(value))
+    return number
+
+def encode(data, dtype='f', scale=None):
+    ''' Pack one reading (values) or a batch (columns with a 't' column). scale is volts per count for
+    integer dtypes '''
+
+    keys = [key for key in data if key != 't']
+    times = data.get('t')
+    if times is not None and not isinstance(times, list):   # one reading with a timestamp
+        times = [times]
+        columns = [[data[key]] for key in keys]
+        batch = False
+    elif times is not None:
+        columns = [data[key] for key in keys]
+        batch = True
+    else:
+        batch = any(isinstance(data[key], list) for key in keys)
+        columns = [data[key] if isinstance(data[key], list) else [data[key]] for key in keys]
+    samples = len(columns[0]) if columns else 0
+    scaled = scale is not None and dtype != 'f'
+    types = ['i' if (dtype == 'f' or scaled) and key.endswith('i') else dtype for key in keys]
+    typed = any(t != dtype for t in types)
+    flags = (1 if times is not None else 0) | (2 if typed else 0) | (4 if batch else 0) | (8 if scaled else 0)
+    schema = ','.join(keys).encode()
+    parts = [struct.pack('<BBBHB', VERSION, ord(dtype), len(keys), samples, flags),
+             struct.pack('<B', len(schema)), schema]
+    if typed:
+        parts.append(bytes([ord(t) for t in types]))
+    if scaled:
+        parts.append(struct.pack('<d', scale))
+    if times is not None:
+        t0 = times[0]
+        parts.append(struct.pack('<d', t0))
+        parts.append(struct.pack('<%dI' % samples, *[int(round((t - t0) * 1000)) for t in times]))
+    for column, t in zip(columns, types):
+        if t == 'f':
+            missing = float('nan')
+            convert = float
+        elif scaled and t == dtype:
+            missing = MISSING[t]
+            convert = lambda value: int(round(value / scale))
+        else:
+            missing = MISSING[t]
+            convert = _integer
+        parts.append(struct.pack('<%d%s' % (samples, t), *[missing if value is None else convert(value) for value in column]))
+    return b''.join(parts)
+
+def decode(payload):
+    ''' Unpack a binary payload. A reading gives {key: value} (plus 't'), a batch gives {key: [values]} and 't' '''
+
+    if payload[:1] == b'{':   # json publisher
+        import json
+        return json.loads(payload)
+    version, dtype, channels, samples, flags = struct.unpack_from('<BBBHB', payload, 0)
+    if version != VERSION:
+        raise ValueError('payload version {0} not supported'.format(version))
+    dtype = chr(dtype)
+    length = payload[6]
+    keys = payload[7:7 + length].decode().split(',') if length else []
+    offset = 7 + length
+    types = [dtype] * len(keys)
+    if flags & 2:
+        types = [chr(t) for t in payload[offset:offset + len(keys)]]
+        offset += len(keys)
+    scale = None
+    if flags & 8:
+        scale = struct.unpack_from('<d', payload, offset)[0]
+        offset += 8
+    data = {}
+    if flags & 1:
+        t0 = struct.unpack_from('<d', payload, offset)[0]
+        offset += 8
+        data['t'] = [round(t0 + dt / 1000, 3) for dt in struct.unpack_from('<%dI' % samples, payload, offset)]
+        offset += 4 * samples
+    for key, t in zip(keys, types):
+        column = struct.unpack_from('<%d%s' % (samples, t), payload, offset)
+        offset += struct.calcsize('<' + t) * samples
+        if t == 'f':
+            data[key] = [None if value != value else value for value in column]
+        else:
+            missing = MISSING[t]
+            if scale is not None and t == dtype:   # counts back to volts
+                data[key] = [None if value == missing else value * scale for value in column]
+            else:
+                data[key] = [None if value == missing else value for value in column]
+    if samples == 1 and not flags & 4:   # a single reading, not a batch of one
+        for key in data:
+            data[key] = data[key][0]
+    return data
@@ -6,6 +6,7 @@ from machine import Pin, ADC, PWM, RTC
 from lib.umqttsimple import MQTTClient
 import machine
 from adc import espADC
+import payload
 import gc
 gc.collect()
 micropython.alloc_emergency_exception_buf(100)
@@ -179,6 +180,7 @@ for pin in adcpins:
     pinsummary.append(pin)
 if switch is not None: pinsummary.append(switch)          # For adc noise, th is raw data, 1mV = 1.25 raw
 adcSet[device] = espADC(adcpins, 3.3, 35, 5000, logger = logger_adc) # Create adc object. Pass numOfChannels, vref, noiseThreshold=35, max Interval (ms)
+PAYLOAD_BINARY = False   # True sends compact binary payloads (lib/payload.py, decode on the Pi with adc.decodePayload)
 
 main_logger.info('Pins in use:{0}'.format(sorted(pinsummary)))
 #==========#
@@ -200,7 +202,7 @@ while True:
             if buttonADC_pressed or deviceD[device]['data'] is not None:         # Update if button pressed or voltage changed or time limit hit
                 deviceD[device]['send'] = True
                 if deviceD[device]['data'] is not None:
-                    main_logger.debug("Got data {} {}".format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))       
+                    main_logger.debug("Got data {} {}".format(deviceD[device]['pubtopic'], deviceD[device]['data']))
                 if switchON: deviceD[device]['data']['buttoni'] = str(buttonADC.value())
                 buttonADC_pressed = False
         get_data_time = t.stop()
@@ -209,8 +211,9 @@ while True:
         t.start()
         for device, adc in adcSet.items():
             if deviceD[device]['send']:
-                mqtt_client.publish(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data']))
-                main_logger.debug("Published msg {} {}".format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))
+                msg = payload.encode(deviceD[device]['data']) if PAYLOAD_BINARY else ujson.dumps(deviceD[device]['data']) # encode once, reused for the debug line
+                mqtt_client.publish(deviceD[device]['pubtopic'], msg)
+                main_logger.debug("Published msg {} {}".format(deviceD[device]['pubtopic'], msg))
                 deviceD[device]['send'] = False
         sendmsg_time = t.stop()
         main_logger.debug("Sending msg took: {0} ms".format(sendmsg_time/1000))